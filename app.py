@@ -1,13 +1,35 @@
 # Conversational Intelligence Platform
+import os
+import time
+
 import streamlit as st
 import pandas as pd
 
 # --- Import Custom Modules ---
-from utils.parser import parse_whatsapp_chat
-from nlp.enrich import enrich_df_with_nlp
+from utils.parser import (
+    ChatDialect, parse_whatsapp_chat, parse_whatsapp_chat_once, detect_export_dialect, is_message_boundary,
+)
+from utils.analysis_store import (
+    HashingReader, hash_upload, analysis_key, load_analysis, save_analysis, build_fingerprint,
+    find_byte_prefix_match, find_record_prefix_match, merge_analyses,
+)
+from utils.file_handler import ChatFile, iter_chat_files
+from utils.perf import measure
+from nlp.enrich import enrich_df_with_nlp, enrichment_cache
+from nlp.engine import completed_nlp_stages, missing_nlp_stages, format_error, STAGE_COLUMNS, STAGE_ERROR_NAMES
+from nlp.jobs import start_enrichment_job
+from nlp.checkpoints import list_checkpoints
+from nlp.models import MODEL_IDENTIFIERS, clear_pipeline_cache
+from nlp.inference_cache import get_inference_cache
+from nlp.cascade import cascade_stats
+from nlp.serving import serving_stats
 from ui.ui_renderer import render_dashboard  
 
 # --- App Configuration ---
+NLP_PROGRESS_POLL_SECONDS = 1  # How often the progress bar of a background NLP job updates
+# How often the dashboard is redrawn with a background job's new results; each redraw re-renders the charts
+DASHBOARD_REFRESH_SECONDS = float(os.environ.get("CIP_DASHBOARD_REFRESH_SECONDS", "5"))
+
 st.set_page_config(
     layout="wide",
     page_title="Conversational Intelligence Platform",
@@ -17,39 +39,276 @@ st.set_page_config(
 # --- State Management ---
 def initialize_state():
     """Initialize or reset session state variables for a new analysis."""
+    cancel_nlp_jobs()
     st.session_state.analysis_triggered = False
     st.session_state.df_processed = pd.DataFrame()
+    st.session_state.chat_results = {}
+    st.session_state.chat_store_keys = {}
+    st.session_state.nlp_jobs = {}  # Chat name -> running EnrichmentJob
+    st.session_state.nlp_cancelled = set()  # Chats whose NLP was cancelled or failed; not restarted automatically
+    st.session_state.nlp_errors = {}  # Chat name -> {stage: error} of its last failed NLP stages
+    st.session_state.nlp_refreshed_version = None
+    st.session_state.nlp_refreshed_at = 0.0
     st.session_state.current_file_name = None
 
 # --- Core Processing Logic ---
+def parse_new_messages(uploaded_file):
+    """
+    Parses the upload, reusing a stored analysis it extends (e.g. last week's export
+    of the same chat). Returns (stored_df, new_df, dialect): `stored_df` is the
+    already-enriched prefix or None, and `new_df` holds the messages still to enrich.
+    """
+    # Cheapest case: the old export's bytes are a prefix of this one, so only the tail is parsed
+    match = find_byte_prefix_match(uploaded_file, MODEL_IDENTIFIERS)
+    if match is not None:
+        key, fingerprint = match
+        dialect = ChatDialect(*fingerprint["dialect"]) if fingerprint["dialect"] else None
+        if is_message_boundary(uploaded_file, fingerprint["raw_size"], dialect):
+            stored_df = load_analysis(key)
+            if stored_df is not None:
+                uploaded_file.seek(fingerprint["raw_size"])
+                return stored_df, parse_whatsapp_chat(uploaded_file, dialect=dialect), dialect
+
+    uploaded_file.seek(0)
+    dialect = detect_export_dialect(uploaded_file)
+    parsed_df = parse_whatsapp_chat(uploaded_file)
+    return (*match_stored_records(parsed_df), dialect)
+
+
+def match_stored_records(parsed_df):
+    """
+    Same messages re-exported with different bytes: matches a stored analysis on
+    the parsed records instead. Returns (stored_df, new_df) like parse_new_messages.
+    """
+    match = find_record_prefix_match(parsed_df, MODEL_IDENTIFIERS)
+    if match is not None:
+        key, fingerprint = match
+        stored_df = load_analysis(key)
+        if stored_df is not None:
+            return stored_df, parsed_df.iloc[fingerprint["n_messages"]:].reset_index(drop=True)
+    return None, parsed_df
+
+
+def analyse_chat(chat_file: ChatFile):
+    """
+    Parses one chat export, reusing the analysis store. NLP enrichment is left to
+    the dashboard views that need it (see ensure_nlp_stages). Returns
+    (DataFrame, store key), or (None, None) if the chat could not be parsed.
+    """
+    if chat_file.streamed:
+        # Read once: the digest is only known after parsing, and the stored analysis is looked up then
+        reader = HashingReader(chat_file.file)
+        with st.spinner(f"Parsing {chat_file.name}..."), measure("parse", "parse") as parse_measurement:
+            parsed_df, dialect = parse_whatsapp_chat_once(reader)
+            parse_measurement.items = len(parsed_df)
+        upload_digest = reader.hexdigest()
+    else:
+        upload_digest = hash_upload(chat_file.file)
+
+    # Step 0: Reuse a stored analysis of the exact same chat, if there is one
+    store_key = analysis_key(upload_digest, MODEL_IDENTIFIERS)
+    stored_df = load_analysis(store_key)
+    if stored_df is not None:
+        st.success(f"Loaded a previous analysis of {chat_file.name}.")
+        return stored_df, store_key
+
+    # Step 1: Parse chat file (streamed from the upload buffer, no full decode)
+    if chat_file.streamed:
+        stored_df, parsed_df = match_stored_records(parsed_df)
+    else:
+        with st.spinner(f"Parsing {chat_file.name}..."), measure("parse", "parse") as parse_measurement:
+            stored_df, parsed_df, dialect = parse_new_messages(chat_file.file)
+            parse_measurement.items = len(parsed_df)
+
+    if stored_df is None and parsed_df.empty:
+        st.error(f"Failed to parse {chat_file.name}. Please ensure it is a valid WhatsApp export.")
+        return None, None
+
+    df = parsed_df
+    if stored_df is not None:
+        st.info(f"Found a previous analysis of this chat. Only {len(parsed_df)} new messages need analysing.")
+        # The new messages get the NLP results the stored ones already have, so the merge stays uniform
+        stored_stages = completed_nlp_stages(stored_df)
+        failed_stages = ()
+        if stored_stages and not parsed_df.empty:
+            with st.spinner("Analyzing the new messages with NLP models..."):
+                # The tail is fixed by the upload's bytes and its length, so those key the cache
+                parsed_df = enrich_df_with_nlp(parsed_df, stored_stages, cache_key=(store_key, len(parsed_df)))
+            show_nlp_stats()
+            failed_stages = missing_nlp_stages(parsed_df, stored_stages)
+        # A stage that failed on the new messages is rerun for the whole chat when a view needs it
+        stored_df = stored_df.drop(columns=[column for stage in failed_stages for column in STAGE_COLUMNS[stage]])
+        df = merge_analyses(stored_df, parsed_df)
+        if failed_stages:
+            return df, store_key  # Not stored: the next upload retries the new messages
+
+    if df.empty:
+        st.warning(f"No processable text messages were found in {chat_file.name}.")
+    else:
+        fingerprint = build_fingerprint(df, upload_digest, chat_file.size, dialect, MODEL_IDENTIFIERS)
+        save_analysis(store_key, df, fingerprint)
+    return df, store_key
+
+
+def show_nlp_stats():
+    """Captions on how much model work the inference cache, the cascade prefilter and the model server saved."""
+    inference_cache = get_inference_cache()
+    if inference_cache is not None:
+        cache_stats = inference_cache.stats()
+        st.caption(
+            f"Inference cache: {cache_stats['hit_rate']:.0%} of model calls answered from cache "
+            f"({cache_stats['hits']:,} hits, {cache_stats['misses']:,} misses, {cache_stats['rows']:,} stored results)."
+        )
+    routing = cascade_stats()
+    if routing:
+        st.caption("Cascade prefilter: routed to the models " + ", ".join(
+            f"{stage} {stats['routed_fraction']:.0%} of {stats['messages']:,}" for stage, stats in routing.items()
+        ) + " distinct messages.")
+    servers = serving_stats()
+    if servers:
+        st.caption("Model server: " + ", ".join(
+            f"{model_name.split('/')[-1]} {stats['mean_batch_texts']:.0f} texts per batch "
+            f"({stats['requests']:,} requests)"
+            for model_name, stats in servers.items()
+        ) + ".")
+
+
+# --- Background NLP ---
+def ensure_nlp_stages(stages):
+    """
+    Starts a background NLP job the first time a dashboard view needs `stages`
+    the displayed chat doesn't have yet, and returns the chat with the results
+    published so far. The job goes on to the other missing stages after the
+    requested ones, so the remaining views fill in without another start.
+    """
+    chat_name = st.session_state.current_file_name
+    job = st.session_state.nlp_jobs.get(chat_name)
+    if job is not None:
+        return job.snapshot()
+
+    df = st.session_state.df_processed
+    missing = missing_nlp_stages(df, stages)
+    if not missing or chat_name in st.session_state.nlp_cancelled:
+        return df
+    job_stages = missing + tuple(stage for stage in missing_nlp_stages(df) if stage not in missing)
+    with st.spinner("Loading the NLP models..."):
+        job = start_enrichment_job(df, job_stages)
+    stage_errors = st.session_state.nlp_errors[chat_name] = {}
+    for stage in job_stages:
+        if job is None or stage not in job.stages:
+            st.error(f"The {stage} model failed to load. Skipping this analysis.")
+            stage_errors[stage] = "the model failed to load"
+    if job is None:
+        return df
+    st.session_state.nlp_jobs[chat_name] = job
+    return job.snapshot()
+
+
+def collect_nlp_jobs():
+    """
+    Takes the results of stopped background jobs into the session and the
+    analysis store, so each stage runs at most once per chat.
+    """
+    for chat_name, job in list(st.session_state.nlp_jobs.items()):
+        if job.is_running():
+            continue
+        del st.session_state.nlp_jobs[chat_name]
+        for stage, error in job.status()["errors"].items():
+            # Kept for the views, which show it in place of the sections that need the stage
+            st.session_state.nlp_errors.setdefault(chat_name, {})[stage] = error
+            st.error(f"Error during batch {STAGE_ERROR_NAMES[stage]}: {error}")
+            st.text_area(f"{STAGE_ERROR_NAMES[stage]} Error Traceback", format_error(error), height=200)
+        failed = bool(job.status()["errors"])
+        if job.state == "cancelled" or failed:
+            # Not restarted on the next rerun; the user resumes it, retrying the failed stages
+            st.session_state.nlp_cancelled.add(chat_name)
+
+        done_before = completed_nlp_stages(st.session_state.chat_results[chat_name])
+        df = job.result()
+        st.session_state.chat_results[chat_name] = df
+        if chat_name == st.session_state.current_file_name:
+            st.session_state.df_processed = df
+        # Only persist stages that actually ran, not ones that were cancelled or failed (result() leaves them out)
+        store_key = st.session_state.chat_store_keys[chat_name]
+        stored = completed_nlp_stages(df) == done_before or save_analysis(store_key, df)
+        # A cancelled or failed job keeps its checkpoint to resume from; a finished one's results are in the store now
+        if stored and job.state == "finished" and not failed:
+            job.discard_checkpoint()
+
+
+def cancel_nlp_jobs():
+    for job in st.session_state.get("nlp_jobs", {}).values():
+        job.cancel()
+
+
+def format_duration(seconds: float) -> str:
+    return f"{seconds / 60:.0f} min" if seconds >= 90 else f"{seconds:.0f} s"
+
+
+@st.fragment(run_every=NLP_PROGRESS_POLL_SECONDS)
+def render_nlp_progress():
+    """
+    Progress bar and cancel button of the displayed chat's background NLP job.
+    Polls the job and reruns the whole app when new results are published, at
+    most every DASHBOARD_REFRESH_SECONDS, and once more when the job stops.
+    """
+    chat_name = st.session_state.current_file_name
+    job = st.session_state.nlp_jobs.get(chat_name)
+    if job is None:
+        if chat_name in st.session_state.nlp_cancelled and missing_nlp_stages(st.session_state.df_processed):
+            st.info("NLP analysis was cancelled or a model failed. Views that need it show no results.")
+            if st.button("Resume NLP analysis"):
+                st.session_state.nlp_cancelled.discard(chat_name)
+                st.rerun()
+        return
+
+    status = job.status()
+    text = f"Analyzing messages ({status['stage'] or 'starting'}): {status['done']:,} of {status['total']:,} done"
+    if status["eta_seconds"] is not None:
+        text += f", about {format_duration(status['eta_seconds'])} left"
+    if status["resumed"]:
+        text += f" ({status['resumed']:,} restored from an interrupted run)"
+    st.progress(status["fraction"], text=text)
+    show_nlp_stats()
+    if job.is_running() and st.button("Cancel NLP analysis"):
+        job.cancel()
+        st.caption("Cancelling after the current batch...")
+
+    now = time.monotonic()
+    new_results = job.version != st.session_state.nlp_refreshed_version
+    if not job.is_running() or (new_results and now - st.session_state.nlp_refreshed_at >= DASHBOARD_REFRESH_SECONDS):
+        st.session_state.nlp_refreshed_version = job.version
+        st.session_state.nlp_refreshed_at = now
+        st.rerun()
+
+
 def run_analysis(uploaded_file):
     """
-    Orchestrates the backend workflow: parsing, NLP enrichment,
-    and storing the final result in the session state.
+    Orchestrates the backend workflow: parsing, and storing the parsed chats
+    in the session state; NLP enrichment runs as the dashboard views need it. A .zip upload may
+    contain several chats; each one gets its own analysis.
     """
+    cancel_nlp_jobs()
     st.session_state.analysis_triggered = True
-    st.session_state.current_file_name = uploaded_file.name
+    st.session_state.chat_results = {}
+    st.session_state.chat_store_keys = {}
+    st.session_state.nlp_jobs = {}
+    st.session_state.nlp_cancelled = set()
+    st.session_state.nlp_errors = {}
 
     try:
-        # Step 1: Parse chat file
-        chat_content = uploaded_file.getvalue().decode("utf-8")
-        with st.spinner("Parsing chat file..."):
-            parsed_df = parse_whatsapp_chat(chat_content)
+        for chat_file in iter_chat_files(uploaded_file, on_error=st.error):
+            df, store_key = analyse_chat(chat_file)
+            if df is not None and not df.empty:
+                st.session_state.chat_results[chat_file.name] = df
+                st.session_state.chat_store_keys[chat_file.name] = store_key
 
-        if parsed_df.empty:
-            st.error("Failed to parse the chat file. Please ensure it is a valid WhatsApp export.")
+        if not st.session_state.chat_results:
             st.session_state.analysis_triggered = False
             return
 
-        # --- THIS IS THE CRITICAL CHANGE ---
-        with st.spinner("Analyzing messages with NLP models... This may take several minutes."):
-            st.session_state.df_processed = enrich_df_with_nlp(parsed_df)
-        # --- END OF CHANGE ---
-
-        if st.session_state.df_processed.empty:
-            st.warning("Analysis complete, but no processable text messages were found.")
-        else:
-            st.success("Analysis complete! The dashboard is ready.")
+        select_chat(next(iter(st.session_state.chat_results)))
+        st.success("Chat parsed! The dashboard is ready; NLP results are computed as you open each view.")
 
     except Exception as e:
         import traceback
@@ -58,6 +317,12 @@ def run_analysis(uploaded_file):
         st.session_state.analysis_triggered = False
 
 
+def select_chat(chat_name):
+    """Shows the analysis of one of the uploaded chats on the dashboard."""
+    st.session_state.current_file_name = chat_name
+    st.session_state.df_processed = st.session_state.chat_results[chat_name]
+
+
 # --- Main Application UI ---
 st.title("💡 Conversational Intelligence Platform")
 
@@ -68,28 +333,43 @@ if 'analysis_triggered' not in st.session_state:
 # --- Sidebar ---
 st.sidebar.header("Upload & Analyze")
 uploaded_file = st.sidebar.file_uploader(
-    "Upload your WhatsApp chat export (.txt file)",
-    type="txt",
+    "Upload your WhatsApp chat export (.txt or .zip file)",
+    type=["txt", "zip"],
     on_change=initialize_state
 )
 
 if uploaded_file:
     if st.sidebar.button("Analyze Chat", type="primary", use_container_width=True):
         run_analysis(uploaded_file)
+
+    # An archive with several chats: pick which one the dashboard shows
+    if len(st.session_state.chat_results) > 1:
+        chat_names = list(st.session_state.chat_results)
+        selected_chat = st.sidebar.selectbox(
+            "Chat to display", chat_names, index=chat_names.index(st.session_state.current_file_name)
+        )
+        if selected_chat != st.session_state.current_file_name:
+            select_chat(selected_chat)
 else:
     st.info(
         """
         **Welcome! Unlock insights from your conversations.**
 
-        1.  **Export a chat** from WhatsApp as a `.txt` file.
+        1.  **Export a chat** from WhatsApp as a `.txt` file (or a `.zip`, with or without media).
         2.  **Upload it** using the sidebar.
         3.  **Click 'Analyze Chat'** to generate your dashboard.
         """
     )
+    unfinished = [status for _, status in list_checkpoints() if status and status["state"] != "finished"]
+    if unfinished:
+        st.caption(f"{len(unfinished)} unfinished NLP analyses are checkpointed; upload the same chat again to "
+                   f"pick one up where it stopped.")
 
 # --- Dashboard Rendering ---
 if st.session_state.analysis_triggered and not st.session_state.df_processed.empty:
-    render_dashboard(st.session_state.df_processed)
+    collect_nlp_jobs()
+    render_nlp_progress()
+    render_dashboard(st.session_state.df_processed, ensure_stages=ensure_nlp_stages)
 elif st.session_state.analysis_triggered:
     st.warning("Analysis was triggered, but there is no data to display. Please check your file or upload a new one.")
 
@@ -100,4 +380,6 @@ st.sidebar.info("A project demonstrating end-to-end NLP application development.
 if st.sidebar.button("Clear All Caches & Reload"):
     st.cache_data.clear()
     st.cache_resource.clear()
+    enrichment_cache.clear()
+    clear_pipeline_cache()
     st.rerun()
@@ -0,0 +1,107 @@
+import copy
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+
+import numpy as np
+
+from utils.perf import record_batch
+
+# Length-bucketed batching for the transformer pipelines. Texts are sorted by
+# token count and packed into batches under a padded-token budget, so a 3-word
+# reply is never padded to the length of a 500-word message.
+
+NLP_MAX_BATCH_TOKENS = int(os.environ.get("CIP_NLP_MAX_BATCH_TOKENS", "4096"))  # Padded tokens per batch
+NLP_MAX_BATCH_SIZE = int(os.environ.get("CIP_NLP_MAX_BATCH_SIZE", "64"))  # Texts per batch, however short
+MAX_SEQUENCE_TOKENS = 512  # The pipelines truncate (or fail) beyond this
+CHARS_PER_TOKEN = 4  # Length estimate for pipelines without a tokenizer
+
+
+# Idle copies of each shared fast tokenizer: id(tokenizer) -> (weak reference, [copies])
+_tokenizer_copies = {}
+_tokenizer_copies_lock = threading.Lock()
+
+
+@contextmanager
+def private_tokenizer(tokenizer):
+    """
+    A copy of `tokenizer` that no other thread uses while the block runs. A fast
+    tokenizer keeps its truncation and padding settings in Rust state, which a
+    call with different settings rewrites; two threads doing that at once fail
+    with "Already borrowed". Pipelines are shared by every session and job, and
+    call their own tokenizer, so our length measurements run on copies. Copies
+    are pooled, so there are only ever as many as concurrent callers.
+    """
+    if tokenizer is None or not getattr(tokenizer, "is_fast", False):
+        yield tokenizer
+        return
+    key = id(tokenizer)
+    with _tokenizer_copies_lock:
+        entry = _tokenizer_copies.get(key)
+        if entry is None or entry[0]() is not tokenizer:
+            # Forget the copies once the pipeline's tokenizer is garbage collected
+            entry = _tokenizer_copies[key] = (weakref.ref(tokenizer, lambda _: _tokenizer_copies.pop(key, None)), [])
+        idle = entry[1]
+        copied = idle.pop() if idle else None
+    if copied is None:
+        copied = copy.deepcopy(tokenizer)
+    try:
+        yield copied
+    finally:
+        with _tokenizer_copies_lock:
+            idle.append(copied)
+
+
+def token_lengths(pipe, texts: list) -> np.ndarray:
+    """Tokenized length of each text (special tokens included), capped at the model's maximum."""
+    tokenizer = getattr(pipe, "tokenizer", None)
+    if tokenizer is None:
+        return np.minimum(np.fromiter((len(text) // CHARS_PER_TOKEN + 2 for text in texts), dtype=np.int64,
+                                      count=len(texts)), MAX_SEQUENCE_TOKENS)
+    max_length = min(getattr(tokenizer, "model_max_length", MAX_SEQUENCE_TOKENS), MAX_SEQUENCE_TOKENS)
+    with private_tokenizer(tokenizer) as tokenizer:
+        encoded = tokenizer(texts, truncation=True, max_length=max_length)
+    return np.fromiter((len(ids) for ids in encoded["input_ids"]), dtype=np.int64, count=len(texts))
+
+
+def plan_token_batches(lengths: np.ndarray, max_tokens: int = NLP_MAX_BATCH_TOKENS,
+                       max_batch_size: int = NLP_MAX_BATCH_SIZE) -> list:
+    """
+    Groups text indices into batches whose padded size (longest text x batch
+    size) stays within `max_tokens`. Indices are visited shortest first, so each
+    batch holds texts of similar length. A text longer than the budget gets a
+    batch of its own.
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches = []
+    start = 0
+    for end in range(1, len(order) + 1):
+        if end == len(order):
+            batches.append(order[start:end])
+            break
+        # Sorted ascending, so the next text sets the padded length of the batch
+        padded_tokens = int(lengths[order[end]]) * (end - start + 1)
+        if padded_tokens > max_tokens or end - start >= max_batch_size:
+            batches.append(order[start:end])
+            start = end
+    return batches if len(order) else []
+
+
+def run_token_batches(pipe, texts: list, max_tokens: int = NLP_MAX_BATCH_TOKENS,
+                      max_batch_size: int = NLP_MAX_BATCH_SIZE, **pipe_kwargs) -> list:
+    """
+    Runs `pipe` over `texts` in token-budgeted batches and returns the results in
+    the original order. `pipe_kwargs` are passed on to every pipeline call.
+    """
+    if not texts:
+        return []
+    results = [None] * len(texts)
+    lengths = token_lengths(pipe, texts)
+    for batch_indices in plan_token_batches(lengths, max_tokens, max_batch_size):
+        batch = [texts[i] for i in batch_indices]
+        record_batch(len(batch), int(lengths[batch_indices].sum()))
+        # batch_size makes the pipeline pad and run the batch together rather than one text at a time
+        for i, result in zip(batch_indices, pipe(batch, batch_size=len(batch), **pipe_kwargs)):
+            results[i] = result
+    return results
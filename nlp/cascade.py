@@ -0,0 +1,168 @@
+import os
+import threading
+
+import pandas as pd
+
+# A cheap first pass in front of the transformer models. Most chat messages are
+# trivially neutral, non-toxic and entity-free: emoji-only lines, "ok", links,
+# numbers, all-lowercase small talk. Vectorised lexicon and character-class
+# checks resolve those confidently, and only the rest is routed to the models.
+
+# "off" sends every message to the models; "on" resolves the confident cases first
+NLP_CASCADE = os.environ.get("CIP_NLP_CASCADE", "off")
+CASCADE_MAX_WORDS = 4  # Lexicon rules only judge messages this short; longer ones have too much context
+
+URL_PATTERN = r"(?:https?://|www\.)\S+"
+WORD_PATTERN = r"[^\W\d_]+"  # Runs of letters, in any script
+# Letters outside the cased scripts (Latin, Greek, Cyrillic): capitalisation says nothing about names there
+UNCASED_LETTER_PATTERN = r"[^\W\d_a-zA-ZÀ-ɏͰ-ϿЀ-ԯ]"
+
+NEUTRAL_WORDS = frozenset("""
+    ok okay okk k kk yes yeah yep yup no nope sure hmm hm mm noted done fine alright right hi hello hey yo
+    morning gm gn night ack np otw brb sent received seen understood
+""".split())
+POSITIVE_WORDS = frozenset("""
+    thanks thank thx ty great awesome amazing nice cool good love loved lovely perfect excellent congrats
+    congratulations welcome happy wonderful fantastic brilliant yay wow beautiful best glad haha hahaha lol lmao
+""".split())
+NEGATIVE_WORDS = frozenset("""
+    sad bad terrible awful horrible worst hate hated sucks ugh sorry disappointed annoying angry useless
+""".split())
+FILLER_WORDS = frozenset("""
+    a an the so very much you all guys everyone u ur lot too really and for it this that is was
+""".split())
+NEGATION_WORDS = frozenset("not no never dont don't isnt isn't wasnt wasn't cant can't nothing".split())
+BENIGN_WORDS = NEUTRAL_WORDS | POSITIVE_WORDS | FILLER_WORDS
+
+POSITIVE_EMOJI = "😂🤣😀😃😄😁😊😍🥰😘❤💕💖👍👏🎉🙏🔥💯🥳🙌✨"
+NEGATIVE_EMOJI = "😡😠🤬😢😭😞😔😩👎💔🤮😤"
+
+# Results in the models' own output format, so they map back like any model result
+NEUTRAL_SENTIMENT = {"label": "neutral", "score": 1.0}
+POSITIVE_SENTIMENT = {"label": "positive", "score": 1.0}
+NEGATIVE_SENTIMENT = {"label": "negative", "score": 1.0}
+NON_TOXIC = {"label": "non-toxic", "score": 1.0}
+
+
+def message_features(texts: list) -> pd.DataFrame:
+    """One row of cheap, vectorised features per text."""
+    series = pd.Series(texts, dtype=object).fillna("").astype(str)
+    without_urls = series.str.replace(URL_PATTERN, " ", regex=True)
+    words = without_urls.str.lower().str.findall(WORD_PATTERN)
+
+    # Word-level lexicon lookups, on one exploded Series instead of a Python loop per message
+    exploded = words.explode().dropna()
+
+    def word_count(vocabulary) -> pd.Series:
+        return exploded.isin(vocabulary).groupby(level=0).sum().reindex(series.index, fill_value=0)
+
+    n_words = exploded.groupby(level=0).size().reindex(series.index, fill_value=0)
+    return pd.DataFrame({
+        "n_words": n_words,
+        "n_benign": word_count(BENIGN_WORDS),
+        "n_neutral_or_filler": word_count(NEUTRAL_WORDS | FILLER_WORDS),
+        "n_positive": word_count(POSITIVE_WORDS),
+        "n_negative": word_count(NEGATIVE_WORDS),
+        "n_negation": word_count(NEGATION_WORDS),
+        "positive_emoji": series.str.contains(f"[{POSITIVE_EMOJI}]", regex=True),
+        "negative_emoji": series.str.contains(f"[{NEGATIVE_EMOJI}]", regex=True),
+        "has_uppercase": without_urls != without_urls.str.lower(),
+        "has_uncased_letters": without_urls.str.contains(UNCASED_LETTER_PATTERN, regex=True),
+    }, index=series.index)
+
+
+def resolve_sentiment(features: pd.DataFrame) -> list:
+    """Sentiment for the confident cases, None for the messages the model has to judge."""
+    short = features["n_words"] <= CASCADE_MAX_WORDS
+    no_negation = features["n_negation"] == 0
+    only_known = features["n_benign"] + features["n_negative"] == features["n_words"]
+    emoji_positive = features["positive_emoji"] & ~features["negative_emoji"]
+    emoji_negative = features["negative_emoji"] & ~features["positive_emoji"]
+    no_emoji = ~features["positive_emoji"] & ~features["negative_emoji"]
+
+    neutral = no_emoji & (features["n_neutral_or_filler"] == features["n_words"]) & short
+    positive = (short & only_known & no_negation & (features["n_positive"] > 0) & (features["n_negative"] == 0)
+                & ~features["negative_emoji"]) | ((features["n_words"] == 0) & emoji_positive)
+    negative = (short & only_known & no_negation & (features["n_negative"] > 0) & (features["n_positive"] == 0)
+                & ~features["positive_emoji"]) | ((features["n_words"] == 0) & emoji_negative)
+
+    resolved = [None] * len(features)
+    for mask, result in ((neutral, NEUTRAL_SENTIMENT), (positive, POSITIVE_SENTIMENT),
+                         (negative, NEGATIVE_SENTIMENT)):
+        for i in mask.to_numpy().nonzero()[0]:
+            resolved[i] = result
+    return resolved
+
+
+def resolve_toxicity(features: pd.DataFrame) -> list:
+    """
+    Non-toxic for short messages made only of harmless words, without a
+    negative emoji; None for the rest, including word-less messages (a string of
+    insulting emoji or symbols is the model's to judge).
+    """
+    benign = ((features["n_words"] > 0) & (features["n_words"] <= CASCADE_MAX_WORDS)
+              & (features["n_benign"] == features["n_words"]) & ~features["negative_emoji"])
+    return [NON_TOXIC if is_benign else None for is_benign in benign.to_numpy()]
+
+
+def resolve_entities(features: pd.DataFrame) -> list:
+    """
+    No entities for messages without a capitalised token in a cased script, or
+    with only harmless words; None (route to the model) for the rest.
+    """
+    no_names = (features["n_words"] == 0) | (features["n_benign"] == features["n_words"]) | (
+        ~features["has_uppercase"] & ~features["has_uncased_letters"]
+    )
+    return [[] if has_no_names else None for has_no_names in no_names.to_numpy()]
+
+
+CASCADE_RESOLVERS = {
+    "sentiment": resolve_sentiment,
+    "ner": resolve_entities,
+    "toxicity": resolve_toxicity,
+}
+
+# --- Routing statistics ---
+_stats_lock = threading.Lock()
+_stats = {}  # Stage -> [distinct messages seen, messages resolved by the cascade]
+
+
+def record_cascade(stage: str, n_messages: int, n_resolved: int) -> None:
+    with _stats_lock:
+        counts = _stats.setdefault(stage, [0, 0])
+        counts[0] += n_messages
+        counts[1] += n_resolved
+
+
+def cascade_stats() -> dict:
+    """Per stage: messages seen, how many the cascade resolved, and the fraction routed to the model."""
+    with _stats_lock:
+        return {
+            stage: {
+                "messages": seen,
+                "resolved": resolved,
+                "routed_fraction": (seen - resolved) / seen if seen else 1.0,
+            }
+            for stage, (seen, resolved) in _stats.items()
+        }
+
+
+def reset_cascade_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def cascade_prefilter(stage: str, enabled: bool = None):
+    """
+    The prefilter of `stage` for run_stage, or None when the cascade is off.
+    It maps texts to a result per text, None where the model has to decide,
+    and counts what it resolved.
+    """
+    if not (NLP_CASCADE == "on" if enabled is None else enabled) or stage not in CASCADE_RESOLVERS:
+        return None
+
+    def prefilter(texts: list) -> list:
+        resolved = CASCADE_RESOLVERS[stage](message_features(texts)) if texts else []
+        record_cascade(stage, len(texts), sum(result is not None for result in resolved))
+        return resolved
+    return prefilter
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from .inference_cache import to_json_value
+
+# On-disk checkpoints of background enrichment jobs (nlp/jobs.py). Every batch a
+# job finishes is written here, so a job cut short by a browser refresh, a pod
+# restart or a crash picks up where it stopped the next time the same chat is
+# analysed, instead of re-running hours of model work. Checkpoints are keyed by
+# the content of the chat and the models, not by session.
+
+NLP_CHECKPOINT_DIR = os.environ.get(
+    "CIP_NLP_CHECKPOINT_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "conversational-intelligence", "checkpoints"),
+)  # Set to an empty string to disable checkpointing
+NLP_CHECKPOINT_MAX_AGE_HOURS = float(os.environ.get("CIP_NLP_CHECKPOINT_MAX_AGE_HOURS", "168"))  # Abandoned jobs
+
+# Bump when the checkpoint layout or the meaning of a batch changes
+CHECKPOINT_FORMAT_VERSION = "1"
+STATUS_FILE = "status.json"
+
+
+def checkpoint_key(df: pd.DataFrame, output_columns, model_identifiers, batch_size: int) -> str:
+    """Key of a job over `df`: its input columns, the models and the batch layout."""
+    input_columns = [column for column in df.columns if column not in output_columns]
+    row_hashes = pd.util.hash_pandas_object(df[input_columns], index=False).to_numpy()
+    digest = hashlib.sha256("\0".join([CHECKPOINT_FORMAT_VERSION, str(batch_size), *input_columns,
+                                       *model_identifiers]).encode("utf-8"))
+    digest.update(row_hashes.tobytes())
+    return digest.hexdigest()
+
+
+def write_json_atomic(path: str, value) -> None:
+    # A temp file first, so a crash mid-write never leaves a truncated batch behind
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump(value, tmp_file, default=to_json_value)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class JobCheckpoint:
+    """
+    The checkpoint directory of one job: a JSON file per finished batch
+    ("<part>.<start>.json", part being a stage or "summaries") and status.json
+    with the job's last reported progress. Each batch records the revision of
+    the model that produced it and is ignored if the model has changed since.
+    Writing never raises; a job whose checkpoint can't be written just runs on.
+    """
+
+    def __init__(self, key: str, checkpoint_dir: str = NLP_CHECKPOINT_DIR):
+        self.key = key
+        self.path = os.path.join(checkpoint_dir, key)
+
+    def batch_path(self, part: str, start: int) -> str:
+        return os.path.join(self.path, f"{part}.{start}.json")
+
+    def load_batches(self, part: str, revision: str) -> dict:
+        """{start: results} of the batches of `part` made with model `revision`."""
+        batches = {}
+        try:
+            file_names = os.listdir(self.path)
+        except FileNotFoundError:
+            return batches
+        for file_name in file_names:
+            if not file_name.endswith(".json"):
+                continue
+            name, _, start = file_name[:-len(".json")].rpartition(".")
+            if name != part or not start.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.path, file_name), encoding="utf-8") as batch_file:
+                    batch = json.load(batch_file)
+            except (OSError, ValueError):
+                continue  # Unreadable batches are simply recomputed
+            if batch.get("revision") == revision:
+                batches[int(start)] = batch["results"]
+        return batches
+
+    def save_batch(self, part: str, start: int, revision: str, results: list) -> None:
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            write_json_atomic(self.batch_path(part, start), {"revision": revision, "results": results})
+        except Exception as e:
+            print(f"Could not checkpoint {part} batch {start} of job '{self.key}'. Error: {e}")
+
+    def save_status(self, status: dict) -> None:
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            write_json_atomic(os.path.join(self.path, STATUS_FILE), {**status, "updated_at": time.time()})
+        except Exception as e:
+            print(f"Could not write the status of job '{self.key}'. Error: {e}")
+
+    def load_status(self):
+        """The status.json the job last wrote, or None."""
+        try:
+            with open(os.path.join(self.path, STATUS_FILE), encoding="utf-8") as status_file:
+                return json.load(status_file)
+        except (OSError, ValueError):
+            return None
+
+    def discard(self) -> None:
+        """Deletes the checkpoint, once its results are safely in the analysis store."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def list_checkpoints(checkpoint_dir: str = NLP_CHECKPOINT_DIR):
+    """Yields (key, status) of every checkpointed job, status being None if it has none yet."""
+    try:
+        keys = sorted(entry.name for entry in os.scandir(checkpoint_dir) if entry.is_dir())
+    except FileNotFoundError:
+        return
+    for key in keys:
+        yield key, JobCheckpoint(key, checkpoint_dir).load_status()
+
+
+def evict_checkpoints(max_age_hours: float = NLP_CHECKPOINT_MAX_AGE_HOURS,
+                      checkpoint_dir: str = NLP_CHECKPOINT_DIR) -> int:
+    """Deletes the checkpoints of jobs nobody came back for within `max_age_hours`. Returns how many."""
+    cutoff = time.time() - max_age_hours * 3600
+    evicted = 0
+    try:
+        entries = [entry for entry in os.scandir(checkpoint_dir) if entry.is_dir()]
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path)
+                evicted += 1
+        except OSError:
+            continue  # Evicted by another session meanwhile
+    return evicted
@@ -0,0 +1,470 @@
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import pandas as pd
+
+from utils.perf import measure
+from .models import (
+    get_sentiment_pipeline, get_ner_pipeline, get_summarization_pipeline, get_toxicity_pipeline,
+    SENTIMENT_MODEL_NAME, NER_MODEL_NAME, TOXICITY_MODEL_NAME, MODEL_LOADERS,
+)
+from .batching import private_tokenizer, run_token_batches
+from .sharded import NLP_INFERENCE_WORKERS, SHARDED_MIN_TEXTS, run_sharded_inference
+from .serving import NLP_SERVING, get_model_server
+from .inference_cache import get_inference_cache, model_revision, normalise_text
+from .long_text import AGGREGATORS, LONG_TEXT_STRATEGY, split_into_windows
+from .cascade import cascade_prefilter
+
+# The NLP enrichment engine, free of Streamlit so it can also run headless (see
+# scripts/batch_enrich.py). nlp/enrich.py wraps it for the app with caching,
+# spinners and error messages.
+
+# --- Configuration for NLP Tasks ---
+MAX_TOKENS_FOR_NLP = 512  # Tokens; longer messages don't fit the classifiers and are summarized for NLP
+# A tokenizer never emits more tokens than a text has UTF-8 bytes, plus a few
+# special tokens, so texts below this many bytes can't be long and aren't tokenized
+TOKEN_BOUND_SLACK = 4
+SUMMARIZATION_MIN_LENGTH = 30
+SUMMARIZATION_MAX_LENGTH = 120 # Desired length of summary
+
+# "sequential" runs one stage after another; "concurrent" runs summarisation,
+# sentiment, NER and toxicity side by side, splitting NLP_TORCH_THREADS between them
+NLP_STAGE_EXECUTION = os.environ.get("CIP_NLP_STAGE_EXECUTION", "sequential")
+NLP_TORCH_THREADS = int(os.environ.get("CIP_NLP_TORCH_THREADS", str(os.cpu_count() or 1)))
+
+def find_long_texts(texts: list, tokenizer, max_tokens: int = MAX_TOKENS_FOR_NLP) -> list:
+    """
+    Indices of the texts longer than `max_tokens` tokens. One vectorised pass over
+    the UTF-8 byte lengths rules out nearly every chat message; only the few
+    remaining candidates are tokenized, in a single batch call.
+    """
+    if not texts:
+        return []
+    byte_lengths = pd.Series(texts, dtype=object).str.encode("utf-8").str.len().to_numpy()
+    candidates = np.flatnonzero(byte_lengths + TOKEN_BOUND_SLACK > max_tokens)
+    if not len(candidates):
+        return []
+    if tokenizer is None:
+        return [int(i) for i in candidates]
+    with private_tokenizer(tokenizer) as tokenizer:
+        input_ids = tokenizer([texts[i] for i in candidates], truncation=False)["input_ids"]
+    return [int(i) for i, ids in zip(candidates, input_ids) if len(ids) > max_tokens]
+
+
+def summarize_text(text: str, summarizer) -> str:
+    """Summarizes one text, or returns it unchanged if the summarizer fails."""
+    try:
+        summary_result = summarizer(text, min_length=SUMMARIZATION_MIN_LENGTH, max_length=SUMMARIZATION_MAX_LENGTH,
+                                    truncation=True)
+        return summary_result[0]['summary_text']
+    except Exception:
+        return text
+
+
+def factorize_texts(texts):
+    """
+    Splits `texts` into (codes, unique_texts) so each distinct text is processed
+    once; `unique_texts[codes[i]]` is `texts[i]`. Chats repeat short replies,
+    emoji and forwarded floods a lot, so this alone removes much of the work.
+    """
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object))
+    return codes, uniques.tolist()
+
+
+def run_model(pipe, model_name: str, texts: list) -> list:
+    """
+    Runs texts that missed the cache through the model: sharded over
+    NLP_INFERENCE_WORKERS processes when configured, else in this process,
+    through the shared model server when NLP_SERVING is on.
+    """
+    if NLP_INFERENCE_WORKERS > 1 and model_name in MODEL_LOADERS and len(texts) >= SHARDED_MIN_TEXTS:
+        return run_sharded_inference(model_name, texts)
+    if NLP_SERVING == "on":
+        return get_model_server(model_name, pipe).infer(texts)
+    return run_token_batches(pipe, texts)
+
+
+def run_pipeline_cached(pipe, model_name: str, texts: list) -> list:
+    """
+    Runs a pipeline over `texts` in token-budgeted batches (see nlp/batching.py).
+    Each distinct text is looked up once in the persistent inference cache, only
+    the misses are sent to the model, and the results are scattered back to
+    every occurrence.
+    """
+    codes, unique_texts = factorize_texts(texts)
+
+    cache = get_inference_cache()
+    if cache is None:
+        unique_results = run_model(pipe, model_name, unique_texts)
+    else:
+        revision = model_revision(pipe)
+        unique_results = cache.get_many(model_name, revision, unique_texts)
+        miss_indices = [i for i, result in enumerate(unique_results) if result is None]
+        if miss_indices:
+            miss_texts = [unique_texts[i] for i in miss_indices]
+            miss_results = run_model(pipe, model_name, miss_texts)
+            cache.put_many(model_name, revision, miss_texts, miss_results)
+            for i, result in zip(miss_indices, miss_results):
+                unique_results[i] = result
+
+    if len(unique_results) != len(unique_texts):
+        return unique_results  # Let the caller's length check reject a short result
+    return [unique_results[code] for code in codes]
+
+
+def summarize_long_texts(summarizer, texts: list) -> list:
+    """
+    Summaries of `texts` (all long), normalised like every other model input.
+    They are generated in length-sorted batches; if a batch fails, each text is
+    retried on its own. Without a summarizer the texts are returned as they
+    are, and the classifiers truncate them.
+    """
+    if summarizer is None or not texts:
+        return [normalise_text(text) for text in texts]
+    with measure("stage", "summarization", items=len(texts)):
+        try:
+            results = run_token_batches(summarizer, texts, min_length=SUMMARIZATION_MIN_LENGTH,
+                                        max_length=SUMMARIZATION_MAX_LENGTH, truncation=True)
+            summaries = [result['summary_text'] for result in results]
+        except Exception:
+            summaries = [summarize_text(text, summarizer) for text in texts]
+    return [normalise_text(summary) for summary in summaries]
+
+
+def run_pipeline_chunked(pipe, model_name: str, texts: list, chunk_indices: list, aggregate) -> list:
+    """
+    Like run_pipeline_cached, but the texts at `chunk_indices` are split into
+    overlapping token windows (see nlp/long_text.py). All windows are classified
+    in the same batches as the short texts, and `aggregate` combines each
+    message's window results into one.
+    """
+    chunked = set(chunk_indices)
+    inputs = [text for i, text in enumerate(texts) if i not in chunked]
+    windows_by_index = {}
+    for i in chunk_indices:
+        windows = split_into_windows(texts[i], getattr(pipe, "tokenizer", None))
+        windows_by_index[i] = (len(inputs), windows)
+        inputs.extend(window_text for _, window_text in windows)
+
+    flat_results = run_pipeline_cached(pipe, model_name, inputs)
+    if len(flat_results) != len(inputs):
+        return flat_results
+
+    results = []
+    next_short = 0
+    for i in range(len(texts)):
+        if i in windows_by_index:
+            first, windows = windows_by_index[i]
+            results.append(aggregate(flat_results[first:first + len(windows)], windows))
+        else:
+            results.append(flat_results[next_short])
+            next_short += 1
+    return results
+
+
+def run_stage(pipe, model_name: str, texts: list, summary_indices=(), summaries_future=None,
+              chunk_indices=(), aggregate=None, prefilter=None):
+    """
+    Runs one model over `texts` and returns (results, error). It never raises,
+    and never calls Streamlit, so it can run on a worker thread.
+    With `summaries_future`, the texts at `summary_indices` are long messages
+    still being summarised: the others are processed first, then the summaries
+    once they arrive. With `chunk_indices`, those long texts are classified in
+    windows and combined with `aggregate` instead. A `prefilter` (see
+    nlp/cascade.py) settles the texts it is confident about, and only the rest
+    go to the model.
+    """
+    if prefilter is not None:
+        return run_stage_cascaded(pipe, model_name, texts, summary_indices, summaries_future, chunk_indices,
+                                  aggregate, prefilter)
+    try:
+        if chunk_indices:
+            results = run_pipeline_chunked(pipe, model_name, texts, chunk_indices, aggregate)
+        elif summaries_future is None:
+            results = run_pipeline_cached(pipe, model_name, texts)
+        else:
+            pending = set(summary_indices)
+            ready_indices = [i for i in range(len(texts)) if i not in pending]
+            results = [None] * len(texts)
+            ready_results = run_pipeline_cached(pipe, model_name, [texts[i] for i in ready_indices])
+            for i, result in zip(ready_indices, ready_results):
+                results[i] = result
+            summary_results = run_pipeline_cached(pipe, model_name, summaries_future.result())
+            for i, result in zip(summary_indices, summary_results):
+                results[i] = result
+        if len(results) != len(texts) or any(result is None for result in results):
+            return [], RuntimeError(f"{model_name} returned {len(results)} results for {len(texts)} texts")
+        return results, None
+    except Exception as e:
+        return [], e
+
+
+def run_named_stage(name: str, pipe, model_name: str, texts: list, *args, **kwargs):
+    """run_stage, timed in the performance counters as ("stage", name)."""
+    with measure("stage", name, items=len(texts)):
+        return run_stage(pipe, model_name, texts, *args, **kwargs)
+
+
+def run_stage_cascaded(pipe, model_name: str, texts: list, summary_indices, summaries_future, chunk_indices,
+                       aggregate, prefilter):
+    """run_stage for the texts `prefilter` leaves undecided; long texts always go to the model."""
+    try:
+        long_indices = set(summary_indices) | set(chunk_indices)
+        resolved = [None if i in long_indices else result for i, result in enumerate(prefilter(texts))]
+    except Exception as e:
+        return [], e
+    routed = [i for i, result in enumerate(resolved) if result is None]
+    position = {i: k for k, i in enumerate(routed)}
+    routed_results, error = run_stage(
+        pipe, model_name, [texts[i] for i in routed], [position[i] for i in summary_indices], summaries_future,
+        [position[i] for i in chunk_indices], aggregate,
+    )
+    if error is not None:
+        return [], error
+    for i, result in zip(routed, routed_results):
+        resolved[i] = result
+    return resolved, None
+
+
+# Models running inside partitioned_torch_threads blocks, across every session and job,
+# and the thread count to restore once the last block exits
+_torch_partitions = {"models": 0, "previous": None}
+_torch_partitions_lock = threading.Lock()
+
+
+@contextmanager
+def partitioned_torch_threads(n_parallel: int):
+    """
+    Gives each of `n_parallel` concurrently running models an equal share of
+    NLP_TORCH_THREADS. torch's intra-op thread count is process-wide, and each
+    calling thread gets its own pool of that size, so without this the stages
+    would oversubscribe the cores. Overlapping blocks (other sessions, background
+    jobs) share the budget between all their models, and the original count is
+    restored when the last one exits.
+    """
+    import torch
+
+    with _torch_partitions_lock:
+        if _torch_partitions["models"] == 0:
+            _torch_partitions["previous"] = torch.get_num_threads()
+        _torch_partitions["models"] += n_parallel
+        torch.set_num_threads(max(1, NLP_TORCH_THREADS // _torch_partitions["models"]))
+    try:
+        yield
+    finally:
+        with _torch_partitions_lock:
+            _torch_partitions["models"] -= n_parallel
+            if _torch_partitions["models"] == 0:
+                torch.set_num_threads(_torch_partitions["previous"])
+            else:
+                torch.set_num_threads(max(1, NLP_TORCH_THREADS // _torch_partitions["models"]))
+
+
+def format_error(error: Exception) -> str:
+    return "".join(traceback.format_exception(type(error), error, error.__traceback__))
+
+
+# --- Stages ---
+# Each stage adds its own columns, so dashboards can ask for just the ones they show
+NLP_STAGES = ("sentiment", "ner", "toxicity")
+STAGE_COLUMNS = {
+    "sentiment": ["sentiment_label", "sentiment_score"],
+    "ner": ["entities"],
+    "toxicity": ["toxicity_label", "toxicity_score"],
+}
+STAGE_MODEL_NAMES = {
+    "sentiment": SENTIMENT_MODEL_NAME,
+    "ner": NER_MODEL_NAME,
+    "toxicity": TOXICITY_MODEL_NAME,
+}
+STAGE_ERROR_NAMES = {"sentiment": "Sentiment Analysis", "ner": "NER", "toxicity": "Toxicity Analysis"}
+STAGE_STEPS = {
+    "sentiment": "Performing Sentiment Analysis...",
+    "ner": "Performing Named Entity Recognition...",
+    "toxicity": "Scanning for Toxicity...",
+}
+
+
+def completed_nlp_stages(df: pd.DataFrame) -> tuple:
+    """The stages whose columns `df` already has."""
+    return tuple(stage for stage in NLP_STAGES if all(column in df.columns for column in STAGE_COLUMNS[stage]))
+
+
+def missing_nlp_stages(df: pd.DataFrame, stages=NLP_STAGES) -> tuple:
+    done = completed_nlp_stages(df)
+    return tuple(stage for stage in stages if stage not in done)
+
+
+def load_stage_pipelines(stages) -> dict:
+    """
+    Loads the model of each stage as {stage: (pipe, model_name)}. Stages whose
+    model fails to load are left out.
+    """
+    pipeline_getters = {
+        "sentiment": get_sentiment_pipeline,
+        "ner": get_ner_pipeline,
+        "toxicity": get_toxicity_pipeline,
+    }
+    pipes = {}
+    for name in stages:
+        pipe = pipeline_getters[name]()
+        if pipe is not None:
+            pipes[name] = (pipe, STAGE_MODEL_NAMES[name])
+    return pipes
+
+
+def nlp_applicable_mask(df: pd.DataFrame) -> pd.Series:
+    return (~df['is_system']) & (df['message_type'] == 'text') & (df['message'].notna())
+
+
+def prepare_nlp_frame(df: pd.DataFrame, stages) -> None:
+    """Adds `message_for_nlp` and the default values of the `stages` columns to `df`, in place."""
+    # A previous run's summaries are reused, so the summarizer runs at most once per chat
+    if 'message_for_nlp' in df.columns:
+        df['message_for_nlp'] = df['message_for_nlp'].fillna(df['message'])
+    else:
+        df['message_for_nlp'] = df['message']
+    if "sentiment" in stages:
+        df['sentiment_label'] = "NEUTRAL"
+        df['sentiment_score'] = 0.0
+    if "ner" in stages:
+        df['entities'] = [[] for _ in range(len(df))]
+    if "toxicity" in stages:
+        df['toxicity_label'] = None
+        df['toxicity_score'] = float("nan")
+
+
+def prepare_nlp_texts(df: pd.DataFrame, pipes: dict):
+    """
+    Returns (mask, codes, texts, chunk_indices, summary_indices) for the messages
+    of `df` the models apply to. `texts` are the distinct, normalised messages;
+    `texts[codes[i]]` is the i-th masked row's. Long texts are listed in
+    `chunk_indices` or `summary_indices`, per LONG_TEXT_STRATEGY.
+    """
+    mask = nlp_applicable_mask(df)
+    # Every stage works on the distinct messages; results are scattered back at the end.
+    # Normalised once here: the same strings are the inference cache keys and the model inputs.
+    codes, unique_messages = factorize_texts(df.loc[mask, 'message_for_nlp'])
+    texts = [normalise_text(text) for text in unique_messages]
+    # A text is long if any stage's tokenizer makes it so: NER's XLM-R vocabulary splits many
+    # non-English scripts into more tokens than the classifiers' RoBERTa one
+    tokenizers = {id(tokenizer): tokenizer for tokenizer in
+                  (getattr(pipe, "tokenizer", None) for pipe, _ in pipes.values())}
+    long_indices = sorted({i for tokenizer in tokenizers.values() for i in find_long_texts(texts, tokenizer)})
+    # Long messages are either summarised first, or classified window by window
+    chunk_indices = long_indices if LONG_TEXT_STRATEGY == "chunk" else []
+    summary_indices = [] if LONG_TEXT_STRATEGY == "chunk" else long_indices
+    return mask, codes, texts, chunk_indices, summary_indices
+
+
+def apply_stage_results(df: pd.DataFrame, mask: pd.Series, codes, stage: str, results: list) -> None:
+    """
+    Writes one stage's results to the `mask` rows of `df`, in place. `results`
+    holds one result per distinct text and `codes` picks each row's.
+    """
+    if stage == "sentiment":
+        row_results = [results[code] for code in codes]
+        df.loc[mask, 'sentiment_label'] = [res.get('label', 'NEUTRAL').upper() for res in row_results]
+        df.loc[mask, 'sentiment_score'] = [res.get('score', 0.0) for res in row_results]
+    elif stage == "ner":
+        entities = df['entities'].tolist()
+        for position, code in zip(np.flatnonzero(mask.to_numpy()), codes):
+            entities[position] = results[code]
+        df['entities'] = pd.Series(entities, index=df.index, dtype=object)
+    elif stage == "toxicity":
+        row_results = [results[code] for code in codes]
+        # The model outputs a list of labels. We are interested in the 'toxic' one.
+        # A message can have multiple labels (e.g., toxic, insult).
+        df.loc[mask, 'toxicity_label'] = ['toxic' if res['label'] == 'toxic' else 'non-toxic' for res in row_results]
+        df.loc[mask, 'toxicity_score'] = [res['score'] if res['label'] == 'toxic' else 1 - res['score']
+                                          for res in row_results]
+
+
+def enrich_dataframe(df_input: pd.DataFrame, stages=NLP_STAGES, step=None):
+    """
+    Adds the columns of the requested NLP `stages` (sentiment, NER, toxicity) to a
+    copy of the DataFrame, plus `message_for_nlp` with long messages summarized.
+    Stages the DataFrame already has are skipped, and only the models that are
+    needed get loaded. Stages run one after another or concurrently, per
+    NLP_STAGE_EXECUTION. `step(description)`, if given, returns a context
+    manager wrapped around each phase, e.g. a spinner.
+
+    Returns (df, errors, failed_models): `errors` maps a stage to the exception
+    that stopped it (its columns keep their default values), and
+    `failed_models` lists the stages, or "summarization", whose model did not
+    load. A stage whose model fails to load adds no columns.
+    """
+    step = step or (lambda description: nullcontext())
+    stages = missing_nlp_stages(df_input, stages)
+    if df_input.empty or not stages:
+        return df_input, {}, []
+
+    df = df_input.copy()
+
+    # --- Load NLP Models ---
+    # The summarizer is loaded further down, and only if a message is long enough to need it
+    pipes = load_stage_pipelines(stages)
+    failed_models = [name for name in stages if name not in pipes]
+    if not pipes:
+        return df, {}, failed_models
+
+    # --- Prepare for NLP ---
+    prepare_nlp_frame(df, pipes)
+    if not nlp_applicable_mask(df).any():
+        return df, {}, failed_models
+
+    mask, codes, texts_to_process, chunk_indices, summary_indices = prepare_nlp_texts(df, pipes)
+    summarizer = None
+    if summary_indices:
+        summarizer = get_summarization_pipeline()
+        if summarizer is None:
+            failed_models.append("summarization")  # Long messages are truncated instead
+
+    if NLP_STAGE_EXECUTION == "concurrent":
+        # Summaries are only waited for by the few texts that need them
+        n_parallel = len(pipes) + bool(summary_indices)
+        with step("Running the NLP models concurrently..."), \
+                partitioned_torch_threads(n_parallel), ThreadPoolExecutor(max_workers=n_parallel) as executor:
+            summaries_future = executor.submit(
+                summarize_long_texts, summarizer, [texts_to_process[i] for i in summary_indices]
+            )
+            stage_futures = {
+                name: executor.submit(run_named_stage, name, pipe, model_name, texts_to_process, summary_indices,
+                                      summaries_future, chunk_indices, AGGREGATORS[name], cascade_prefilter(name))
+                for name, (pipe, model_name) in pipes.items()
+            }
+            summaries = summaries_future.result()
+            stage_results = {name: future.result() for name, future in stage_futures.items()}
+        for i, summary in zip(summary_indices, summaries):
+            texts_to_process[i] = summary
+    else:
+        # --- Summarization for long messages ---
+        if summary_indices:
+            with step("Summarizing long messages..."):
+                summaries = summarize_long_texts(summarizer, [texts_to_process[i] for i in summary_indices])
+                for i, summary in zip(summary_indices, summaries):
+                    texts_to_process[i] = summary
+
+        # --- Sentiment, NER and toxicity, one after another ---
+        stage_results = {}
+        for name, (pipe, model_name) in pipes.items():
+            with step(STAGE_STEPS[name]):
+                stage_results[name] = run_named_stage(name, pipe, model_name, texts_to_process,
+                                                      chunk_indices=chunk_indices, aggregate=AGGREGATORS[name],
+                                                      prefilter=cascade_prefilter(name))
+
+    df.loc[mask, 'message_for_nlp'] = [texts_to_process[code] for code in codes]
+
+    # --- Map results back ---
+    errors = {}
+    for name, (results, error) in stage_results.items():
+        if error is not None:
+            errors[name] = error
+        if results:
+            apply_stage_results(df, mask, codes, name, results)
+
+    return df, errors, failed_models
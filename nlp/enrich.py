@@ -1,131 +1,110 @@
+import os
+import threading
+from collections import OrderedDict
+
 import pandas as pd
 import streamlit as st
-import traceback
-from .models import get_sentiment_pipeline, get_ner_pipeline, get_summarization_pipeline, get_toxicity_pipeline
-
-# --- Configuration for NLP Tasks ---
-MAX_TEXT_LENGTH_FOR_NLP = 500  # Words; messages longer than this will be summarized for NLP
-SUMMARIZATION_MIN_LENGTH = 30
-SUMMARIZATION_MAX_LENGTH = 120 # Desired length of summary
-NLP_BATCH_SIZE = 16 # Adjust based on your VRAM/RAM
-
-def summarize_text_if_long(text: str, summarizer, max_original_len: int, min_summary: int, max_summary: int) -> str:
-    """Summarizes text if it's longer than max_original_len words."""
-    if not isinstance(text, str) or not text.strip() or summarizer is None:
-        return text
-    
-    if len(text.split()) > max_original_len:
-        try:
-            summary_result = summarizer(text, min_length=min_summary, max_length=max_summary, truncation=True)
-            return summary_result[0]['summary_text']
-        except Exception:
-            return text
-    return text
-
-
-@st.cache_data(show_spinner="Running NLP analysis on chat messages...") # CHANGED: Better spinner message
-def enrich_df_with_nlp(df_input: pd.DataFrame) -> pd.DataFrame:
+
+from .engine import (
+    NLP_STAGES, STAGE_COLUMNS, STAGE_ERROR_NAMES, enrich_dataframe, format_error, missing_nlp_stages,
+    nlp_applicable_mask,
+)
+
+# The app's entry point to the NLP engine (nlp/engine.py): results are cached per
+# input, progress is shown with spinners and problems as Streamlit messages.
+
+ENRICHMENT_CACHE_MAX_BYTES = int(os.environ.get("CIP_ENRICHMENT_CACHE_MAX_BYTES", str(1 << 30)))  # 1 GiB
+
+
+class EnrichmentCache:
     """
-    Adds sentiment, NER, and summarized text to the DataFrame using batch processing.
-    This function is cached, so it only runs when the input DataFrame changes.
+    In-memory LRU of enriched DataFrames under keys the caller already has (such
+    as the upload digest), shared by every session of the process. Unlike
+    st.cache_data it never hashes or copies a DataFrame: lookups are a dict
+    access, and hits return the cached object itself, so callers must treat it
+    as read-only. Entries are evicted once their total size exceeds `max_bytes`.
     """
-    if df_input.empty:
-        return df_input
 
-    df = df_input.copy()
-
-    # --- Load NLP Models ---
-    summarizer = get_summarization_pipeline()
-    sentiment_analyzer = get_sentiment_pipeline()
-    ner_recognizer = get_ner_pipeline()
-    toxicity_analyzer = get_toxicity_pipeline()  
-
-    if any(model is None for model in [summarizer, sentiment_analyzer, ner_recognizer]):
-        st.error("One or more NLP models failed to load. Aborting NLP enrichment.")
-        return df
-
-    # --- Prepare for NLP ---
-    nlp_applicable_mask = (~df['is_system']) & (df['message_type'] == 'text') & (df['message'].notna())
-    df['message_for_nlp'] = df['message']
-    df['sentiment_label'] = "NEUTRAL"
-    df['sentiment_score'] = 0.0
-    df['entities'] = [[] for _ in range(len(df))]
-
-    # --- 1. Summarization for long messages ---
-    if nlp_applicable_mask.any():
-        with st.spinner("Step 1: Summarizing long messages..."):
-            df.loc[nlp_applicable_mask, 'message_for_nlp'] = df.loc[nlp_applicable_mask, 'message'].apply(
-                lambda txt: summarize_text_if_long(
-                    txt, summarizer, MAX_TEXT_LENGTH_FOR_NLP, SUMMARIZATION_MIN_LENGTH, SUMMARIZATION_MAX_LENGTH
-                )
-            )
-
-    texts_to_process = df.loc[nlp_applicable_mask, 'message_for_nlp'].fillna("").tolist()
-
-    if not texts_to_process:
+    def __init__(self, max_bytes: int = ENRICHMENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (DataFrame, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df: pd.DataFrame) -> None:
+        # Counted once, on insert; the shallow per-object sizes are a fair estimate for strings and lists
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (df, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+enrichment_cache = EnrichmentCache()
+
+
+def enrich_df_with_nlp(df_input: pd.DataFrame, stages: tuple = NLP_STAGES, cache_key=None) -> pd.DataFrame:
+    """
+    Adds the columns of the requested NLP `stages` (sentiment, NER, toxicity) to the
+    DataFrame, see nlp.engine.enrich_dataframe. With a `cache_key` that identifies
+    the input's content, the result is cached under (cache_key, stages) and a
+    repeated call returns it without running or hashing anything. A stage whose
+    model failed adds no columns, and results of runs where a model failed are
+    not cached, so the next call retries.
+    """
+    if df_input.empty or not missing_nlp_stages(df_input, stages):
+        return df_input
+    stages = tuple(stages)
+    if cache_key is not None:
+        df = enrichment_cache.get((cache_key, stages))
+        if df is not None:
+            return df
+
+    with st.spinner("Running NLP analysis on chat messages..."):
+        df, errors, failed_models = enrich_dataframe(df_input, stages, step=st.spinner)
+
+    for name in failed_models:
+        if name == "summarization":
+            st.warning("The summarization model failed to load. Long messages will be truncated instead.")
+        else:
+            st.error(f"The {name} model failed to load. Skipping this analysis.")
+    for name, error in errors.items():
+        # Toxicity errors are not surfaced; the dashboard just has no toxicity data then
+        if name != "toxicity":
+            st.error(f"Error during batch {STAGE_ERROR_NAMES[name]}: {error}")
+            st.text_area(f"{STAGE_ERROR_NAMES[name]} Error Traceback", format_error(error), height=200)
+    if errors:
+        # Their columns only hold default values; left out, the stages count as not done yet
+        df = df.drop(columns=[column for name in errors for column in STAGE_COLUMNS[name]])
+    if not errors and not failed_models and not nlp_applicable_mask(df).any():
         st.success("NLP enrichment complete (no text messages to analyze).")
-        return df
-
-    # --- 2. Batch Sentiment Analysis ---
-    with st.spinner("Step 2: Performing Sentiment Analysis..."):
-        sentiment_results = []
-        try:
-            for i in range(0, len(texts_to_process), NLP_BATCH_SIZE):
-                batch = texts_to_process[i:i+NLP_BATCH_SIZE]
-                sentiment_results.extend(sentiment_analyzer(batch))
-        except Exception as e:
-            st.error(f"Error during batch sentiment analysis: {e}")
-            st.text_area("Sentiment Analysis Error Traceback", traceback.format_exc(), height=200)
-
-        if sentiment_results and len(sentiment_results) == len(texts_to_process):
-            labels = [res.get('label', 'NEUTRAL').upper() for res in sentiment_results]
-            scores = [res.get('score', 0.0) for res in sentiment_results]
-            df.loc[nlp_applicable_mask, 'sentiment_label'] = labels
-            df.loc[nlp_applicable_mask, 'sentiment_score'] = scores
-
-    # --- 3. Batch Named Entity Recognition (NER) ---
-    with st.spinner("Step 3: Performing Named Entity Recognition..."):
-        all_ner_results = []
-        texts_for_ner = df.loc[nlp_applicable_mask, 'message_for_nlp'].fillna("").tolist()
-        
-        try:
-            for i in range(0, len(texts_for_ner), NLP_BATCH_SIZE):
-                batch = texts_for_ner[i:i+NLP_BATCH_SIZE]
-                all_ner_results.extend(ner_recognizer(batch))
-        except Exception as e:
-            # ADDED: Crucial error handling for NER.
-            st.error(f"Error during batch NER: {e}")
-            st.text_area("NER Error Traceback", traceback.format_exc(), height=200)
-            
-        if all_ner_results and len(all_ner_results) == len(texts_for_ner):
-            # This mapping method is clever and robust, keeping it.
-            entities_series = pd.Series(all_ner_results, index=df.index[nlp_applicable_mask])
-            df['entities'] = entities_series
-            df['entities'] = df['entities'].apply(lambda x: x if isinstance(x, list) else [])
-    
-    # --- 4. Toxicity Analysis ---
-    with st.spinner("Step 4: Scanning for Toxicity..."):
-        # We can use the same texts processed for sentiment/NER
-        texts_to_process = df.loc[nlp_applicable_mask, 'message_for_nlp'].fillna("").tolist()
-
-        all_toxicity_results = []
-        try:
-            for i in range(0, len(texts_to_process), NLP_BATCH_SIZE):
-                batch = texts_to_process[i:i+NLP_BATCH_SIZE]
-                all_toxicity_results.extend(toxicity_analyzer(batch))
-        except Exception as e:
-            # st.error(f"Error during batch toxicity detection: {e}")
-            # st.text_area("Toxicity Detection Error Traceback", traceback.format_exc(), height=200)
-            pass
-
-        # Map results back
-        if all_toxicity_results and len(all_toxicity_results) == len(texts_to_process):
-            # The model outputs a list of labels. We are interested in the 'toxic' one.
-            # A message can have multiple labels (e.g., toxic, insult).
-            labels = ['toxic' if res['label'] == 'toxic' else 'non-toxic' for res in all_toxicity_results]
-            scores = [res['score'] if res['label'] == 'toxic' else 1 - res['score'] for res in all_toxicity_results]
-            
-            df.loc[nlp_applicable_mask, 'toxicity_label'] = labels
-            df.loc[nlp_applicable_mask, 'toxicity_score'] = scores
-    
-    return df
\ No newline at end of file
+    if cache_key is not None and not errors and not failed_models:
+        enrichment_cache.put((cache_key, stages), df)
+    return df
@@ -0,0 +1,175 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Persistent per-message cache of model outputs, shared by every analysis.
+# Short messages ("ok", "thanks", "😂") and forwarded announcements recur across
+# chats and re-exports, so most of them never need to reach the models again.
+
+INFERENCE_CACHE_PATH = os.environ.get(
+    "CIP_INFERENCE_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "conversational-intelligence", "inference_cache.sqlite3"),
+)  # Set to an empty string to disable the cache
+INFERENCE_CACHE_MAX_ROWS = int(os.environ.get("CIP_INFERENCE_CACHE_MAX_ROWS", "2000000"))
+EVICTION_TARGET_RATIO = 0.9  # Evict down to 90% of the cap so evictions are rare
+SQLITE_MAX_PARAMS = 900  # Keys per lookup query, below SQLite's bound parameter limit
+TOUCH_INTERVAL_SECONDS = 3600  # A hit only rewrites last_used if it is older than this
+
+
+def normalise_text(text: str) -> str:
+    """Cache key form of a message. It is also what the models see, so a hit equals a fresh run."""
+    return unicodedata.normalize("NFC", text).strip()
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def model_revision(pipe) -> str:
+    """
+    Commit hash of the checkpoint a pipeline was loaded from, plus its inference
+    backend if that isn't plain torch, so upgraded or quantized models miss the cache.
+    """
+    config = getattr(getattr(pipe, "model", None), "config", None)
+    revision = getattr(config, "_commit_hash", None) or "unknown"
+    backend = getattr(pipe, "inference_backend", "torch")
+    return revision if backend == "torch" else f"{revision}+{backend}"
+
+
+def to_json_value(value):
+    """json.dumps fallback for the numpy scalars pipelines return."""
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class InferenceCache:
+    """
+    SQLite-backed map from (model, revision, normalised text) to a pipeline result.
+    Lookups and inserts are batched, hits and misses are counted per model, and
+    the least recently used rows are evicted beyond `max_rows`. Safe to share
+    between Streamlit sessions (threads) and processes.
+    """
+
+    def __init__(self, path: str = INFERENCE_CACHE_PATH, max_rows: int = INFERENCE_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                model TEXT NOT NULL,
+                revision TEXT NOT NULL,
+                text_hash BLOB NOT NULL,
+                result TEXT NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (model, revision, text_hash)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+        """)
+        self._conn.commit()
+
+    def get_many(self, model: str, revision: str, texts) -> list:
+        """Returns the cached result for each of `texts` (already normalised), or None for a miss."""
+        digests = [text_digest(text) for text in texts]
+        found = {}
+        stale = []
+        now = int(time.time())
+        with self._lock:
+            unique_digests = list(set(digests))
+            for start in range(0, len(unique_digests), SQLITE_MAX_PARAMS):
+                batch = unique_digests[start:start + SQLITE_MAX_PARAMS]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, result, last_used FROM results WHERE model = ? AND revision = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, revision, *batch],
+                )
+                for digest, result, last_used in rows:
+                    found[digest] = result
+                    if now - last_used > TOUCH_INTERVAL_SECONDS:
+                        stale.append(digest)
+            if stale:
+                # LRU bookkeeping, coarse-grained so repeated hits don't turn reads into writes
+                self._conn.executemany(
+                    "UPDATE results SET last_used = ? WHERE model = ? AND revision = ? AND text_hash = ?",
+                    [(now, model, revision, digest) for digest in stale],
+                )
+                self._conn.commit()
+
+            results = [json.loads(found[digest]) if digest in found else None for digest in digests]
+            n_hits = sum(result is not None for result in results)
+            self.hits[model] = self.hits.get(model, 0) + n_hits
+            self.misses[model] = self.misses.get(model, 0) + len(results) - n_hits
+        return results
+
+    def put_many(self, model: str, revision: str, texts, results):
+        """Stores one result per text and evicts the oldest rows if the cache is over its cap."""
+        now = int(time.time())
+        rows = [
+            (model, revision, text_digest(text), json.dumps(result, default=to_json_value), now)
+            for text, result in zip(texts, results)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self) -> int:
+        n_rows = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if n_rows <= self.max_rows:
+            return 0
+        n_evict = n_rows - int(self.max_rows * EVICTION_TARGET_RATIO)
+        evicted = self._conn.execute(
+            "DELETE FROM results WHERE (model, revision, text_hash) IN "
+            "(SELECT model, revision, text_hash FROM results ORDER BY last_used LIMIT ?)",
+            (n_evict,),
+        ).rowcount
+        self._conn.commit()
+        return evicted
+
+    def stats(self) -> dict:
+        """Hit/miss counts of this process per model, plus the number of stored rows."""
+        with self._lock:
+            n_rows = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            return {
+                "rows": n_rows,
+                "max_rows": self.max_rows,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "per_model": {
+                    model: {"hits": self.hits.get(model, 0), "misses": self.misses.get(model, 0)}
+                    for model in sorted(set(self.hits) | set(self.misses))
+                },
+            }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+            self.hits.clear()
+            self.misses.clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_inference_cache():
+    """The process-wide cache, or None if it is disabled or can't be opened."""
+    if not INFERENCE_CACHE_PATH:
+        return None
+    try:
+        return InferenceCache(INFERENCE_CACHE_PATH)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Could not open inference cache '{INFERENCE_CACHE_PATH}'. Error: {e}")
+        return None
@@ -0,0 +1,339 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .engine import (
+    NLP_STAGE_EXECUTION, STAGE_COLUMNS, apply_stage_results, format_error, load_stage_pipelines,
+    partitioned_torch_threads, prepare_nlp_frame, prepare_nlp_texts, run_named_stage, summarize_long_texts,
+)
+from .cascade import cascade_prefilter
+from .checkpoints import NLP_CHECKPOINT_DIR, JobCheckpoint, checkpoint_key, evict_checkpoints
+from .inference_cache import model_revision
+from .long_text import AGGREGATORS
+from .models import MODEL_IDENTIFIERS, get_summarization_pipeline
+
+# Background enrichment that publishes its results batch by batch, so the
+# dashboard can show partial NLP results while the models are still running,
+# report progress, and stop the work between two batches. Finished batches are
+# also checkpointed to disk (nlp/checkpoints.py), so an interrupted job resumes.
+
+NLP_PROGRESS_BATCH = int(os.environ.get("CIP_NLP_PROGRESS_BATCH", "256"))  # Distinct messages per published batch
+
+
+class EnrichmentJob:
+    """
+    Runs the models in `pipes` ({stage: (pipe, model_name)}) over the messages
+    of `df` on a background thread, a batch of distinct messages at a time. The
+    thread never touches Streamlit; the script run polls status() and
+    snapshot() instead. `load_summarizer` is called here, and only if some
+    messages are long enough to need summarising. Batches already in the job's
+    checkpoint under `checkpoint_dir` are restored instead of being run again;
+    an empty `checkpoint_dir` turns checkpointing off. `key` is the job's
+    enrichment_job_key(), when the caller has computed it already.
+    """
+
+    def __init__(self, df: pd.DataFrame, pipes: dict, load_summarizer=None, batch_size: int = NLP_PROGRESS_BATCH,
+                 checkpoint_dir: str = NLP_CHECKPOINT_DIR, key: str = None):
+        self.stages = tuple(pipes)
+        self.batch_size = max(1, batch_size)
+        self.key = key or enrichment_job_key(df, self.batch_size)
+        self._checkpoint = JobCheckpoint(self.key, checkpoint_dir) if checkpoint_dir else None
+        self._df = df.copy()
+        prepare_nlp_frame(self._df, self.stages)
+        self._pipes = pipes
+        self._mask, self._codes, self._texts, self._chunk_indices, self._summary_indices = \
+            prepare_nlp_texts(self._df, pipes)
+        self._summarizer = load_summarizer() if self._summary_indices and load_summarizer is not None else None
+        self._revisions = {name: model_revision(pipe) for name, (pipe, _) in pipes.items()}
+        self._revisions["summaries"] = model_revision(self._summarizer)
+        self._summarized = set()  # Starts of the summary batches done
+        # Results per distinct text; None until its batch is done
+        self._results = {name: [None] * len(self._texts) for name in pipes}
+        self._errors = {}
+        # Batches in the order they were published, as (part, start, end); a failed stage adds (stage, None, None)
+        self._published = []
+        self._snapshot = None
+        self._snapshot_batches = 0  # Published batches already applied to _snapshot
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="nlp-enrichment", daemon=True)
+
+        self.total = len(self._summary_indices) + len(self._texts) * len(pipes)
+        self.done = 0
+        self.version = 0  # Bumped whenever new results are published
+        self.state = "pending"  # pending, running, finished, cancelled
+        self.current_stage = None
+        self.started_at = None
+        self.finished_at = None
+        self.resumed = 0  # Work items restored from the checkpoint
+        if self._checkpoint is not None:
+            self._restore()
+
+    # --- Control ---
+    def start(self):
+        self.started_at = time.monotonic()
+        self.state = "running"
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stops the job after the batch in progress."""
+        self._cancel.set()
+
+    def is_running(self) -> bool:
+        return self.state in ("pending", "running")
+
+    def discard_checkpoint(self):
+        """Deletes the job's checkpoint; for once its results are in the analysis store."""
+        if self._checkpoint is not None:
+            self._checkpoint.discard()
+
+    # --- Checkpoint ---
+    def _restore(self):
+        summary_batches = self._checkpoint.load_batches("summaries", self._revisions["summaries"])
+        for start in range(0, len(self._summary_indices), self.batch_size):
+            batch_indices = self._summary_indices[start:start + self.batch_size]
+            summaries = summary_batches.get(start)
+            if summaries is None or len(summaries) != len(batch_indices):
+                continue
+            for i, summary in zip(batch_indices, summaries):
+                self._texts[i] = summary
+            self._summarized.add(start)
+            self._published.append(("summaries", start, start + len(batch_indices)))
+            self.done += len(batch_indices)
+        # Stage results are only valid for the texts they were computed on, i.e. after every summary
+        if len(self._summarized) * self.batch_size < len(self._summary_indices):
+            self.resumed = self.done
+            return
+        for name in self._pipes:
+            for start, results in self._checkpoint.load_batches(name, self._revisions[name]).items():
+                end = min(start + self.batch_size, len(self._texts))
+                if start % self.batch_size or len(results) != end - start:
+                    continue
+                self._results[name][start:end] = results
+                self._published.append((name, start, end))
+                self.done += end - start
+        self.resumed = self.done
+
+    def _checkpoint_batch(self, part: str, start: int, results: list):
+        if self._checkpoint is not None:
+            self._checkpoint.save_batch(part, start, self._revisions[part], results)
+            self._save_status()
+
+    def _save_status(self):
+        status = self.status()
+        status["errors"] = {name: format_error(error) for name, error in status["errors"].items()}
+        self._checkpoint.save_status(status)
+
+    # --- Worker thread ---
+    def _run(self):
+        try:
+            self._summarize()
+            if NLP_STAGE_EXECUTION == "concurrent" and len(self._pipes) > 1:
+                with partitioned_torch_threads(len(self._pipes)), \
+                        ThreadPoolExecutor(max_workers=len(self._pipes)) as executor:
+                    list(executor.map(self._run_stage_batches, self._pipes))
+            else:
+                for name in self._pipes:
+                    self._run_stage_batches(name)
+        finally:
+            self.finished_at = time.monotonic()
+            self.state = "cancelled" if self._cancel.is_set() else "finished"
+            if self._checkpoint is not None:
+                self._save_status()
+
+    def _summarize(self):
+        if not self._summary_indices:
+            return
+        self.current_stage = "summarization"
+        for start in range(0, len(self._summary_indices), self.batch_size):
+            if self._cancel.is_set():
+                return
+            if start in self._summarized:
+                continue
+            batch_indices = self._summary_indices[start:start + self.batch_size]
+            summaries = summarize_long_texts(self._summarizer, [self._texts[i] for i in batch_indices])
+            with self._lock:
+                for i, summary in zip(batch_indices, summaries):
+                    self._texts[i] = summary
+                self._summarized.add(start)
+                self._published.append(("summaries", start, start + len(batch_indices)))
+                self.done += len(batch_indices)
+            self._checkpoint_batch("summaries", start, summaries)
+
+    def _run_stage_batches(self, name: str):
+        pipe, model_name = self._pipes[name]
+        chunked = np.array(self._chunk_indices, dtype=np.int64)
+        prefilter = cascade_prefilter(name)
+        for start in range(0, len(self._texts), self.batch_size):
+            if self._cancel.is_set() or name in self._errors:
+                return
+            if self._results[name][start] is not None:
+                continue  # Restored from the checkpoint
+            self.current_stage = name
+            end = min(start + self.batch_size, len(self._texts))
+            chunk_indices = (chunked[(chunked >= start) & (chunked < end)] - start).tolist()
+            results, error = run_named_stage(name, pipe, model_name, self._texts[start:end],
+                                             chunk_indices=chunk_indices, aggregate=AGGREGATORS[name],
+                                             prefilter=prefilter)
+            with self._lock:
+                if error is not None:
+                    # Like enrich_df_with_nlp, a failed stage is left out of the result
+                    self._errors[name] = error
+                    self._results[name] = [None] * len(self._texts)
+                    self._published.append((name, None, None))
+                    self.done += len(self._texts) - start
+                else:
+                    self._results[name][start:end] = results
+                    self._published.append((name, start, end))
+                    self.done += end - start
+                self.version += 1
+            if error is None:
+                self._checkpoint_batch(name, start, results)
+
+    # --- Polling ---
+    def status(self) -> dict:
+        """
+        Progress counters, for a progress bar: done/total work items (`resumed`
+        of them restored from the checkpoint), and an ETA in seconds.
+        """
+        with self._lock:
+            done, total = self.done, self.total
+        elapsed = ((self.finished_at or time.monotonic()) - self.started_at) if self.started_at else 0.0
+        computed = done - self.resumed
+        eta = elapsed / computed * (total - done) if computed and self.is_running() else None
+        return {
+            "key": self.key,
+            "state": self.state,
+            "stages": list(self.stages),
+            "stage": self.current_stage,
+            "done": done,
+            "resumed": self.resumed,
+            "total": total,
+            "fraction": done / total if total else 1.0,
+            "elapsed_seconds": elapsed,
+            "eta_seconds": eta,
+            "errors": dict(self._errors),
+        }
+
+    def snapshot(self) -> pd.DataFrame:
+        """
+        The DataFrame with every result published so far. While a stage is in
+        progress, the messages it hasn't reached yet have empty values
+        (no label, no score, no entities), so charts leave them out. The last
+        snapshot is reused until another batch is published, and then only the
+        new batches are applied to a copy of it: snapshots already handed out
+        are never changed.
+        """
+        with self._lock:
+            new_batches = self._published[self._snapshot_batches:]
+            if self._snapshot is not None and not new_batches:
+                return self._snapshot
+            if self._snapshot is None:
+                df = self._df.copy()
+                df.loc[self._mask, 'message_for_nlp'] = [self._texts[code] for code in self._codes]
+                for name in self._pipes:
+                    clear_pending_rows(df, self._mask, name)
+                new_batches = [batch for batch in new_batches if batch[0] != "summaries"]
+            else:
+                df = self._snapshot.copy()
+            for part, start, end in new_batches:
+                if start is None:
+                    clear_pending_rows(df, self._mask, part)
+                elif part == "summaries":
+                    batch_codes = np.isin(self._codes, self._summary_indices[start:end])
+                    df.loc[self._batch_rows(batch_codes), 'message_for_nlp'] = [self._texts[code]
+                                                                                for code in self._codes[batch_codes]]
+                elif part not in self._errors:
+                    batch_codes = (self._codes >= start) & (self._codes < end)
+                    apply_stage_results(df, self._batch_rows(batch_codes), self._codes[batch_codes], part,
+                                        self._results[part])
+            self._snapshot = df
+            self._snapshot_batches = len(self._published)
+        return df
+
+    def _batch_rows(self, code_mask: np.ndarray) -> pd.Series:
+        """The rows of the job's DataFrame whose codes `code_mask` selects."""
+        rows = self._mask.copy()
+        rows[self._mask] = code_mask
+        return rows
+
+    def result(self) -> pd.DataFrame:
+        """
+        The enriched DataFrame once the job has stopped. Only the stages that ran
+        to completion are included: a stage that was cancelled or failed adds no
+        columns, so its default values are never mistaken for results.
+        """
+        df = self.snapshot()
+        with self._lock:
+            unfinished = [name for name, results in self._results.items()
+                          if name in self._errors or any(result is None for result in results)]
+        return df.drop(columns=[column for name in unfinished for column in STAGE_PENDING_VALUES[name]])
+
+
+# Values of rows a stage hasn't reached yet
+STAGE_PENDING_VALUES = {
+    "sentiment": {"sentiment_label": None, "sentiment_score": float("nan")},
+    "ner": {"entities": None},
+    "toxicity": {"toxicity_label": None, "toxicity_score": float("nan")},
+}
+
+
+def clear_pending_rows(df: pd.DataFrame, pending_mask: pd.Series, stage: str) -> None:
+    for column, value in STAGE_PENDING_VALUES[stage].items():
+        if column == "entities":
+            df[column] = df[column].astype(object).where(~pending_mask, None)
+        else:
+            df.loc[pending_mask, column] = value
+
+
+def enrichment_job_key(df: pd.DataFrame, batch_size: int = NLP_PROGRESS_BATCH) -> str:
+    """The checkpoint key of an enrichment job over `df`, whichever stages it runs."""
+    output_columns = {column for columns in STAGE_COLUMNS.values() for column in columns}
+    return checkpoint_key(df, output_columns, MODEL_IDENTIFIERS, max(1, batch_size))
+
+
+# Running jobs of the process by (checkpoint key, frozenset of stages). A session that
+# analyses a chat another session (e.g. the same user before a browser refresh)
+# is still enriching follows that job rather than starting a second one.
+_active_jobs = {}
+_active_jobs_lock = threading.Lock()
+
+
+def start_enrichment_job(df: pd.DataFrame, stages, batch_size: int = NLP_PROGRESS_BATCH):
+    """
+    Loads the models for `stages` in the calling script run and starts an
+    EnrichmentJob with them, resuming from its checkpoint if there is one. If
+    the same job is already running in this process, that job is returned
+    instead, before any model is loaded. Returns None if no model could be loaded.
+    """
+    key = enrichment_job_key(df, batch_size)
+    running_job = find_running_job(key, stages)
+    if running_job is not None:
+        return running_job
+    pipes = load_stage_pipelines(stages)
+    if not pipes:
+        return None
+    if NLP_CHECKPOINT_DIR:
+        evict_checkpoints()
+    job = EnrichmentJob(df, pipes, get_summarization_pipeline, batch_size, key=key)
+    with _active_jobs_lock:
+        # Another session may have started the same job while the models were loading
+        running_job = _active_jobs.get((key, frozenset(job.stages)))
+        if running_job is not None and running_job.is_running():
+            return running_job
+        _active_jobs[(key, frozenset(job.stages))] = job
+    return job.start()
+
+
+def find_running_job(key: str, stages):
+    """The running job with checkpoint key `key` over the same `stages` in any order, or None."""
+    with _active_jobs_lock:
+        for job_id, active_job in list(_active_jobs.items()):
+            if not active_job.is_running():
+                del _active_jobs[job_id]
+        return _active_jobs.get((key, frozenset(stages)))
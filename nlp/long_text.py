@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+
+from .batching import private_tokenizer
+
+# Chunk-and-aggregate handling of messages too long for the 512-token models, as a
+# cheaper alternative to abstractive summarisation: a long message is cut into
+# overlapping token windows, every window is classified in the normal batches,
+# and the window results are combined into one result per message.
+
+# "summarize" (abstractive summary first) or "chunk" (overlapping windows)
+LONG_TEXT_STRATEGY = os.environ.get("CIP_LONG_TEXT_STRATEGY", "summarize")
+CHUNK_WINDOW_TOKENS = 400  # Leaves room for special tokens and re-tokenization drift under 512
+CHUNK_OVERLAP_TOKENS = 64  # Shared by neighbouring windows, so no entity or phrase is only ever seen cut
+CHARS_PER_TOKEN = 4  # Window size estimate for tokenizers without offset mappings
+
+
+def split_into_windows(text: str, tokenizer, window_tokens: int = CHUNK_WINDOW_TOKENS,
+                       overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> list:
+    """
+    Cuts `text` into overlapping windows of about `window_tokens` tokens.
+    Returns (char_offset, window_text) pairs, where each window_text is exactly
+    text[char_offset:char_offset + len(window_text)].
+    """
+    stride = window_tokens - overlap_tokens
+    offsets = None
+    if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+        with private_tokenizer(tokenizer) as tokenizer:
+            offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+
+    if not offsets:
+        # No token offsets: fall back to character windows of the same approximate size
+        window_chars, stride_chars = window_tokens * CHARS_PER_TOKEN, stride * CHARS_PER_TOKEN
+        windows = []
+        for start in range(0, max(len(text), 1), stride_chars):
+            windows.append((start, text[start:start + window_chars]))
+            if start + window_chars >= len(text):
+                break
+        return windows
+
+    windows = []
+    for start in range(0, len(offsets), stride):
+        end = min(start + window_tokens, len(offsets))
+        char_start, char_end = offsets[start][0], offsets[end - 1][1]
+        windows.append((char_start, text[char_start:char_end]))
+        if end == len(offsets):
+            break
+    return windows
+
+
+def aggregate_sentiment(window_results: list, windows: list) -> dict:
+    """Length-weighted vote: the label with the most weight*score wins, scored by its weighted mean."""
+    weights = np.array([len(window_text) for _, window_text in windows], dtype=float)
+    totals, label_weights = {}, {}
+    for result, weight in zip(window_results, weights):
+        label = result.get('label', 'NEUTRAL')
+        totals[label] = totals.get(label, 0.0) + weight * float(result.get('score', 0.0))
+        label_weights[label] = label_weights.get(label, 0.0) + weight
+    label = max(totals, key=totals.get)
+    return {'label': label, 'score': totals[label] / label_weights[label]}
+
+
+def aggregate_toxicity(window_results: list, windows: list) -> dict:
+    """Max: a message is as toxic as its most toxic window."""
+    def toxicity(result):
+        return result['score'] if result['label'] == 'toxic' else 1 - result['score']
+    return max(window_results, key=toxicity)
+
+
+def aggregate_entities(window_results: list, windows: list) -> list:
+    """
+    Shifts each window's entity spans to message offsets and merges the windows.
+    Where windows overlap, the same entity is found twice, or cut short in one
+    of them; overlapping spans are resolved in favour of the longest, then the
+    most confident.
+    """
+    candidates = []
+    for entities, (char_offset, _) in zip(window_results, windows):
+        for entity in entities:
+            shifted = dict(entity)
+            if shifted.get('start') is not None:
+                shifted['start'] = int(shifted['start']) + char_offset
+                shifted['end'] = int(shifted['end']) + char_offset
+            candidates.append(shifted)
+
+    kept = []
+    for entity in sorted(candidates, key=lambda e: (-((e.get('end') or 0) - (e.get('start') or 0)), -e['score'])):
+        if entity.get('start') is None or not any(
+            other.get('start') is not None and entity['start'] < other['end'] and other['start'] < entity['end']
+            for other in kept
+        ):
+            kept.append(entity)
+    return sorted(kept, key=lambda e: e.get('start') or 0)
+
+
+AGGREGATORS = {
+    "sentiment": aggregate_sentiment,
+    "ner": aggregate_entities,
+    "toxicity": aggregate_toxicity,
+}
@@ -1,23 +1,126 @@
-import streamlit as st
+import os
+import threading
 from transformers import pipeline 
 import torch 
 
-# We use @st.cache_resource so Streamlit doesn't have to reload these big models
-# every single time we change a filter or something.
+from utils.perf import measure
+from .long_text import LONG_TEXT_STRATEGY
+from .cascade import NLP_CASCADE
 
-HF_TOKEN = st.secrets.get("HUGGING_FACE_TOKEN")
+# The load_* functions build a pipeline from scratch, so worker processes (see
+# nlp/sharded.py) can call them too. The app uses the get_* wrappers, which load
+# each model once per process, so Streamlit doesn't have to reload these big
+# models every single time we change a filter or something. Nothing here needs
+# Streamlit, so headless jobs (scripts/batch_enrich.py) can use it as well.
 
-@st.cache_resource
-def get_sentiment_pipeline():
-    model_name = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+
+def read_hf_token():
+    """HUGGING_FACE_TOKEN from the environment, else from Streamlit secrets (if there are any)."""
+    token = os.environ.get("HUGGING_FACE_TOKEN")
+    if token:
+        return token
+    try:
+        import streamlit as st
+        return st.secrets.get("HUGGING_FACE_TOKEN")
+    except Exception:
+        return None  # Streamlit not installed, or no secrets.toml, e.g. outside `streamlit run`
+
+
+HF_TOKEN = read_hf_token()
+
+SENTIMENT_MODEL_NAME = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+NER_MODEL_NAME = "xlm-roberta-large-finetuned-conll03-english" # Using a  MULTILINGUAL NER model
+SUMMARIZATION_MODEL_NAME = "sshleifer/distilbart-cnn-6-6"
+TOXICITY_MODEL_NAME = "unitary/unbiased-toxic-roberta"
+
+# --- Inference backend ---
+# "torch": fp32 PyTorch. "int8": PyTorch with dynamically quantized Linear layers
+# (CPU only). "onnx": an ONNX Runtime graph exported once via optimum and kept in
+# ONNX_EXPORT_DIR. Falls back to "torch" when optimum isn't installed.
+INFERENCE_BACKENDS = ("torch", "int8", "onnx")
+INFERENCE_BACKEND = os.environ.get("CIP_INFERENCE_BACKEND", "torch")
+ONNX_EXPORT_DIR = os.environ.get(
+    "CIP_ONNX_EXPORT_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "conversational-intelligence", "onnx"),
+)
+ONNX_MODEL_CLASSES = {
+    "sentiment-analysis": "ORTModelForSequenceClassification",
+    "text-classification": "ORTModelForSequenceClassification",
+    "ner": "ORTModelForTokenClassification",
+    "summarization": "ORTModelForSeq2SeqLM",
+}
+
+# Everything whose change invalidates previously stored analyses
+MODEL_IDENTIFIERS = (SENTIMENT_MODEL_NAME, NER_MODEL_NAME, SUMMARIZATION_MODEL_NAME, TOXICITY_MODEL_NAME) + (
+    (f"backend={INFERENCE_BACKEND}",) if INFERENCE_BACKEND != "torch" else ()
+) + ((f"long_text={LONG_TEXT_STRATEGY}",) if LONG_TEXT_STRATEGY != "summarize" else ()) + (
+    (f"cascade={NLP_CASCADE}",) if NLP_CASCADE != "off" else ()
+)
+
+
+def load_onnx_model(task: str, model_name: str):
+    """Returns (ORT model, tokenizer), exporting the checkpoint to ONNX on first use."""
+    from optimum import onnxruntime as ort
+    from transformers import AutoTokenizer
+
+    model_class = getattr(ort, ONNX_MODEL_CLASSES[task])
+    export_path = os.path.join(ONNX_EXPORT_DIR, model_name.replace("/", "--"))
+    if os.path.isdir(export_path):
+        model = model_class.from_pretrained(export_path)
+        tokenizer = AutoTokenizer.from_pretrained(export_path)
+    else:
+        model = model_class.from_pretrained(model_name, export=True, token=HF_TOKEN)
+        tokenizer = AutoTokenizer.from_pretrained(model_name, token=HF_TOKEN)
+        model.save_pretrained(export_path)
+        tokenizer.save_pretrained(export_path)
+    return model, tokenizer
+
+
+def create_pipeline(task: str, model_name: str, backend: str = INFERENCE_BACKEND, **kwargs):
+    """
+    pipeline(task, model=model_name, **kwargs) on the selected inference backend.
+    The returned pipeline has the same interface whichever backend runs it; its
+    `inference_backend` attribute records the one actually used.
+    """
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Choose from {INFERENCE_BACKENDS}.")
+    on_cpu = kwargs.get("device", -1) == -1
+
+    if backend == "onnx":
+        try:
+            model, tokenizer = load_onnx_model(task, model_name)
+        except ImportError:
+            print("optimum[onnxruntime] is not installed. Falling back to the torch backend.")
+            backend = "torch"
+        else:
+            kwargs.pop("tokenizer", None)
+            kwargs.pop("device", None)  # The ONNX Runtime session picks its own execution provider
+            model_pipeline = pipeline(task, model=model, tokenizer=tokenizer, **kwargs)
+
+    if backend != "onnx":
+        model_pipeline = pipeline(task, model=model_name, **kwargs)
+        if backend == "int8":
+            if on_cpu:
+                model_pipeline.model = torch.quantization.quantize_dynamic(
+                    model_pipeline.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            else:
+                backend = "torch"  # Dynamic quantization only has CPU kernels
+
+    model_pipeline.inference_backend = backend
+    return model_pipeline
+
+def load_sentiment_pipeline(backend: str = INFERENCE_BACKEND):
+    model_name = SENTIMENT_MODEL_NAME
     
     try:
         device_to_use = -1
         if torch.cuda.is_available():
             device_to_use = 0 
-        sentiment_model_pipeline = pipeline(
-            "sentiment-analysis",  
-            model=model_name,      
+        sentiment_model_pipeline = create_pipeline(
+            "sentiment-analysis",
+            model_name,
+            backend=backend,
             device=device_to_use,
             max_length=512,
             truncation=True,
@@ -30,18 +133,18 @@ def get_sentiment_pipeline():
         print(f"Could not load sentiment model '{model_name}'. Error: {e}")
         return None 
 
-@st.cache_resource 
-def get_ner_pipeline():
+def load_ner_pipeline(backend: str = INFERENCE_BACKEND):
     # model_name = "dslim/bert-base-NER"
-    model_name = "xlm-roberta-large-finetuned-conll03-english" # Using a  MULTILINGUAL NER model
+    model_name = NER_MODEL_NAME
     try:
         device_to_use = -1 
         if torch.cuda.is_available():
             device_to_use = 0
 
-        ner_model_pipeline = pipeline(
-            "ner",                 
-            model=model_name,
+        ner_model_pipeline = create_pipeline(
+            "ner",
+            model_name,
+            backend=backend,
             grouped_entities=True, 
             device=device_to_use,
             token=HF_TOKEN
@@ -52,17 +155,17 @@ def get_ner_pipeline():
     except Exception as e:
         return None
 
-@st.cache_resource 
-def get_summarization_pipeline():
-    model_name = "sshleifer/distilbart-cnn-6-6"
+def load_summarization_pipeline(backend: str = INFERENCE_BACKEND):
+    model_name = SUMMARIZATION_MODEL_NAME
     try:
         device_to_use = -1
         if torch.cuda.is_available():
             device_to_use = 0
 
-        summarization_model_pipeline = pipeline(
-            "summarization",       
-            model=model_name,
+        summarization_model_pipeline = create_pipeline(
+            "summarization",
+            model_name,
+            backend=backend,
             device=device_to_use,
             token=HF_TOKEN
         )
@@ -71,18 +174,18 @@ def get_summarization_pipeline():
     except Exception as e:
         return None
 
-@st.cache_resource
-def get_toxicity_pipeline():
-    model_name = "unitary/toxic-bert"
+def load_toxicity_pipeline(backend: str = INFERENCE_BACKEND):
+    model_name = TOXICITY_MODEL_NAME
     try:
         device_to_use = -1
         if torch.cuda.is_available():
             device_to_use = 0
 
-        toxicity_pipeline = pipeline(
-            "text-classification", 
-            model="unitary/unbiased-toxic-roberta",
-            tokenizer="unitary/unbiased-toxic-roberta",
+        toxicity_pipeline = create_pipeline(
+            "text-classification",
+            model_name,
+            backend=backend,
+            tokenizer=model_name,
             device=device_to_use,
             max_length=512,
             token=HF_TOKEN
@@ -90,4 +193,47 @@ def get_toxicity_pipeline():
         
         return toxicity_pipeline
     except Exception as e:
-        return None
\ No newline at end of file
+        return None
+
+
+def cache_pipeline(load):
+    """
+    Wraps a load_* function so the pipeline is loaded once per process and shared
+    by every session and thread. Concurrent first calls wait for one load rather
+    than each loading the model. clear() drops the cached pipeline. Loads are
+    timed in the performance counters, e.g. as ("model_load", "sentiment").
+    """
+    lock = threading.Lock()
+    loaded = {}
+    model = load.__name__[len("load_"):-len("_pipeline")]
+
+    def get(backend: str = INFERENCE_BACKEND):
+        with lock:
+            if backend not in loaded:
+                with measure("model_load", model):
+                    loaded[backend] = load(backend=backend)
+            return loaded[backend]
+
+    get.clear = loaded.clear
+    get.__name__ = get.__qualname__ = load.__name__.replace("load_", "get_", 1)
+    return get
+
+
+get_sentiment_pipeline = cache_pipeline(load_sentiment_pipeline)
+get_ner_pipeline = cache_pipeline(load_ner_pipeline)
+get_summarization_pipeline = cache_pipeline(load_summarization_pipeline)
+get_toxicity_pipeline = cache_pipeline(load_toxicity_pipeline)
+PIPELINE_GETTERS = (get_sentiment_pipeline, get_ner_pipeline, get_summarization_pipeline, get_toxicity_pipeline)
+
+
+def clear_pipeline_cache():
+    for get in PIPELINE_GETTERS:
+        get.clear()
+
+# Model name -> loader, for code that has to build a model in another process
+MODEL_LOADERS = {
+    SENTIMENT_MODEL_NAME: load_sentiment_pipeline,
+    NER_MODEL_NAME: load_ner_pipeline,
+    SUMMARIZATION_MODEL_NAME: load_summarization_pipeline,
+    TOXICITY_MODEL_NAME: load_toxicity_pipeline,
+}
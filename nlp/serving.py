@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from utils.perf import measure
+from .batching import run_token_batches
+
+# One model server per model and process: the single place a model runs. All
+# Streamlit sessions are threads of the same process, so without it concurrent
+# analyses would each run the shared pipeline with their own small batches and
+# fight over the cores. Requests from every session are queued here and merged
+# into full batches, waiting at most a short window for company.
+
+# "off" runs models on the calling thread; "on" routes model calls through the servers
+NLP_SERVING = os.environ.get("CIP_NLP_SERVING", "off")
+SERVING_MAX_BATCH_TEXTS = int(os.environ.get("CIP_NLP_SERVING_MAX_BATCH", "256"))  # Texts merged per model run
+SERVING_MAX_WAIT_MS = float(os.environ.get("CIP_NLP_SERVING_MAX_WAIT_MS", "20"))  # Latency window for filling a batch
+
+
+class _Request:
+    def __init__(self, texts: list):
+        self.texts = texts
+        self.results = [None] * len(texts)
+        self.next = 0  # First text not yet scheduled
+        self.remaining = len(texts)  # Texts without a result yet
+        self.future = Future()
+
+
+class ModelServer:
+    """
+    Runs `pipe` on a background thread over texts submitted from any thread.
+    Pending requests are served round-robin, each getting a fair share of every
+    batch, so a short request is not stuck behind a whole chat's worth of texts.
+    """
+
+    def __init__(self, pipe, model_name: str, max_batch_texts: int = SERVING_MAX_BATCH_TEXTS,
+                 max_wait_ms: float = SERVING_MAX_WAIT_MS):
+        self.pipe = pipe
+        self.model_name = model_name
+        self.max_batch_texts = max(1, max_batch_texts)
+        self.max_wait_seconds = max_wait_ms / 1000
+        self._pending = deque()
+        self._pending_texts = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._counters = {"requests": 0, "texts": 0, "batches": 0, "busy_seconds": 0.0}
+        self._thread = threading.Thread(target=self._serve, name=f"model-server-{model_name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: list) -> Future:
+        """Queues `texts`; the returned future resolves to their results, in order."""
+        request = _Request(list(texts))
+        if not request.texts:
+            request.future.set_result([])
+            return request.future
+        with self._condition:
+            self._pending.append(request)
+            self._pending_texts += len(request.texts)
+            self._counters["requests"] += 1
+            self._condition.notify()
+        return request.future
+
+    def infer(self, texts: list) -> list:
+        return self.submit(texts).result()
+
+    def close(self):
+        """Stops the server thread once the requests already queued are served."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def stats(self) -> dict:
+        with self._condition:
+            counters = dict(self._counters)
+        counters["mean_batch_texts"] = counters["texts"] / counters["batches"] if counters["batches"] else 0.0
+        return counters
+
+    # --- Server thread ---
+    def _next_batch(self) -> list:
+        """
+        Waits for work and returns [(request, start, end)], at most max_batch_texts
+        texts in all, or None once the server is closed and drained.
+        """
+        with self._condition:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._condition.wait()
+            # Give other sessions a moment to add to a batch that isn't full yet
+            deadline = time.monotonic() + self.max_wait_seconds
+            while self._pending_texts < self.max_batch_texts:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch, n_texts = [], 0
+            while self._pending and n_texts < self.max_batch_texts:
+                fair_share = max(1, self.max_batch_texts // len(self._pending))
+                request = self._pending.popleft()
+                if request.future.done():
+                    # Failed with an earlier batch: its remaining texts are not worth model time
+                    self._pending_texts -= len(request.texts) - request.next
+                    continue
+                take = min(fair_share, self.max_batch_texts - n_texts, len(request.texts) - request.next)
+                batch.append((request, request.next, request.next + take))
+                request.next += take
+                n_texts += take
+                if request.next < len(request.texts):
+                    self._pending.append(request)  # Back of the line for its next slice
+            self._pending_texts -= n_texts
+            return batch
+
+    def _serve(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue  # Only requests that had already failed were pending
+            texts = [text for request, start, end in batch for text in request.texts[start:end]]
+            started = time.perf_counter()
+            try:
+                # The stages wait on other threads, so this thread's batches are counted under the model
+                with measure("serve", self.model_name, items=len(texts)):
+                    results = run_token_batches(self.pipe, texts)
+                if len(results) != len(texts):
+                    raise RuntimeError(f"{self.model_name} returned {len(results)} results for {len(texts)} texts")
+            except Exception as e:
+                for request, _, _ in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+            finally:
+                with self._condition:
+                    self._counters["batches"] += 1
+                    self._counters["texts"] += len(texts)
+                    self._counters["busy_seconds"] += time.perf_counter() - started
+
+            offset = 0
+            for request, start, end in batch:
+                request.results[start:end] = results[offset:offset + end - start]
+                offset += end - start
+                request.remaining -= end - start
+                if request.remaining == 0 and not request.future.done():
+                    request.future.set_result(request.results)
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def get_model_server(model_name: str, pipe) -> ModelServer:
+    """The process's server for `model_name`, replaced if the pipeline itself was reloaded."""
+    with _servers_lock:
+        server = _servers.get(model_name)
+        if server is None or server.pipe is not pipe:
+            if server is not None:
+                server.close()  # Lets go of the old pipeline once its queue is empty
+            server = _servers[model_name] = ModelServer(pipe, model_name)
+        return server
+
+
+def serving_stats() -> dict:
+    with _servers_lock:
+        return {model_name: server.stats() for model_name, server in _servers.items()}
@@ -0,0 +1,97 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.perf import captured_batches, record_batch
+from .batching import run_token_batches
+from .models import MODEL_LOADERS
+
+# Data-parallel inference: N worker processes each hold their own copy of a model
+# with a bounded torch thread count, and shards of the message list are spread
+# over them. Tokenization and pipeline overhead then run on every core instead
+# of serialising in the Streamlit process.
+
+NLP_INFERENCE_WORKERS = int(os.environ.get("CIP_NLP_INFERENCE_WORKERS", "1"))  # 1 = in-process inference
+NLP_WORKER_TORCH_THREADS = int(os.environ.get("CIP_NLP_WORKER_TORCH_THREADS", "0"))  # 0 = cores / workers
+SHARDS_PER_WORKER = 4  # More shards than workers evens out shards of slow, long messages
+SHARDED_MIN_TEXTS = 256  # Below this, shipping texts to the workers costs more than it saves
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Set in each worker process by init_inference_worker
+_worker_pipe = None
+
+
+def init_inference_worker(model_name: str, torch_threads: int):
+    import torch
+
+    global _worker_pipe
+    torch.set_num_threads(torch_threads)
+    _worker_pipe = MODEL_LOADERS[model_name]()
+
+
+def run_inference_shard(texts: list):
+    """Returns (results, batches): the worker's counters stay in the worker, so its batches travel back too."""
+    if _worker_pipe is None:
+        raise RuntimeError("The model failed to load in this inference worker.")
+    with captured_batches() as batch_log:
+        results = run_token_batches(_worker_pipe, texts)
+    return results, batch_log.batches
+
+
+def worker_torch_threads(workers: int) -> int:
+    if NLP_WORKER_TORCH_THREADS > 0:
+        return NLP_WORKER_TORCH_THREADS
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def get_inference_pool(model_name: str, workers: int = NLP_INFERENCE_WORKERS) -> ProcessPoolExecutor:
+    """
+    The worker pool for one model, started on first use and kept for the life of
+    the process so the models are loaded once per worker, not once per analysis.
+    """
+    with _pools_lock:
+        pool = _pools.get((model_name, workers))
+        if pool is None:
+            # spawn, not fork: forking a process that has already started torch threads can deadlock
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_inference_worker,
+                initargs=(model_name, worker_torch_threads(workers)),
+            )
+            _pools[(model_name, workers)] = pool
+        return pool
+
+
+def shard_texts(texts: list, n_shards: int) -> list:
+    """Splits `texts` into up to `n_shards` contiguous shards of similar size."""
+    n_shards = max(1, min(n_shards, len(texts)))
+    bounds = [len(texts) * i // n_shards for i in range(n_shards + 1)]
+    return [texts[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def run_sharded_inference(model_name: str, texts: list, workers: int = NLP_INFERENCE_WORKERS) -> list:
+    """Runs the model named `model_name` over `texts` on `workers` processes; results come back in order."""
+    if not texts:
+        return []
+    pool = get_inference_pool(model_name, workers)
+    results = []
+    for shard_results, batches in pool.map(run_inference_shard, shard_texts(texts, workers * SHARDS_PER_WORKER)):
+        results.extend(shard_results)
+        for n_texts, n_tokens in batches:
+            record_batch(n_texts, n_tokens)
+    return results
+
+
+def shutdown_inference_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+
+atexit.register(shutdown_inference_pools)
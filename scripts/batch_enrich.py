@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+# Allow running as `python scripts/batch_enrich.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from nlp.engine import NLP_STAGES, enrich_dataframe
+from nlp.models import MODEL_IDENTIFIERS
+from utils.analysis_store import (
+    ANALYSIS_STORE_DIR, ANALYSIS_STORE_MAX_BYTES, HashingReader, analysis_key, analysis_path, build_fingerprint,
+    hash_upload, save_analysis,
+)
+from utils.file_handler import iter_chat_files
+from utils.perf import perf_snapshot
+from utils.parser import detect_export_dialect, parse_whatsapp_chat, parse_whatsapp_chat_once
+
+# Headless enrichment of many exports, e.g. nightly on a worker box without
+# Streamlit. Every chat in a directory of .txt/.zip exports is parsed, enriched
+# with the NLP engine and written to the analysis store, under the key the app
+# computes for the same upload, so the app just loads the result.
+# Chats are enriched in groups, so short chats share full model batches and
+# messages repeated across chats are only run once.
+
+DEFAULT_GROUP_MESSAGES = 50_000  # Messages enriched together
+DEFAULT_REPORT = os.path.join("benchmarks", "batch_enrich_report.json")
+NLP_INPUT_COLUMNS = ["message", "is_system", "message_type"]
+EPILOG = (
+    "The NLP engine is configured with the usual environment variables, e.g. CIP_NLP_INFERENCE_WORKERS, "
+    "CIP_NLP_STAGE_EXECUTION, CIP_INFERENCE_BACKEND, CIP_NLP_CASCADE. The app must run with the same "
+    "settings and CIP_ANALYSIS_STORE_DIR to find the results."
+)
+
+
+def find_exports(input_dir: str) -> list:
+    exports = []
+    for root, _, file_names in os.walk(input_dir):
+        exports.extend(os.path.join(root, name) for name in file_names if name.lower().endswith((".txt", ".zip")))
+    return sorted(exports)
+
+
+def enrich_group(chats: list, stages) -> tuple:
+    """
+    Enriches the parsed chats of a group in one engine call and adds the NLP
+    columns to each chat's DataFrame. Returns (errors, failed_models).
+    """
+    combined = pd.concat([chat["df"][NLP_INPUT_COLUMNS] for chat in chats], ignore_index=True)
+    enriched, errors, failed_models = enrich_dataframe(combined, stages)
+    nlp_columns = [column for column in enriched.columns if column not in NLP_INPUT_COLUMNS]
+    offset = 0
+    for chat in chats:
+        n_messages = len(chat["df"])
+        for column in nlp_columns:
+            chat["df"][column] = enriched[column].iloc[offset:offset + n_messages].to_numpy()
+        offset += n_messages
+    return errors, failed_models
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Parse and enrich a directory of WhatsApp exports into the analysis store.", epilog=EPILOG
+    )
+    arg_parser.add_argument("input_dir", help="Directory searched recursively for .txt and .zip exports.")
+    arg_parser.add_argument("--store-dir", default=ANALYSIS_STORE_DIR, help="Analysis store to write to.")
+    arg_parser.add_argument("--max-store-bytes", type=int, default=ANALYSIS_STORE_MAX_BYTES,
+                            help="Size the store is evicted down to after each write.")
+    arg_parser.add_argument("--stages", nargs="+", default=list(NLP_STAGES), choices=NLP_STAGES)
+    arg_parser.add_argument("--group-messages", type=int, default=DEFAULT_GROUP_MESSAGES,
+                            help="Messages from consecutive chats enriched together.")
+    arg_parser.add_argument("--force", action="store_true", help="Re-enrich chats that are already stored.")
+    arg_parser.add_argument("--report", default=DEFAULT_REPORT, help="JSON file the run summary is written to.")
+    args = arg_parser.parse_args()
+
+    totals = {"exports": 0, "chats": 0, "skipped": 0, "failed": 0, "stored": 0, "messages": 0}
+    timings = {"parse_seconds": 0.0, "enrich_seconds": 0.0, "store_seconds": 0.0}
+    failures = []
+    start = time.perf_counter()
+
+    def flush(group: list):
+        if not group:
+            return
+        enrich_start = time.perf_counter()
+        errors, failed_models = enrich_group(group, args.stages)
+        timings["enrich_seconds"] += time.perf_counter() - enrich_start
+        # Like the app, only complete analyses are stored; without a summarizer long messages are just truncated
+        problems = [f"{name}: {error}" for name, error in errors.items()]
+        problems += [f"{name}: model failed to load" for name in failed_models if name != "summarization"]
+        if problems:
+            totals["failed"] += len(group)
+            failures.extend({"chat": chat["name"], "errors": problems} for chat in group)
+            print(f"  group of {len(group)} chats not stored: {'; '.join(problems)}")
+            return
+        store_start = time.perf_counter()
+        for chat in group:
+            fingerprint = build_fingerprint(chat["df"], chat["digest"], chat["size"], chat["dialect"],
+                                            MODEL_IDENTIFIERS)
+            if save_analysis(chat["key"], chat["df"], fingerprint, args.store_dir, args.max_store_bytes):
+                totals["stored"] += 1
+        timings["store_seconds"] += time.perf_counter() - store_start
+        print(f"  enriched and stored {len(group)} chats, {sum(len(chat['df']) for chat in group):,} messages")
+
+    group, group_messages = [], 0
+    for export_path in find_exports(args.input_dir):
+        totals["exports"] += 1
+        with open(export_path, "rb") as export_file:
+            for chat_file in iter_chat_files(export_file):
+                totals["chats"] += 1
+                name = os.path.relpath(export_path, args.input_dir)
+                if chat_file.name != export_file.name:
+                    name += f"::{chat_file.name}"
+
+                if chat_file.streamed:
+                    # Chats in archives are read once, so hashing and parsing share a pass
+                    parse_start = time.perf_counter()
+                    reader = HashingReader(chat_file.file)
+                    df, dialect = parse_whatsapp_chat_once(reader)
+                    timings["parse_seconds"] += time.perf_counter() - parse_start
+                    digest = reader.hexdigest()
+                else:
+                    digest = hash_upload(chat_file.file)
+                key = analysis_key(digest, MODEL_IDENTIFIERS)
+                if not args.force and os.path.exists(analysis_path(key, args.store_dir)):
+                    totals["skipped"] += 1
+                    continue
+
+                if not chat_file.streamed:
+                    parse_start = time.perf_counter()
+                    chat_file.file.seek(0)
+                    dialect = detect_export_dialect(chat_file.file)
+                    df = parse_whatsapp_chat(chat_file.file)
+                    timings["parse_seconds"] += time.perf_counter() - parse_start
+                if df.empty:
+                    totals["failed"] += 1
+                    failures.append({"chat": name, "errors": ["no messages could be parsed"]})
+                    print(f"{name}: no messages could be parsed, skipped")
+                    continue
+
+                print(f"{name}: {len(df):,} messages")
+                totals["messages"] += len(df)
+                group.append({"name": name, "df": df, "digest": digest, "key": key, "size": chat_file.size,
+                              "dialect": dialect})
+                group_messages += len(df)
+                if group_messages >= args.group_messages:
+                    flush(group)
+                    group, group_messages = [], 0
+    flush(group)
+
+    seconds = time.perf_counter() - start
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "input_dir": args.input_dir,
+        "store_dir": args.store_dir,
+        "stages": args.stages,
+        "model_identifiers": list(MODEL_IDENTIFIERS),
+        **totals,
+        "seconds": seconds,
+        **timings,
+        "messages_per_hour": totals["messages"] / seconds * 3600 if seconds else None,
+        "failures": failures,
+        "performance": perf_snapshot(),
+    }
+    print(f"{totals['stored']} chats stored, {totals['skipped']} already stored, {totals['failed']} failed; "
+          f"{totals['messages']:,} messages in {seconds:.1f}s ({report['messages_per_hour'] or 0:,.0f} messages/hour)")
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
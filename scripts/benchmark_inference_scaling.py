@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+# Allow running as `python scripts/benchmark_inference_scaling.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlp.batching import run_token_batches
+from nlp.models import MODEL_LOADERS, SENTIMENT_MODEL_NAME, TOXICITY_MODEL_NAME
+from nlp.sharded import get_inference_pool, run_sharded_inference, shutdown_inference_pools
+from utils.synthetic_chat import random_text
+
+# Messages/s of sharded inference (nlp/sharded.py) as the worker count grows.
+# Model loading is excluded: each pool is warmed up before it is timed.
+
+BENCHMARK_MODELS = {"sentiment": SENTIMENT_MODEL_NAME, "toxicity": TOXICITY_MODEL_NAME}
+DEFAULT_OUTPUT = os.path.join("benchmarks", "inference_scaling.json")
+
+
+def benchmark_in_process(model_name: str, texts: list) -> float:
+    import torch
+
+    torch.set_num_threads(os.cpu_count() or 1)
+    pipe = MODEL_LOADERS[model_name]()
+    run_token_batches(pipe, texts[:32])  # Warm-up
+    start = time.perf_counter()
+    run_token_batches(pipe, texts)
+    return time.perf_counter() - start
+
+
+def benchmark_sharded(model_name: str, texts: list, workers: int) -> float:
+    get_inference_pool(model_name, workers)
+    run_sharded_inference(model_name, texts[:workers * 32], workers=workers)  # Starts and warms up every worker
+    start = time.perf_counter()
+    run_sharded_inference(model_name, texts, workers=workers)
+    return time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark sharded inference scaling across worker processes.")
+    arg_parser.add_argument("--models", nargs="+", default=list(BENCHMARK_MODELS), choices=list(BENCHMARK_MODELS))
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8],
+                            help="Worker counts to try; 1 runs in this process with every core.")
+    arg_parser.add_argument("--messages", type=int, default=5_000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file the results are written to.")
+    args = arg_parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = [random_text(rng) for _ in range(args.messages)]
+
+    results = []
+    for model_key in args.models:
+        model_name = BENCHMARK_MODELS[model_key]
+        baseline = None
+        for workers in args.workers:
+            if workers <= 1:
+                seconds = benchmark_in_process(model_name, texts)
+            else:
+                seconds = benchmark_sharded(model_name, texts, workers)
+                shutdown_inference_pools()
+            baseline = baseline or seconds
+            result = {
+                "model": model_name,
+                "workers": workers,
+                "messages": len(texts),
+                "seconds": seconds,
+                "messages_per_second": len(texts) / seconds,
+                "speedup": baseline / seconds,
+            }
+            results.append(result)
+            print(f"{model_key:>9} workers={workers:<3} {result['messages_per_second']:10,.1f} msg/s  "
+                  f"speedup x{result['speedup']:.2f}")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
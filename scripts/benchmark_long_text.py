@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+# Allow running as `python scripts/benchmark_long_text.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Time the models, not the inference cache
+os.environ["CIP_INFERENCE_CACHE_PATH"] = ""
+
+from nlp.engine import run_stage, summarize_long_texts
+from nlp.long_text import AGGREGATORS
+from nlp.models import (
+    NER_MODEL_NAME, SENTIMENT_MODEL_NAME, TOXICITY_MODEL_NAME, load_ner_pipeline, load_sentiment_pipeline,
+    load_summarization_pipeline, load_toxicity_pipeline,
+)
+from utils.synthetic_chat import random_text
+
+# Long-message handling: abstractive summarisation then classification, against
+# classifying overlapping windows and aggregating (CIP_LONG_TEXT_STRATEGY=chunk).
+# Reports time per strategy and how often the two agree on the labels.
+
+DEFAULT_OUTPUT = os.path.join("benchmarks", "long_text_benchmark.json")
+
+
+def long_messages(n_messages: int, n_words: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(n_messages):
+        words = []
+        while len(words) < n_words:
+            words.extend((random_text(rng) + ".").split())
+        messages.append(" ".join(words[:n_words]))
+    return messages
+
+
+def run_classifiers(stages: dict, texts: list, chunk: bool) -> dict:
+    results = {}
+    for name, (pipe, model_name) in stages.items():
+        chunk_indices = list(range(len(texts))) if chunk else ()
+        stage_results, error = run_stage(pipe, model_name, texts, chunk_indices=chunk_indices,
+                                         aggregate=AGGREGATORS[name])
+        if error is not None:
+            raise error
+        results[name] = stage_results
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark summarize vs chunk handling of long messages.")
+    arg_parser.add_argument("--messages", type=int, default=32)
+    arg_parser.add_argument("--words", type=int, default=800, help="Words per long message.")
+    arg_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file the results are written to.")
+    args = arg_parser.parse_args()
+
+    texts = long_messages(args.messages, args.words)
+    stages = {
+        "sentiment": (load_sentiment_pipeline(), SENTIMENT_MODEL_NAME),
+        "ner": (load_ner_pipeline(), NER_MODEL_NAME),
+        "toxicity": (load_toxicity_pipeline(), TOXICITY_MODEL_NAME),
+    }
+    summarizer = load_summarization_pipeline()
+    run_classifiers(stages, texts[:1], chunk=True)  # Warm-up
+
+    start = time.perf_counter()
+    summaries = summarize_long_texts(summarizer, texts)
+    summarize_seconds = time.perf_counter() - start
+    summarized = run_classifiers(stages, summaries, chunk=False)
+    summarize_total = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunked = run_classifiers(stages, texts, chunk=True)
+    chunk_total = time.perf_counter() - start
+
+    agreement = {
+        name: sum(a['label'] == b['label'] for a, b in zip(summarized[name], chunked[name])) / len(texts)
+        for name in ("sentiment", "toxicity")
+    }
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "messages": len(texts),
+        "words_per_message": args.words,
+        "summarize": {
+            "seconds": summarize_total,
+            "summarization_seconds": summarize_seconds,
+            "messages_per_second": len(texts) / summarize_total,
+        },
+        "chunk": {
+            "seconds": chunk_total,
+            "messages_per_second": len(texts) / chunk_total,
+        },
+        "chunk_speedup": summarize_total / chunk_total,
+        "label_agreement": agreement,
+        "entities_per_message": {
+            "summarize": sum(map(len, summarized["ner"])) / len(texts),
+            "chunk": sum(map(len, chunked["ner"])) / len(texts),
+        },
+    }
+    print(f"summarize: {summarize_total:8.2f}s ({summarize_seconds:.2f}s generating summaries)")
+    print(f"    chunk: {chunk_total:8.2f}s  speedup x{report['chunk_speedup']:.2f}")
+    print(f"label agreement: {json.dumps(agreement)}")
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
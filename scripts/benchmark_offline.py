@@ -0,0 +1,281 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# Allow running as `python scripts/benchmark_offline.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# No network: every model below is built locally. Worker processes would load the real
+# checkpoints, so inference stays in this process.
+os.environ["HF_HUB_OFFLINE"] = "1"
+os.environ["TRANSFORMERS_OFFLINE"] = "1"
+os.environ["CIP_NLP_INFERENCE_WORKERS"] = "1"
+# Stand-in results must never land in the real inference cache; --inference-cache uses a throwaway one
+os.environ["CIP_INFERENCE_CACHE_PATH"] = ""
+if "--inference-cache" in sys.argv:
+    os.environ["CIP_INFERENCE_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "inference_cache.sqlite3")
+
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors, trainers
+from transformers import (
+    BartConfig, BartForConditionalGeneration, GenerationConfig, PreTrainedTokenizerFast, RobertaConfig,
+    RobertaForSequenceClassification, RobertaForTokenClassification,
+)
+
+from nlp import engine
+from nlp import models as nlp_models
+from nlp.batching import MAX_SEQUENCE_TOKENS
+from nlp.engine import NLP_STAGES, enrich_dataframe, nlp_applicable_mask
+from nlp.inference_cache import get_inference_cache
+from utils.parser import parse_whatsapp_chat
+from utils.perf import peak_rss_bytes, perf_records, reset_perf
+from utils.synthetic_chat import WORDS, generate_synthetic_chat, random_text
+
+# End-to-end throughput of the NLP engine (the enrich_dataframe call behind the
+# app's enrich_df_with_nlp) with tiny, randomly initialised stand-ins for the four
+# models: same tasks, label sets and tokenizer behaviour, a fraction of the
+# weights. Inference becomes cheap, so the numbers show our own orchestration
+# (batching, caching, cascade, parallelism) rather than the checkpoints. Needs no
+# network and no GPU. The labels are random, only the timings mean anything.
+
+SPECIAL_TOKENS = ["<s>", "<pad>", "</s>", "<unk>", "<mask>"]  # RoBERTa/BART order: bos 0, pad 1, eos 2
+TOKENIZER_CORPUS_MESSAGES = 5_000
+SENTIMENT_LABELS = ["negative", "neutral", "positive"]
+NER_LABELS = ["O", "B-PER", "I-PER", "B-ORG", "I-ORG", "B-LOC", "I-LOC", "B-MISC", "I-MISC"]
+TOXICITY_LABELS = ["toxic", "severe_toxic", "obscene", "threat", "insult", "identity_hate"]
+LONG_MESSAGE_WORDS = 600
+DEFAULT_OUTPUT = os.path.join("benchmarks", "offline_benchmark.json")
+EPILOG = (
+    "The engine is configured with the usual environment variables, e.g. CIP_NLP_STAGE_EXECUTION, "
+    "CIP_NLP_MAX_BATCH_TOKENS, CIP_LONG_TEXT_STRATEGY, CIP_NLP_CASCADE, CIP_NLP_SERVING. "
+    "CIP_NLP_INFERENCE_WORKERS is forced to 1."
+)
+
+
+def build_tokenizer(vocab_size: int, seed: int) -> PreTrainedTokenizerFast:
+    """A byte-level BPE tokenizer with RoBERTa's special tokens, trained on synthetic messages."""
+    rng = random.Random(seed)
+    corpus = [random_text(rng) for _ in range(TOKENIZER_CORPUS_MESSAGES)] + [" ".join(WORDS)]
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    # The full byte alphabet, so any text (emoji, other scripts) encodes without <unk>
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=SPECIAL_TOKENS,
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(corpus, trainer)
+    tokenizer.post_processor = processors.RobertaProcessing(
+        ("</s>", tokenizer.token_to_id("</s>")), ("<s>", tokenizer.token_to_id("<s>")), add_prefix_space=False
+    )
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>", unk_token="<unk>", pad_token="<pad>",
+        mask_token="<mask>", model_max_length=MAX_SEQUENCE_TOKENS,
+    )
+
+
+def roberta_config(tokenizer, labels: list, hidden_size: int, layers: int, heads: int) -> RobertaConfig:
+    return RobertaConfig(
+        vocab_size=len(tokenizer), hidden_size=hidden_size, num_hidden_layers=layers, num_attention_heads=heads,
+        intermediate_size=hidden_size * 4, max_position_embeddings=MAX_SEQUENCE_TOKENS + 2, type_vocab_size=1,
+        pad_token_id=1, bos_token_id=0, eos_token_id=2,
+        id2label=dict(enumerate(labels)), label2id={label: i for i, label in enumerate(labels)},
+    )
+
+
+# {stage or "summarization": (loader in nlp/models.py, module attribute naming the checkpoint it loads)}
+STAND_IN_LOADERS = {
+    "sentiment": (nlp_models.load_sentiment_pipeline, "SENTIMENT_MODEL_NAME"),
+    "ner": (nlp_models.load_ner_pipeline, "NER_MODEL_NAME"),
+    "summarization": (nlp_models.load_summarization_pipeline, "SUMMARIZATION_MODEL_NAME"),
+    "toxicity": (nlp_models.load_toxicity_pipeline, "TOXICITY_MODEL_NAME"),
+}
+
+
+def build_stand_ins(tokenizer, hidden_size: int, layers: int, heads: int) -> dict:
+    """
+    {stage or "summarization": pipeline}. The stand-ins are saved with `tokenizer`
+    to a temporary directory and loaded by the app's own loaders pointed at it,
+    so they get exactly the real pipelines' settings and inference backend, and
+    each one its own tokenizer.
+    """
+    def classifier(labels):
+        return RobertaForSequenceClassification(roberta_config(tokenizer, labels, hidden_size, layers, heads)).eval()
+
+    token_classifier = RobertaForTokenClassification(
+        roberta_config(tokenizer, NER_LABELS, hidden_size, layers, heads)
+    ).eval()
+    summarizer = BartForConditionalGeneration(BartConfig(
+        vocab_size=len(tokenizer), d_model=hidden_size, encoder_layers=layers, decoder_layers=layers,
+        encoder_attention_heads=heads, decoder_attention_heads=heads, encoder_ffn_dim=hidden_size * 4,
+        decoder_ffn_dim=hidden_size * 4, max_position_embeddings=1024, pad_token_id=1, bos_token_id=0,
+        eos_token_id=2, decoder_start_token_id=2, forced_bos_token_id=0,
+    )).eval()
+    # distilbart-cnn-6-6's generation settings, so the stand-in decodes (beams, lengths) like the real one
+    summarizer.generation_config = GenerationConfig(
+        num_beams=4, length_penalty=2.0, no_repeat_ngram_size=3, early_stopping=True, min_length=56, max_length=142,
+        bos_token_id=0, eos_token_id=2, pad_token_id=1, decoder_start_token_id=2, forced_bos_token_id=0,
+    )
+    stand_in_models = {
+        "sentiment": classifier(SENTIMENT_LABELS),
+        "ner": token_classifier,
+        "summarization": summarizer,
+        "toxicity": classifier(TOXICITY_LABELS),
+    }
+
+    stand_ins = {}
+    with tempfile.TemporaryDirectory() as model_dir:
+        for name, model in stand_in_models.items():
+            load, model_name_attribute = STAND_IN_LOADERS[name]
+            path = os.path.join(model_dir, name)
+            model.save_pretrained(path)
+            tokenizer.save_pretrained(path)
+            real_model_name = getattr(nlp_models, model_name_attribute)
+            setattr(nlp_models, model_name_attribute, path)
+            try:
+                stand_ins[name] = load()
+            finally:
+                setattr(nlp_models, model_name_attribute, real_model_name)
+            if stand_ins[name] is None:
+                sys.exit(f"The {name} stand-in could not be loaded.")
+    return stand_ins
+
+
+class TimedPipeline:
+    """Forwards to a pipeline and adds up the time spent inside its calls, from every thread."""
+
+    def __init__(self, pipe, timer: dict):
+        self._pipe = pipe
+        self._timer = timer
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._pipe(*args, **kwargs)
+        finally:
+            with self._timer["lock"]:
+                self._timer["seconds"] += time.perf_counter() - start
+                self._timer["calls"] += 1
+
+    def __getattr__(self, name):
+        return getattr(self._pipe, name)
+
+
+def patch_pipeline_getters(stand_ins: dict, timer: dict) -> None:
+    """Points the engine's get_*_pipeline factories at the stand-ins."""
+    for name, pipe in stand_ins.items():
+        timed_pipe = TimedPipeline(pipe, timer)
+        setattr(engine, f"get_{name}_pipeline", lambda backend=None, timed_pipe=timed_pipe: timed_pipe)
+
+
+def benchmark_chat(n_lines: int, long_ratio: float, seed: int):
+    """A parsed synthetic chat, with a share of its text messages replaced by long ones."""
+    df = parse_whatsapp_chat(io.BytesIO(generate_synthetic_chat(n_lines, seed=seed).encode("utf-8")))
+    rng = random.Random(seed)
+    text_rows = df.index[nlp_applicable_mask(df)]
+    for row in rng.sample(list(text_rows), int(len(text_rows) * long_ratio)):
+        words = []
+        while len(words) < LONG_MESSAGE_WORDS:
+            words.extend((random_text(rng) + ".").split())
+        df.at[row, "message"] = " ".join(words[:LONG_MESSAGE_WORDS])
+    return df
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark the NLP engine end to end with tiny random stand-in models, offline.", epilog=EPILOG
+    )
+    arg_parser.add_argument("--lines", type=int, default=20_000, help="Lines of the synthetic chat.")
+    arg_parser.add_argument("--long-ratio", type=float, default=0.002,
+                            help=f"Share of text messages replaced by {LONG_MESSAGE_WORDS}-word ones.")
+    arg_parser.add_argument("--stages", nargs="+", default=list(NLP_STAGES), choices=NLP_STAGES)
+    arg_parser.add_argument("--repeats", type=int, default=2,
+                            help="Runs over the same chat; later runs show the effect of the inference cache.")
+    arg_parser.add_argument("--inference-cache", action="store_true",
+                            help="Use a temporary inference cache (by default it is off).")
+    arg_parser.add_argument("--hidden-size", type=int, default=64)
+    arg_parser.add_argument("--layers", type=int, default=2)
+    arg_parser.add_argument("--heads", type=int, default=2)
+    arg_parser.add_argument("--vocab-size", type=int, default=2_000)
+    arg_parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="torch intra-op threads.")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file the results are written to.")
+    args = arg_parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.threads)
+    rss_at_start = peak_rss_bytes()
+
+    start = time.perf_counter()
+    tokenizer = build_tokenizer(args.vocab_size, args.seed)
+    stand_ins = build_stand_ins(tokenizer, args.hidden_size, args.layers, args.heads)
+    build_seconds = time.perf_counter() - start
+    parameters = {name: sum(p.numel() for p in pipe.model.parameters()) for name, pipe in stand_ins.items()}
+    timer = {"seconds": 0.0, "calls": 0, "lock": threading.Lock()}
+    patch_pipeline_getters(stand_ins, timer)
+
+    df = benchmark_chat(args.lines, args.long_ratio, args.seed)
+    n_texts = int(nlp_applicable_mask(df).sum())
+    print(f"{len(df):,} messages ({n_texts:,} text), stand-ins built in {build_seconds:.1f}s, "
+          f"{sum(parameters.values()):,} parameters")
+    enrich_dataframe(df.head(64), args.stages)  # Warm-up
+
+    results = []
+    for run in range(args.repeats):
+        reset_perf()
+        timer["seconds"], timer["calls"] = 0.0, 0
+        start = time.perf_counter()
+        _, errors, failed_models = enrich_dataframe(df, args.stages)
+        seconds = time.perf_counter() - start
+        if errors or failed_models:
+            sys.exit(f"Enrichment failed: {errors or failed_models}")
+
+        # Inference is the time inside the pipeline calls, their own tokenization and post-processing included.
+        # With concurrent stages the calls overlap, so their summed time can exceed the wall time.
+        inference_seconds = timer["seconds"]
+        result = {
+            "run": run + 1,
+            "seconds": seconds,
+            "messages_per_second": len(df) / seconds,
+            "text_messages_per_second": n_texts / seconds,
+            "model_calls": timer["calls"],
+            "inference_seconds": inference_seconds,
+            "orchestration_seconds": max(seconds - inference_seconds, 0.0),
+            "orchestration_fraction": max(seconds - inference_seconds, 0.0) / seconds,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": [record for record in perf_records() if record["kind"] == "stage"],
+            "model_servers": [record for record in perf_records() if record["kind"] == "serve"],
+        }
+        results.append(result)
+        print(f"run {run + 1}: {result['messages_per_second']:10,.0f} msg/s  {seconds:7.2f}s  "
+              f"inference {inference_seconds:6.2f}s, orchestration {result['orchestration_fraction']:.0%}  "
+              f"peak RSS {(result['peak_rss_bytes'] or 0) / 2**20:,.0f} MiB")
+
+    inference_cache = get_inference_cache()
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": args.threads,
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "environment": {key: value for key, value in os.environ.items() if key.startswith("CIP_")},
+        "messages": len(df),
+        "text_messages": n_texts,
+        "stand_in_parameters": parameters,
+        "stand_in_build_seconds": build_seconds,
+        "rss_at_start_bytes": rss_at_start,
+        "inference_cache": inference_cache.stats() if inference_cache is not None else None,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
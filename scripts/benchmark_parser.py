@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import pathlib
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Allow running as `python scripts/benchmark_parser.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.synthetic_chat import CHAT_FORMATS, write_synthetic_chat
+
+# Parser throughput benchmark on synthetic exports. Each parse runs in a fresh
+# interpreter so peak RSS belongs to that parse alone.
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+DEFAULT_OUTPUT = os.path.join("benchmarks", "parser_benchmark.json")
+
+
+def peak_rss_bytes(who=resource.RUSAGE_SELF) -> int:
+    """ru_maxrss is in kilobytes on Linux and in bytes on macOS."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_child(path: str, workers: int) -> dict:
+    """Parses one file in this process and returns its measurements."""
+    from utils.parser import parse_whatsapp_chat
+
+    baseline_rss = peak_rss_bytes()
+    start = time.perf_counter()
+    if workers > 1:
+        df = parse_whatsapp_chat(pathlib.Path(path), workers=workers)
+    else:
+        with open(path, "rb") as chat_file:
+            df = parse_whatsapp_chat(chat_file, workers=1)
+    seconds = time.perf_counter() - start
+
+    return {
+        "seconds": seconds,
+        "messages": len(df),
+        "baseline_rss_bytes": baseline_rss,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "peak_worker_rss_bytes": peak_rss_bytes(resource.RUSAGE_CHILDREN),
+    }
+
+
+def run_case(path: str, workers: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", path, "--workers", str(workers)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def verify_workers(path: str, workers: int) -> bool:
+    """Checks that the parallel parser returns exactly the serial result, sharding even small files."""
+    from utils import parser
+
+    with open(path, "rb") as chat_file:
+        serial_df = parser.parse_whatsapp_chat(chat_file, workers=1)
+    min_bytes, parser.PARALLEL_MIN_BYTES = parser.PARALLEL_MIN_BYTES, 0
+    try:
+        parallel_df = parser.parse_whatsapp_chat(pathlib.Path(path), workers=workers)
+    finally:
+        parser.PARALLEL_MIN_BYTES = min_bytes
+    return serial_df.equals(parallel_df)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark parse_whatsapp_chat on synthetic exports.")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Line counts to generate.")
+    arg_parser.add_argument("--formats", nargs="+", default=list(CHAT_FORMATS), choices=list(CHAT_FORMATS))
+    arg_parser.add_argument("--workers", type=int, default=1, help="Parser processes per parse.")
+    arg_parser.add_argument("--authors", type=int, default=20)
+    arg_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file the results are written to.")
+    arg_parser.add_argument("--verify-workers", type=int, default=0, metavar="N",
+                            help="Also check that parsing with N workers matches the serial parser.")
+    arg_parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.workers)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="cip-bench-") as tmp_dir:
+        for chat_format in args.formats:
+            for n_lines in args.sizes:
+                path = os.path.join(tmp_dir, f"{chat_format}-{n_lines}.txt")
+                n_bytes = write_synthetic_chat(path, n_lines, chat_format=chat_format, n_authors=args.authors)
+                measurement = run_case(path, args.workers)
+                result = {
+                    "format": chat_format,
+                    "lines": n_lines,
+                    "bytes": n_bytes,
+                    "workers": args.workers,
+                    **measurement,
+                    "lines_per_second": n_lines / measurement["seconds"],
+                    "messages_per_second": measurement["messages"] / measurement["seconds"],
+                    "megabytes_per_second": n_bytes / measurement["seconds"] / 1e6,
+                }
+                if args.verify_workers > 1:
+                    result["parallel_matches_serial"] = verify_workers(path, args.verify_workers)
+                os.remove(path)
+
+                results.append(result)
+                print(f"{chat_format:>9} {n_lines:>11,} lines  {result['seconds']:8.2f}s  "
+                      f"{result['lines_per_second']:>12,.0f} lines/s  {result['messages_per_second']:>12,.0f} msg/s  "
+                      f"peak RSS {result['peak_rss_bytes'] / 2**20:8.1f} MiB")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
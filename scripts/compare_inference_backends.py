@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+# Allow running as `python scripts/compare_inference_backends.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nlp.batching import run_token_batches
+from nlp.engine import SUMMARIZATION_MAX_LENGTH, SUMMARIZATION_MIN_LENGTH
+from nlp.models import (
+    INFERENCE_BACKENDS, load_ner_pipeline, load_sentiment_pipeline, load_summarization_pipeline,
+    load_toxicity_pipeline,
+)
+from utils.synthetic_chat import random_text
+
+# Accuracy parity and speed of the int8 and ONNX backends against fp32 torch,
+# per model, on a fixed evaluation set.
+
+EVALUATION_MESSAGES = [
+    "Thanks so much everyone, the meetup yesterday was fantastic!",
+    "This update is terrible, the battery drains in two hours.",
+    "ok",
+    "😂😂😂",
+    "Can someone share the link to the Google Meet?",
+    "Apple and Samsung both announced new phones in Berlin today.",
+    "Elon Musk said Tesla will open a factory in India next year.",
+    "You are an idiot and nobody wants you in this group.",
+    "Shut up, this is the dumbest thing I have ever read.",
+    "I'm not sure the new pricing makes sense for students.",
+    "Great job on the release, the bug with the login screen is finally fixed 👍",
+    "Meeting moved to Friday 5pm at the Microsoft office in London.",
+    "Why is the app so slow again? This is getting ridiculous.",
+    "Happy birthday Priya! 🎉 Have a wonderful year ahead.",
+    "The Amazon delivery never arrived, customer support was useless.",
+    "Please stop spamming the group with these forwards.",
+    "Does anyone know if the Python workshop by Google is still on?",
+    "I love how helpful this community is, you guys are the best ❤️",
+    "What a waste of time, total garbage product.",
+    "Reminder: the deadline for the project report is Monday.",
+]
+N_SYNTHETIC_MESSAGES = 300
+N_LONG_MESSAGES = 8
+LONG_MESSAGE_WORDS = 600
+
+MODELS = {
+    "sentiment": load_sentiment_pipeline,
+    "ner": load_ner_pipeline,
+    "toxicity": load_toxicity_pipeline,
+    "summarization": load_summarization_pipeline,
+}
+DEFAULT_OUTPUT = os.path.join("benchmarks", "inference_backends.json")
+
+
+def evaluation_set(seed: int = 0):
+    """Returns (short messages, long messages), the same on every run."""
+    rng = random.Random(seed)
+    messages = EVALUATION_MESSAGES + [random_text(rng) for _ in range(N_SYNTHETIC_MESSAGES)]
+    long_messages = []
+    for _ in range(N_LONG_MESSAGES):
+        words = []
+        while len(words) < LONG_MESSAGE_WORDS:
+            words.extend((random_text(rng) + ".").split())
+        long_messages.append(" ".join(words))
+    return messages, long_messages
+
+
+def run_model(model_key: str, pipe, messages: list, long_messages: list) -> list:
+    if model_key == "summarization":
+        results = pipe(long_messages, min_length=SUMMARIZATION_MIN_LENGTH, max_length=SUMMARIZATION_MAX_LENGTH,
+                       truncation=True, batch_size=len(long_messages))
+        return [result["summary_text"] for result in results]
+    return run_token_batches(pipe, messages)
+
+
+def classification_parity(reference: list, candidate: list) -> dict:
+    agree = sum(ref["label"] == cand["label"] for ref, cand in zip(reference, candidate))
+    score_diffs = [abs(float(ref["score"]) - float(cand["score"])) for ref, cand in zip(reference, candidate)]
+    return {
+        "label_agreement": agree / len(reference),
+        "mean_abs_score_diff": sum(score_diffs) / len(score_diffs),
+        "max_abs_score_diff": max(score_diffs),
+    }
+
+
+def ner_parity(reference: list, candidate: list) -> dict:
+    """Micro F1 of the (entity_group, word) pairs found per message, taking fp32 as ground truth."""
+    true_positives = n_reference = n_candidate = 0
+    for ref_entities, cand_entities in zip(reference, candidate):
+        ref_set = {(entity["entity_group"], entity["word"]) for entity in ref_entities}
+        cand_set = {(entity["entity_group"], entity["word"]) for entity in cand_entities}
+        true_positives += len(ref_set & cand_set)
+        n_reference += len(ref_set)
+        n_candidate += len(cand_set)
+    precision = true_positives / n_candidate if n_candidate else 1.0
+    recall = true_positives / n_reference if n_reference else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"entity_precision": precision, "entity_recall": recall, "entity_f1": f1}
+
+
+def summary_parity(reference: list, candidate: list) -> dict:
+    overlaps = []
+    for ref, cand in zip(reference, candidate):
+        ref_words, cand_words = set(ref.split()), set(cand.split())
+        union = ref_words | cand_words
+        overlaps.append(len(ref_words & cand_words) / len(union) if union else 1.0)
+    return {
+        "exact_match": sum(ref == cand for ref, cand in zip(reference, candidate)) / len(reference),
+        "mean_word_jaccard": sum(overlaps) / len(overlaps),
+    }
+
+
+PARITY_FUNCTIONS = {
+    "sentiment": classification_parity,
+    "toxicity": classification_parity,
+    "ner": ner_parity,
+    "summarization": summary_parity,
+}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare inference backends against fp32 torch.")
+    arg_parser.add_argument("--models", nargs="+", default=list(MODELS), choices=list(MODELS))
+    arg_parser.add_argument("--backends", nargs="+", default=list(INFERENCE_BACKENDS), choices=INFERENCE_BACKENDS)
+    arg_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file the results are written to.")
+    args = arg_parser.parse_args()
+
+    messages, long_messages = evaluation_set()
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+
+    results = []
+    for model_key in args.models:
+        reference, reference_seconds = None, None
+        n_inputs = len(long_messages) if model_key == "summarization" else len(messages)
+        for backend in backends:
+            pipe = MODELS[model_key](backend=backend)
+            if pipe is None:
+                print(f"{model_key:>13} {backend:>5}: failed to load, skipped")
+                continue
+            run_model(model_key, pipe, messages[:8], long_messages[:1])  # Warm-up
+            start = time.perf_counter()
+            outputs = run_model(model_key, pipe, messages, long_messages)
+            seconds = time.perf_counter() - start
+
+            if backend == "torch":
+                reference, reference_seconds = outputs, seconds
+            result = {
+                "model": model_key,
+                "backend": backend,
+                "backend_used": getattr(pipe, "inference_backend", backend),
+                "inputs": n_inputs,
+                "seconds": seconds,
+                "inputs_per_second": n_inputs / seconds,
+                "speedup_vs_torch": reference_seconds / seconds if reference_seconds else None,
+                **(PARITY_FUNCTIONS[model_key](reference, outputs) if reference is not None else {}),
+            }
+            results.append(result)
+            parity = {key: round(value, 4) for key, value in result.items()
+                      if key not in ("model", "backend", "backend_used", "inputs", "seconds")
+                      and isinstance(value, float)}
+            print(f"{model_key:>13} {backend:>5}: {json.dumps(parity)}")
+            del pipe
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "evaluation_set": {"messages": len(messages), "long_messages": len(long_messages)},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+# Allow running as `python scripts/evaluate_cascade.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Time the models, not the inference cache
+os.environ["CIP_INFERENCE_CACHE_PATH"] = ""
+
+from nlp.cascade import CASCADE_RESOLVERS, message_features
+from nlp.engine import factorize_texts, run_pipeline_cached
+from nlp.inference_cache import normalise_text
+from nlp.models import (
+    NER_MODEL_NAME, SENTIMENT_MODEL_NAME, TOXICITY_MODEL_NAME, load_ner_pipeline, load_sentiment_pipeline,
+    load_toxicity_pipeline,
+)
+from utils.parser import parse_whatsapp_chat
+from utils.synthetic_chat import random_text
+
+# How much of a chat the cascade prefilter (nlp/cascade.py) settles without a
+# model, and how often its answers agree with the full models on those messages.
+# Best run on a real export (--chat); the default set mixes typical short chat
+# messages with synthetic ones.
+
+CHAT_MESSAGES = [
+    "ok", "Ok 👍", "okay", "yes", "no", "sure", "k", "👍", "😂😂😂", "🙏", "😢", "❤️", "🎉🎉",
+    "thanks!", "thank you so much", "great", "awesome 🔥", "sorry", "congrats!!", "good morning",
+    "https://maps.google.com/?q=52.52,13.40", "www.example.com", "12:30", "+49 170 1234567", "2", "?", "...",
+    "not good", "This update is terrible, the battery drains in two hours.",
+    "Apple and Samsung both announced new phones in Berlin today.",
+    "meeting moved to friday at the microsoft office in london",
+    "You are an idiot and nobody wants you in this group.", "shut up", "what a waste of time",
+    "Happy birthday Priya! 🎉", "Can someone share the link to the Google Meet?", "नमस्ते दोस्तों",
+    "lol", "haha that's hilarious", "i'm not sure about this", "see you tomorrow", "Reminder: deadline is Monday.",
+]
+N_SYNTHETIC_MESSAGES = 500
+STAGES = {
+    "sentiment": (load_sentiment_pipeline, SENTIMENT_MODEL_NAME),
+    "ner": (load_ner_pipeline, NER_MODEL_NAME),
+    "toxicity": (load_toxicity_pipeline, TOXICITY_MODEL_NAME),
+}
+DEFAULT_OUTPUT = os.path.join("benchmarks", "cascade_evaluation.json")
+
+
+def evaluation_messages(chat_path: str = None, seed: int = 0) -> list:
+    if chat_path:
+        with open(chat_path, "rb") as chat_file:
+            df = parse_whatsapp_chat(chat_file)
+        messages = df.loc[(~df['is_system']) & (df['message_type'] == 'text'), 'message'].dropna().tolist()
+    else:
+        rng = random.Random(seed)
+        messages = CHAT_MESSAGES + [random_text(rng) for _ in range(N_SYNTHETIC_MESSAGES)]
+    _, unique_messages = factorize_texts(messages)
+    return [normalise_text(message) for message in unique_messages]
+
+
+def agrees(stage: str, cascade_result, model_result) -> bool:
+    if stage == "ner":
+        return len(cascade_result) == len(model_result)
+    if stage == "toxicity":
+        # Compared the way enrich_df_with_nlp labels messages
+        return (model_result['label'] == 'toxic') == (cascade_result['label'] == 'toxic')
+    return cascade_result['label'].lower() == model_result['label'].lower()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Evaluate the cascade prefilter against the full models.")
+    arg_parser.add_argument("--chat", help="WhatsApp export to take the messages from (default: built-in set).")
+    arg_parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    arg_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file the results are written to.")
+    args = arg_parser.parse_args()
+
+    texts = evaluation_messages(args.chat)
+    features = message_features(texts)
+
+    results = []
+    for stage in args.stages:
+        loader, model_name = STAGES[stage]
+        start = time.perf_counter()
+        resolved = CASCADE_RESOLVERS[stage](features)
+        cascade_seconds = time.perf_counter() - start
+
+        pipe = loader()
+        start = time.perf_counter()
+        model_results = run_pipeline_cached(pipe, model_name, texts)
+        model_seconds = time.perf_counter() - start
+
+        resolved_indices = [i for i, result in enumerate(resolved) if result is not None]
+        routed_fraction = 1 - len(resolved_indices) / len(texts)
+        disagreements = [texts[i] for i in resolved_indices if not agrees(stage, resolved[i], model_results[i])]
+        n_agree = len(resolved_indices) - len(disagreements)
+        result = {
+            "stage": stage,
+            "messages": len(texts),
+            "resolved": len(resolved_indices),
+            "routed_fraction": routed_fraction,
+            "agreement_on_resolved": n_agree / len(resolved_indices) if resolved_indices else None,
+            "overall_agreement": (len(texts) - len(disagreements)) / len(texts),
+            "cascade_seconds": cascade_seconds,
+            "model_seconds": model_seconds,
+            # The model only sees the routed messages, so its time shrinks roughly by that fraction
+            "estimated_speedup": model_seconds / (cascade_seconds + model_seconds * routed_fraction),
+            "disagreement_examples": disagreements[:20],
+        }
+        results.append(result)
+        print(f"{stage:>9}: routed {result['routed_fraction']:.1%}, agreement on resolved "
+              f"{result['agreement_on_resolved'] or 0:.1%}, estimated speedup x{result['estimated_speedup']:.2f}")
+        del pipe
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "source": args.chat or "built-in",
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+
+# Allow running as `python scripts/simulate_serving.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from nlp.batching import run_token_batches
+from nlp.models import MODEL_LOADERS, SENTIMENT_MODEL_NAME, TOXICITY_MODEL_NAME
+from nlp.serving import SERVING_MAX_BATCH_TEXTS, SERVING_MAX_WAIT_MS, ModelServer
+from utils.synthetic_chat import random_text
+
+# N simulated users analysing chats at the same time against one copy of a model:
+# each calls the shared pipeline on its own thread ("direct", what concurrent
+# sessions do without serving), or submits to one ModelServer that merges their
+# requests into full batches ("served"). Reports aggregate throughput and
+# per-request latency for both.
+
+SIMULATION_MODELS = {"sentiment": SENTIMENT_MODEL_NAME, "toxicity": TOXICITY_MODEL_NAME}
+DEFAULT_OUTPUT = os.path.join("benchmarks", "serving_simulation.json")
+
+
+def user_workload(user: int, n_requests: int, mean_request_texts: int, seed: int) -> list:
+    """The requests of one user: lists of texts of varying size, the same on every run."""
+    rng = random.Random(seed * 1000 + user)
+    requests = []
+    for _ in range(n_requests):
+        n_texts = max(1, min(int(rng.expovariate(1 / mean_request_texts)), mean_request_texts * 8))
+        requests.append([random_text(rng) for _ in range(n_texts)])
+    return requests
+
+
+def simulate(infer, workloads: list, think_seconds: float, seed: int) -> dict:
+    """Runs every user's requests on its own thread; returns throughput and latency figures."""
+    latencies = []
+    latencies_lock = threading.Lock()
+    errors = []
+
+    def user(index: int, requests: list):
+        rng = random.Random(seed + index)
+        for texts in requests:
+            time.sleep(rng.expovariate(1 / think_seconds) if think_seconds > 0 else 0)
+            started = time.perf_counter()
+            try:
+                infer(texts)
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            with latencies_lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=user, args=(i, requests)) for i, requests in enumerate(workloads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    n_texts = sum(len(texts) for requests in workloads for texts in requests)
+    latency = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "seconds": seconds,
+        "requests": len(latencies),
+        "texts": n_texts,
+        "texts_per_second": n_texts / seconds,
+        "latency_p50_seconds": float(np.percentile(latency, 50)),
+        "latency_p95_seconds": float(np.percentile(latency, 95)),
+        "latency_p99_seconds": float(np.percentile(latency, 99)),
+        "latency_max_seconds": float(latency.max()),
+        "errors": errors[:10],
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Simulate concurrent users with and without the model server.")
+    arg_parser.add_argument("--model", default="sentiment", choices=list(SIMULATION_MODELS))
+    arg_parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8])
+    arg_parser.add_argument("--requests", type=int, default=10, help="Requests per user.")
+    arg_parser.add_argument("--mean-request-texts", type=int, default=32,
+                            help="Mean texts per request (exponentially distributed).")
+    arg_parser.add_argument("--think-seconds", type=float, default=0.05, help="Mean pause between a user's requests.")
+    arg_parser.add_argument("--max-batch", type=int, default=SERVING_MAX_BATCH_TEXTS)
+    arg_parser.add_argument("--max-wait-ms", type=float, default=SERVING_MAX_WAIT_MS)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file the results are written to.")
+    args = arg_parser.parse_args()
+
+    model_name = SIMULATION_MODELS[args.model]
+    pipe = MODEL_LOADERS[model_name]()
+    if pipe is None:
+        sys.exit(f"Could not load {model_name}.")
+    run_token_batches(pipe, [random_text(random.Random(args.seed)) for _ in range(32)])  # Warm-up
+
+    results = []
+    for n_users in args.users:
+        workloads = [user_workload(user, args.requests, args.mean_request_texts, args.seed) for user in range(n_users)]
+        direct = simulate(lambda texts: run_token_batches(pipe, texts), workloads, args.think_seconds, args.seed)
+
+        server = ModelServer(pipe, model_name, max_batch_texts=args.max_batch, max_wait_ms=args.max_wait_ms)
+        served = simulate(server.infer, workloads, args.think_seconds, args.seed)
+        served["server"] = server.stats()
+        server.close()
+
+        result = {
+            "users": n_users,
+            "direct": direct,
+            "served": served,
+            "throughput_gain": served["texts_per_second"] / direct["texts_per_second"],
+        }
+        results.append(result)
+        print(f"users={n_users:<3} direct {direct['texts_per_second']:8.1f} texts/s "
+              f"p95 {direct['latency_p95_seconds']:6.2f}s | served {served['texts_per_second']:8.1f} texts/s "
+              f"p95 {served['latency_p95_seconds']:6.2f}s (mean batch {served['server']['mean_batch_texts']:.0f})  x{result['throughput_gain']:.2f}")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model": model_name,
+        "settings": {
+            "requests_per_user": args.requests,
+            "mean_request_texts": args.mean_request_texts,
+            "think_seconds": args.think_seconds,
+            "max_batch_texts": args.max_batch,
+            "max_wait_ms": args.max_wait_ms,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import pandas as pd
+
+from utils.analysis_store import load_analysis, merge_analyses, save_analysis
+from utils.parser import parse_whatsapp_chat
+
+ENTITY = {"entity_group": "ORG", "score": 0.5, "word": "Acme", "start": 0, "end": 4}
+
+
+def enriched_chat(n_messages: int) -> pd.DataFrame:
+    chat = "".join(f"15/01/2023, 10:{i % 60:02d} - User {i % 3}: Acme update {i}\n" for i in range(n_messages))
+    df = parse_whatsapp_chat(chat)
+    df["sentiment_label"] = "NEUTRAL"
+    df["entities"] = [[dict(ENTITY)] if i % 2 == 0 else [] for i in range(len(df))]
+    return df
+
+
+def test_entities_roundtrip_as_lists_of_dicts(tmp_path):
+    df = enriched_chat(50)
+    assert save_analysis("chat", df, store_dir=str(tmp_path))
+
+    loaded = load_analysis("chat", store_dir=str(tmp_path))
+    assert loaded is not None
+    # The views format entities with Series.apply, which must see lists, not arrays
+    assert loaded["entities"].apply(lambda entities: isinstance(entities, list)).all()
+    assert loaded["entities"].tolist() == df["entities"].tolist()
+    assert loaded.drop(columns="entities").equals(df.drop(columns="entities"))
+
+
+def test_reloaded_analysis_saves_and_merges_unchanged(tmp_path):
+    df = enriched_chat(50)
+    save_analysis("chat", df, store_dir=str(tmp_path))
+    loaded = load_analysis("chat", store_dir=str(tmp_path))
+
+    # Saving a reloaded analysis again must not lose its entities
+    save_analysis("again", loaded, store_dir=str(tmp_path))
+    assert load_analysis("again", store_dir=str(tmp_path))["entities"].tolist() == df["entities"].tolist()
+
+    tail = enriched_chat(60).iloc[len(df):].reset_index(drop=True)
+    merged = merge_analyses(loaded, tail)
+    assert merged["entities"].tolist() == df["entities"].tolist() + tail["entities"].tolist()
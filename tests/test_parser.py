@@ -0,0 +1,70 @@
+import io
+import pathlib
+import zipfile
+
+import pytest
+
+from utils import parser
+from utils.analysis_store import HashingReader, hash_upload
+from utils.synthetic_chat import CHAT_FORMATS, generate_synthetic_chat, write_synthetic_chat
+
+# The multi-process parser must return exactly what the serial parser returns.
+# PARALLEL_MIN_BYTES is lifted so that these small chats are sharded too. Chats
+# read once out of a ZIP archive must parse the same in a single pass.
+
+WORKERS = 2
+N_LINES = 3_000
+
+
+@pytest.fixture(autouse=True)
+def shard_small_chats(monkeypatch):
+    monkeypatch.setattr(parser, "PARALLEL_MIN_BYTES", 0)
+
+
+def parse_both(data: bytes):
+    return parser.parse_whatsapp_chat(data, workers=1), parser.parse_whatsapp_chat(data, workers=WORKERS)
+
+
+@pytest.mark.parametrize("chat_format", list(CHAT_FORMATS))
+def test_parallel_matches_serial(chat_format):
+    data = generate_synthetic_chat(N_LINES, chat_format=chat_format).encode("utf-8")
+    serial_df, parallel_df = parse_both(data)
+    assert len(serial_df) > 0
+    assert serial_df.equals(parallel_df)
+
+
+@pytest.mark.parametrize("chat_format", list(CHAT_FORMATS))
+def test_parallel_matches_serial_from_path(chat_format, tmp_path):
+    path = tmp_path / "chat.txt"
+    write_synthetic_chat(str(path), N_LINES, chat_format=chat_format)
+    serial_df = parser.parse_whatsapp_chat(path.read_bytes(), workers=1)
+    parallel_df = parser.parse_whatsapp_chat(pathlib.Path(path), workers=WORKERS)
+    assert serial_df.equals(parallel_df)
+
+
+def test_shard_split_inside_multiline_message():
+    # Every message spans several lines, so the even split points land inside messages
+    data = generate_synthetic_chat(N_LINES, multiline_ratio=1.0, system_ratio=0.0, media_ratio=0.0,
+                                   deleted_ratio=0.0, file_ratio=0.0).encode("utf-8")
+    n_shards = WORKERS * parser.SHARDS_PER_WORKER
+    split_offsets = [len(data) * i // n_shards for i in range(1, n_shards)]
+    assert not all(parser.is_message_boundary(io.BytesIO(data), offset) for offset in split_offsets)
+
+    serial_df, parallel_df = parse_both(data)
+    assert serial_df["message"].iloc[1:].str.contains("\n").all()
+    assert serial_df.equals(parallel_df)
+
+
+
+@pytest.mark.parametrize("chat_format", list(CHAT_FORMATS))
+def test_single_pass_parse_of_zip_entry(chat_format):
+    text = generate_synthetic_chat(N_LINES, chat_format=chat_format)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr("WhatsApp Chat.txt", text)
+    with zipfile.ZipFile(archive) as zip_ref, zip_ref.open("WhatsApp Chat.txt") as entry:
+        reader = HashingReader(entry)
+        df, dialect = parser.parse_whatsapp_chat_once(reader)
+    assert df.equals(parser.parse_whatsapp_chat(text, workers=1))
+    assert dialect == parser.detect_export_dialect(text.encode("utf-8"))
+    assert reader.hexdigest() == hash_upload(text.encode("utf-8"))
@@ -0,0 +1,21 @@
+import streamlit as st
+
+from nlp.engine import STAGE_ERROR_NAMES, missing_nlp_stages
+
+# Views render the sections whose NLP stage is done and explain the others: a
+# stage is either still running, or failed, in which case app.py keeps its error
+# in st.session_state.nlp_errors (chat name -> {stage: error}).
+
+
+def stage_available(df_display, stage: str) -> bool:
+    return not missing_nlp_stages(df_display, (stage,))
+
+
+def show_stage_unavailable(stage: str):
+    """Explains why a section that needs `stage` is left out."""
+    chat_name = st.session_state.get("current_file_name")
+    error = st.session_state.get("nlp_errors", {}).get(chat_name, {}).get(stage)
+    if error is not None:
+        st.warning(f"{STAGE_ERROR_NAMES[stage]} failed, so this part is not available: {error}")
+    else:
+        st.info(f"{STAGE_ERROR_NAMES[stage]} results are not available yet.")
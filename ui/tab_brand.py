@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 from visuals import charts
 import plotly.graph_objects as go
+from .stage_status import stage_available, show_stage_unavailable
 
 def create_metric_card(title, value, sparkline_data=None, help_text=""):
     """Helper function to create a visually appealing metric card."""
@@ -37,8 +38,13 @@ def render_brand_intelligence_tab(df_display: pd.DataFrame):
     st.header("💡 Brand & Topic Intelligence")
     st.info("Analyze sentiment and activity around specific keywords. Use our suggestions or enter your own.")
 
+    # Sections whose NLP stage is missing are left out or shown as n/a
+    for stage in ("ner", "sentiment", "toxicity"):
+        if not stage_available(df_display, stage):
+            show_stage_unavailable(stage)
+
     # --- Step 1: Intelligent Topic Suggestions ---
-    suggested_topics = charts.get_suggested_topics(df_display)
+    suggested_topics = charts.get_suggested_topics(df_display) if stage_available(df_display, "ner") else []
     
     if suggested_topics:
         st.markdown("**Suggested Topics (from NER):**")
@@ -103,18 +109,24 @@ def render_brand_intelligence_tab(df_display: pd.DataFrame):
             neg_ratio = metrics.get('negative_ratio', 0)
             net_sentiment = pos_ratio - neg_ratio
             
-            create_metric_card(
-                "Net Sentiment",
-                f"{net_sentiment:.1f}%",
-                help_text=f"({pos_ratio:.1f}% Positive vs. {neg_ratio:.1f}% Negative)"
-            )
+            if stage_available(df_display, "sentiment"):
+                create_metric_card(
+                    "Net Sentiment",
+                    f"{net_sentiment:.1f}%",
+                    help_text=f"({pos_ratio:.1f}% Positive vs. {neg_ratio:.1f}% Negative)"
+                )
+            else:
+                create_metric_card("Net Sentiment", "n/a", help_text="Sentiment results are not available.")
 
         with col3:
             avg_toxicity = metrics.get('avg_toxicity', 0)
-            create_metric_card(
-                "Avg. Toxicity",
-                f"{avg_toxicity:.3f}",
-                help_text="Average toxicity score for messages mentioning this topic."
-            )
+            if stage_available(df_display, "toxicity"):
+                create_metric_card(
+                    "Avg. Toxicity",
+                    f"{avg_toxicity:.3f}",
+                    help_text="Average toxicity score for messages mentioning this topic."
+                )
+            else:
+                create_metric_card("Avg. Toxicity", "n/a", help_text="Toxicity results are not available.")
         
         st.markdown("---") # Separator for the next topic
\ No newline at end of file
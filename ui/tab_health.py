@@ -1,5 +1,6 @@
 import streamlit as st 
 from visuals import charts 
+from .stage_status import stage_available, show_stage_unavailable
 
 def render_health_tab(df_display):
     st.subheader("Community Health & Moderation Dashboard")
@@ -11,7 +12,7 @@ def render_health_tab(df_display):
     st.markdown("#### ⚠️ Messages Flagged for Review")
     st.caption("Messages automatically flagged as potentially toxic, sorted by confidence score.")
 
-    if 'toxicity_label' in df_display.columns:
+    if stage_available(df_display, "toxicity"):
         flagged_df = df_display[df_display['toxicity_label'] == 'toxic'].sort_values('toxicity_score', ascending=False)
         
         if not flagged_df.empty:
@@ -23,7 +24,7 @@ def render_health_tab(df_display):
         else:
             st.success("✅ No toxic messages were detected in the current selection.")
     else:
-        st.warning("Toxicity analysis was not performed. Data not available.")
+        show_stage_unavailable("toxicity")
 
     st.markdown("---")
     
@@ -31,6 +32,9 @@ def render_health_tab(df_display):
     st.markdown("#### 🏆 Community Champions Leaderboard")
     st.caption("Users ranked by a 'Contribution Score' based on their activity and positivity.")
 
+    if not stage_available(df_display, "sentiment"):
+        show_stage_unavailable("sentiment")
+        return
     champions_df = charts.get_community_champions_df(df_display, top_n=10)
     if not champions_df.empty:
         st.dataframe(champions_df, use_container_width=True)
@@ -0,0 +1,62 @@
+import streamlit as st
+import pandas as pd
+
+from utils.perf import perf_json, perf_prometheus, perf_records, peak_rss_bytes, reset_perf
+
+KIND_TITLES = {
+    "parse": "Parsing",
+    "model_load": "Model Loading",
+    "stage": "NLP Stages",
+    "serve": "Model Servers",
+    "view": "Dashboard Views",
+    "chart": "Chart Builders",
+}
+COLUMNS = {
+    "name": "Name",
+    "calls": "Calls",
+    "seconds": "Total (s)",
+    "max_seconds": "Slowest (s)",
+    "last_seconds": "Last (s)",
+    "items": "Messages",
+    "items_per_second": "Messages/s",
+    "tokens": "Tokens",
+    "tokens_per_second": "Tokens/s",
+    "mean_batch_texts": "Mean Batch",
+    "max_batch_texts": "Max Batch",
+    "rss_growth_bytes": "Peak RSS Rise (MiB)",
+}
+
+
+def render_performance_tab(df_display):
+    st.subheader("Where the Time Goes")
+    st.caption("Counters of this server process since it started (or was reset), across all sessions.")
+
+    records = perf_records()
+    peak = peak_rss_bytes()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Peak Memory (RSS)", f"{peak / 2**20:,.0f} MiB" if peak is not None else "n/a")
+    col2.metric("Model Time", f"{sum(r['seconds'] for r in records if r['kind'] == 'stage'):,.1f} s")
+    col3.metric("Model Loading", f"{sum(r['seconds'] for r in records if r['kind'] == 'model_load'):,.1f} s")
+
+    if not records:
+        st.info("Nothing measured yet. Run an analysis and open some views.")
+        return
+
+    df_perf = pd.DataFrame(records)
+    df_perf["rss_growth_bytes"] = df_perf["rss_growth_bytes"] / 2**20
+    for kind, title in KIND_TITLES.items():
+        df_kind = df_perf[df_perf["kind"] == kind].sort_values("seconds", ascending=False)
+        if df_kind.empty:
+            continue
+        st.markdown(f"#### {title}")
+        columns = [column for column in COLUMNS if df_kind[column].notna().any() and (df_kind[column] != 0).any()]
+        st.dataframe(df_kind[columns].rename(columns=COLUMNS), use_container_width=True, hide_index=True)
+
+    st.markdown("---")
+    col1, col2, col3 = st.columns(3)
+    col1.download_button("Download JSON", perf_json(), file_name="performance.json", mime="application/json")
+    col2.download_button("Download Prometheus metrics", perf_prometheus(), file_name="performance.prom",
+                         mime="text/plain")
+    if col3.button("Reset counters"):
+        reset_perf()
+        st.rerun()
@@ -8,30 +8,54 @@ from .tab_ner import render_ner_tab
 from .tab_dynamics import render_dynamics_tab
 from .tab_health import render_health_tab
 from .tab_download import render_download_tab
+from .tab_performance import render_performance_tab
+from .stage_status import show_stage_unavailable
+from nlp.engine import missing_nlp_stages
+from utils.perf import measure
 
-def render_dashboard(df_processed: pd.DataFrame):
+# Views of the dashboard and the NLP stages (see nlp.engine.NLP_STAGES) each one uses.
+# A view with some of its stages missing still renders the sections it can.
+VIEWS = {
+    "📊 Overview": (render_overview_tab, ()),
+    "😊 Sentiment": (render_sentiment_tab, ("sentiment",)),
+    "💡 Brand Intelligence": (render_brand_intelligence_tab, ("sentiment", "ner", "toxicity")),
+    "📝 NER": (render_ner_tab, ("ner",)),
+    "🌐 Dynamics": (render_dynamics_tab, ()),
+    "🛡️ Health": (render_health_tab, ("sentiment", "toxicity")),
+    "💾 Download": (render_download_tab, ()),  # Exports whatever columns exist
+    "⏱️ Performance": (render_performance_tab, ()),
+}
+
+
+def apply_filters(df_processed: pd.DataFrame, selected_author: str, keyword: str) -> pd.DataFrame:
+    """Returns the messages matching the sidebar author and keyword filters."""
+    df_display = df_processed
+    if selected_author != "All Authors":
+        df_display = df_display[df_display['author'] == selected_author]
+    if keyword:
+        df_display = df_display[df_display['message'].astype(str).str.contains(keyword, case=False, na=False)]
+    return df_display
+
+
+def render_dashboard(df_processed: pd.DataFrame, ensure_stages=None):
     """
-    Renders the entire dashboard, including sidebar filters and all tabs,
-    based on the processed DataFrame.
+    Renders the entire dashboard, including sidebar filters and the selected view,
+    based on the processed DataFrame. Only the selected view is rendered: if it
+    needs NLP results the DataFrame doesn't have yet, `ensure_stages(stages)` is
+    called to compute them and returns the enriched DataFrame.
     """
     # --- Sidebar Filters ---
     st.sidebar.markdown("---")
     st.sidebar.subheader("Dashboard Filters")
-    
-    # Create a filterable copy of the data
-    df_display = df_processed.copy()
 
     # Author Filter
-    unique_authors = sorted(list(df_display[~df_display['is_system']]['author'].astype(str).unique()))
+    unique_authors = sorted(list(df_processed[~df_processed['is_system']]['author'].astype(str).unique()))
     selected_author = st.sidebar.selectbox("Filter by Author:", ["All Authors"] + unique_authors)
-    if selected_author != "All Authors":
-        df_display = df_display[df_display['author'] == selected_author]
 
     # Keyword Filter
     keyword = st.sidebar.text_input("Filter by Keyword (case-insensitive):")
-    if keyword:
-        df_display = df_display[df_display['message'].astype(str).str.contains(keyword, case=False, na=False)]
-        
+    df_display = apply_filters(df_processed, selected_author, keyword)
+
     # --- Main Dashboard Area ---
     st.header("Analysis Dashboard")
     st.caption(f"Displaying results for: **{st.session_state.get('current_file_name', 'your chat')}**")
@@ -46,25 +70,26 @@ def render_dashboard(df_processed: pd.DataFrame):
     col2.metric("Active Participants (filtered)", f"{df_display[~df_display['is_system']]['author'].nunique()}")
     col3.metric("Media Messages (filtered)", f"{len(df_display[df_display['message_type'] == 'media'])}")
 
-    # --- Tabs ---
-    tab_titles = ["📊 Overview", "😊 Sentiment", "💡 Brand Intelligence", "📝 NER", "🌐 Dynamics", "🛡️ Health", "💾 Download"]
-    tabs = st.tabs(tab_titles)
+    # --- Views ---
+    # A selector rather than st.tabs: tabs render every tab on each run, which would
+    # run every NLP model before the Overview could be shown
+    selected_view = st.radio("View", list(VIEWS), horizontal=True, label_visibility="collapsed", key="active_view")
+    render_view, stages = VIEWS[selected_view]
+
+    if ensure_stages is not None and stages:
+        enriched_df = ensure_stages(stages)
+        if enriched_df is not df_processed:
+            df_processed = enriched_df
+            df_display = apply_filters(df_processed, selected_author, keyword)
+    missing = missing_nlp_stages(df_processed, stages)
+    if stages and len(missing) == len(stages):
+        for stage in missing:
+            show_stage_unavailable(stage)
+        return
 
-    if 'active_tab_index' not in st.session_state:
-        st.session_state.active_tab_index = 0
-    
-    with tabs[0]:
-        render_overview_tab(df_display)
-    with tabs[1]:
-        render_sentiment_tab(df_display)
-    with tabs[2]:
-        render_brand_intelligence_tab(df_display)
-    with tabs[3]:
-        render_ner_tab(df_display)
-    with tabs[4]:
-        render_dynamics_tab(df_display)
-    with tabs[5]:
-        render_health_tab(df_display)
-    with tabs[6]:
-        # Download tab should have access to the full, unfiltered data
-        render_download_tab(df_processed) 
\ No newline at end of file
+    with measure("view", selected_view, items=len(df_display)):
+        if selected_view == "💾 Download":
+            # Download view should have access to the full, unfiltered data
+            render_view(df_processed)
+        else:
+            render_view(df_display)
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from utils.parser import ChatDialect, concat_chat_chunks
+
+# Persistent, content-addressed store of fully enriched chat DataFrames.
+# Each analysis is one uncompressed Arrow IPC file, so a reload memory-maps the
+# file instead of re-parsing and re-running the NLP models.
+
+ANALYSIS_STORE_DIR = os.environ.get(
+    "CIP_ANALYSIS_STORE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "conversational-intelligence", "analyses"),
+)
+ANALYSIS_STORE_MAX_BYTES = int(os.environ.get("CIP_ANALYSIS_STORE_MAX_BYTES", str(2 << 30)))  # 2 GiB
+HASH_BLOCK_SIZE = 1 << 20  # 1 MiB
+
+# Bump when the stored layout or the enrichment output changes meaning
+STORE_FORMAT_VERSION = "1"
+
+# NER results are lists of entity dicts; storing them as a typed Arrow list keeps
+# them memory-mappable instead of pickling Python objects.
+ENTITIES_TYPE = pa.list_(pa.struct([
+    ("entity_group", pa.string()),
+    ("score", pa.float32()),
+    ("word", pa.string()),
+    ("start", pa.int64()),
+    ("end", pa.int64()),
+]))
+
+
+def hash_upload(file_obj) -> str:
+    """
+    SHA-256 of an uploaded file's raw bytes, read in blocks. Accepts bytes or a
+    binary file-like object, whose position is restored afterwards.
+    """
+    digest = hashlib.sha256()
+    if isinstance(file_obj, (bytes, bytearray, memoryview)):
+        digest.update(file_obj)
+        return digest.hexdigest()
+
+    position = file_obj.tell()
+    file_obj.seek(0)
+    for block in iter(lambda: file_obj.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    file_obj.seek(position)
+    return digest.hexdigest()
+
+
+class HashingReader:
+    """
+    Wraps a binary file that can only be read once (e.g. a ZIP entry), hashing
+    the bytes as a parser reads them. hexdigest() is the upload digest once the
+    file has been read to the end.
+    """
+
+    def __init__(self, file_obj):
+        self._file = file_obj
+        self._digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        block = self._file.read(size)
+        self._digest.update(block)
+        return block
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+def analysis_key(upload_digest: str, model_identifiers) -> str:
+    """Store key for one upload analysed with one set of models."""
+    key_material = "\0".join([STORE_FORMAT_VERSION, upload_digest, *model_identifiers])
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+def analysis_path(key: str, store_dir: str = ANALYSIS_STORE_DIR) -> str:
+    return os.path.join(store_dir, f"{key}.arrow")
+
+
+def fingerprint_path(key: str, store_dir: str = ANALYSIS_STORE_DIR) -> str:
+    return os.path.join(store_dir, f"{key}.json")
+
+
+def load_analysis(key: str, store_dir: str = ANALYSIS_STORE_DIR):
+    """
+    Returns the stored DataFrame for `key`, memory-mapped from disk, or None if
+    it isn't in the store. A hit marks the entry as recently used.
+    """
+    path = analysis_path(key, store_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        table = feather.read_table(path, memory_map=True)
+        columns = [column for column in table.column_names if column != "entities"]
+        df = table.select(columns).to_pandas()
+        if "entities" in table.column_names:
+            # Back to lists of dicts, the shape the NER stage produces and the views expect
+            df["entities"] = pd.Series(table.column("entities").to_pylist(), index=df.index, dtype=object)
+        os.utime(path)  # LRU bookkeeping: mtime is the last access time
+        return df
+    except Exception as e:
+        print(f"Could not load stored analysis '{key}'. Error: {e}")
+        return None
+
+
+def save_analysis(key: str, df: pd.DataFrame, fingerprint: dict = None, store_dir: str = ANALYSIS_STORE_DIR,
+                  max_bytes: int = ANALYSIS_STORE_MAX_BYTES) -> bool:
+    """
+    Writes `df` to the store under `key` and evicts old entries beyond `max_bytes`.
+    An optional `fingerprint` (see build_fingerprint) is saved alongside so later,
+    longer exports of the same chat can be recognised.
+    """
+    try:
+        os.makedirs(store_dir, exist_ok=True)
+        table = dataframe_to_table(df)
+        # Write to a temp file first so readers never see a half-written analysis
+        fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix=".tmp")
+        os.close(fd)
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, analysis_path(key, store_dir))
+        if fingerprint is not None:
+            with open(fingerprint_path(key, store_dir), "w", encoding="utf-8") as fingerprint_file:
+                json.dump(fingerprint, fingerprint_file)
+    except Exception as e:
+        print(f"Could not store analysis '{key}'. Error: {e}")
+        return False
+
+    evict_analyses(max_bytes, store_dir, keep=key)
+    return True
+
+
+def dataframe_to_table(df: pd.DataFrame) -> pa.Table:
+    """Converts an enriched DataFrame to Arrow, giving `entities` an explicit list-of-struct type."""
+    columns = [column for column in df.columns if column != "entities"]
+    table = pa.Table.from_pandas(df[columns], preserve_index=False)
+    if "entities" in df.columns:
+        entities = [value if isinstance(value, list) else [] for value in df["entities"]]
+        table = table.append_column("entities", pa.array(entities, type=ENTITIES_TYPE))
+    return table
+
+
+def evict_analyses(max_bytes: int = ANALYSIS_STORE_MAX_BYTES, store_dir: str = ANALYSIS_STORE_DIR,
+                   keep: str = None) -> int:
+    """
+    Deletes least recently used analyses until the store fits in `max_bytes`.
+    `keep` protects the entry that was just written. Returns the bytes freed.
+    """
+    try:
+        entries = []
+        with os.scandir(store_dir) as scan:
+            for entry in scan:
+                if entry.is_file() and entry.name.endswith(".arrow"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0
+
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total - freed <= max_bytes:
+            break
+        if keep is not None and path == analysis_path(keep, store_dir):
+            continue
+        try:
+            os.remove(path)
+            freed += size
+        except OSError:
+            continue  # Already evicted by another session
+        try:
+            os.remove(path[:-len(".arrow")] + ".json")
+        except OSError:
+            pass  # Stored without a fingerprint
+    return freed
+
+
+# --- Incremental re-analysis ---
+# A weekly re-export of a chat repeats every message of the previous export and
+# appends new ones. Fingerprints let us find the stored analysis it extends, so
+# only the new tail has to be parsed and enriched.
+
+def record_hashes(df: pd.DataFrame) -> np.ndarray:
+    """One uint64 per message, hashed over (datetime, author, message)."""
+    return pd.util.hash_pandas_object(df[["datetime", "author", "message"]], index=False).to_numpy()
+
+
+def prefix_digest(hashes: np.ndarray, n_messages: int) -> str:
+    """Digest of the first `n_messages` record hashes, in order."""
+    return hashlib.sha256(hashes[:n_messages].tobytes()).hexdigest()
+
+
+def build_fingerprint(df: pd.DataFrame, upload_digest: str, raw_size: int,
+                      dialect: ChatDialect, model_identifiers) -> dict:
+    """Describes a stored analysis well enough to recognise exports that extend it."""
+    return {
+        "models": analysis_key("", model_identifiers),
+        "upload_digest": upload_digest,
+        "raw_size": raw_size,
+        "dialect": list(dialect) if dialect is not None else None,
+        "n_messages": len(df),
+        "records_digest": prefix_digest(record_hashes(df), len(df)),
+    }
+
+
+def list_fingerprints(model_identifiers, store_dir: str = ANALYSIS_STORE_DIR):
+    """Yields (key, fingerprint) for every stored analysis made with these models."""
+    models = analysis_key("", model_identifiers)
+    try:
+        names = os.listdir(store_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        key = name[:-len(".json")]
+        try:
+            with open(os.path.join(store_dir, name), encoding="utf-8") as fingerprint_file:
+                fingerprint = json.load(fingerprint_file)
+        except (OSError, ValueError):
+            continue
+        if fingerprint.get("models") == models and os.path.exists(analysis_path(key, store_dir)):
+            yield key, fingerprint
+
+
+def find_byte_prefix_match(file_obj, model_identifiers, store_dir: str = ANALYSIS_STORE_DIR):
+    """
+    Finds the longest stored upload whose raw bytes are a prefix of `file_obj`,
+    hashing the new upload once with a snapshot at each candidate length.
+    Returns (key, fingerprint) or None. The file position is restored.
+    """
+    position = file_obj.tell()
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    candidates = sorted(
+        (fingerprint["raw_size"], key, fingerprint)
+        for key, fingerprint in list_fingerprints(model_identifiers, store_dir)
+        if 0 < fingerprint.get("raw_size", 0) < size
+    )
+
+    best = None
+    digest = hashlib.sha256()
+    hashed = 0
+    file_obj.seek(0)
+    for raw_size, key, fingerprint in candidates:
+        while hashed < raw_size:
+            block = file_obj.read(min(HASH_BLOCK_SIZE, raw_size - hashed))
+            if not block:
+                break
+            digest.update(block)
+            hashed += len(block)
+        if hashed == raw_size and digest.copy().hexdigest() == fingerprint["upload_digest"]:
+            best = (key, fingerprint)
+    file_obj.seek(position)
+    return best
+
+
+def find_record_prefix_match(df: pd.DataFrame, model_identifiers, store_dir: str = ANALYSIS_STORE_DIR):
+    """
+    Finds the longest stored analysis whose messages are exactly the first
+    messages of `df`. Returns (key, fingerprint) or None.
+    """
+    hashes = None
+    best = None
+    for key, fingerprint in list_fingerprints(model_identifiers, store_dir):
+        n_messages = fingerprint.get("n_messages", 0)
+        if not 0 < n_messages <= len(df) or (best and best[1]["n_messages"] >= n_messages):
+            continue
+        if hashes is None:
+            hashes = record_hashes(df)
+        if prefix_digest(hashes, n_messages) == fingerprint["records_digest"]:
+            best = (key, fingerprint)
+    return best
+
+
+def merge_analyses(stored_df: pd.DataFrame, tail_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Appends newly enriched messages to a stored analysis. The result is ordered
+    exactly as if the whole export had been parsed in one go.
+    """
+    if tail_df.empty:
+        return stored_df
+    df = concat_chat_chunks([stored_df, tail_df])
+    # Stable sort keeps messages sent within the same minute in chat order
+    return df.sort_values(by="datetime", kind="stable").reset_index(drop=True)
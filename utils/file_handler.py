@@ -1,37 +1,68 @@
-import streamlit as st
-import zipfile 
-import io      
+import os
+import posixpath
+import zipfile
+from typing import NamedTuple
 
-def handle_uploaded_file(uploaded_file):
+
+class ChatFile(NamedTuple):
+    """
+    One chat export inside an upload: a binary stream of its .txt text. A
+    `streamed` file is decompressed as it is read and is read only once, front
+    to back (seeking it would decompress it again); others are seekable.
     """
-    Handles the uploaded file. For now, assumes .txt.
+    name: str
+    file: object
+    size: int
+    streamed: bool = False
+
+
+def is_chat_entry(info: zipfile.ZipInfo) -> bool:
+    """True for the chat .txt files of an archive; media and macOS metadata are skipped."""
+    base_name = posixpath.basename(info.filename)
+    return (
+        not info.is_dir()
+        and base_name.lower().endswith(".txt")
+        and not base_name.startswith("._")
+        and not info.filename.startswith("__MACOSX/")
+    )
+
+
+def iter_chat_files(uploaded_file, on_error=print):
+    """
+    Yields a ChatFile for every chat export in the upload: the upload itself for a
+    .txt, or each chat .txt of a .zip (e.g. WhatsApp's "export with media").
+    Archives are read in one pass through their directory. Each chat is
+    streamed out of the decompressor as it is read, never buffered whole, and
+    media entries are never opened. A yielded file is only valid until the next
+    one is requested.
+    `uploaded_file` is a Streamlit upload or any named, seekable binary file
+    (e.g. from open(path, "rb")); problems are reported through `on_error`.
     """
     if uploaded_file is None:
-        return None
-        
-    if uploaded_file.name.endswith(".txt"):
-        try:
-            return uploaded_file.getvalue().decode("utf-8")
-        except UnicodeDecodeError:
-            st.error("Error decoding .txt file. Please ensure it's UTF-8 encoded.")
-            return None
-        except Exception as e:
-            st.error(f"Error reading .txt file: {e}")
-            return None
-
-    elif uploaded_file.name.endswith(".zip"):
+        return
+
+    if uploaded_file.name.lower().endswith(".txt"):
+        size = getattr(uploaded_file, "size", None)
+        if size is None:
+            size = uploaded_file.seek(0, os.SEEK_END)
+        uploaded_file.seek(0)
+        yield ChatFile(uploaded_file.name, uploaded_file, size)
+
+    elif uploaded_file.name.lower().endswith(".zip"):
         try:
-            with zipfile.ZipFile(io.BytesIO(uploaded_file.getvalue()), 'r') as zip_ref:
-                txt_files = [f for f in zip_ref.namelist() if f.lower().endswith('.txt')]
-                if not txt_files:
-                    st.error("No .txt file found in the uploaded .zip archive.")
-                    return None
-                # Read the first .txt file found
-                with zip_ref.open(txt_files[0]) as txt_file:
-                    return txt_file.read().decode("utf-8")
-        except Exception as e:
-            st.error(f"Error processing .zip file: {e}")
-            return None
+            # ZipFile seeks within the upload buffer itself, so the archive isn't copied
+            zip_ref = zipfile.ZipFile(uploaded_file, 'r')
+        except (zipfile.BadZipFile, OSError) as e:
+            on_error(f"Error processing .zip file: {e}")
+            return
+
+        with zip_ref:
+            chat_entries = [info for info in zip_ref.infolist() if is_chat_entry(info)]
+            if not chat_entries:
+                on_error("No .txt file found in the uploaded .zip archive.")
+                return
+            for info in chat_entries:
+                with zip_ref.open(info) as txt_file:
+                    yield ChatFile(info.filename, txt_file, info.file_size, streamed=True)
     else:
-        st.error("Unsupported file type. Please upload a WhatsApp exported .txt file.")
-        return None
\ No newline at end of file
+        on_error("Unsupported file type. Please upload a WhatsApp exported .txt or .zip file.")
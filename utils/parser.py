@@ -1,6 +1,16 @@
+import codecs
+import itertools
+import mmap
+import os
 import re
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
 
 # Regex patterns to handle different WhatsApp export formats
 # Format 1: DD/MM/YY, HH:MM<U+202F>am/pm
@@ -37,193 +47,728 @@ REGEX_PAIRS = [
     (USER_MESSAGE_RE_24H, SYSTEM_MESSAGE_RE_24H),
 ]
 
-def parse_whatsapp_chat(chat_file_content: str) -> pd.DataFrame:
+# Every header regex above starts with the date; lines that don't are continuations
+# and can skip the regex cascade entirely.
+HEADER_PREFIX_RE = re.compile(r"^\d{1,2}/\d{1,2}/\d{2,4},")
+
+# Strict per-field patterns mirroring what strptime accepts for each directive.
+# Whitespace is matched with \s+ because that is how strptime treats the spaces
+# (and U+202F) in its formats.
+DATETIME_FIELD_PATTERNS = {
+    "%d": r"(?P<day>0?[1-9]|[12]\d|3[01])",
+    "%m": r"(?P<month>0?[1-9]|1[0-2])",
+    "%y": r"(?P<year>\d{2})",
+    "%Y": r"(?P<year>\d{4})",
+    "%I": r"(?P<hour>0?[1-9]|1[0-2])",
+    "%H": r"(?P<hour>[01]?\d|2[0-3])",
+    "%M": r"(?P<minute>[0-5]\d)",
+    "%p": r"(?P<ampm>am|pm|AM|PM)",
+}
+
+
+def datetime_pattern(date_format: str) -> str:
+    """Translates a strptime-style header format into a regex with named fields."""
+    pattern = re.sub(r"\s+", r"\\s+", re.escape(date_format).replace("\\ ", " "))
+    for directive, field_pattern in DATETIME_FIELD_PATTERNS.items():
+        pattern = pattern.replace(re.escape(directive), field_pattern)
+    return pattern
+
+
+@lru_cache(maxsize=None)
+def compile_dialect_res(date_format: str):
     """
-    Parses a WhatsApp chat export .txt file content.
-    Handles various date/time formats and system messages.
+    Compiles the strict regexes for one dialect: a bare timestamp matcher plus user
+    and system header matchers. The header tails are the same as in REGEX_PAIRS, so
+    any line these accept is split into the same fields the cascade would produce.
     """
-    lines = chat_file_content.strip().split('\n')
-    parsed_data = []
+    dt = f"(?P<dt>{datetime_pattern(date_format)})"
+    return (
+        re.compile(f"^{dt}$"),
+        re.compile(rf"^{dt}\s*-\s*(?P<author>.+?):\s*(?P<message>.*)"),
+        re.compile(rf"^{dt}\s*-\s*(?P<message>.*)"),
+    )
 
-    current_message_datetime_obj = None
-    current_message_author_str = None
-    current_message_text_parts = []
-    current_message_is_system_flag = False # True if parsed by a SYSTEM_MESSAGE_RE
 
-    def attempt_parse_datetime_str(date_str_val: str):
-        if not date_str_val:
-            return None
+# How many header lines are sampled to detect the export dialect, and how many
+# lines we are willing to buffer while looking for them.
+DIALECT_SAMPLE_HEADERS = 200
+DIALECT_SAMPLE_MAX_LINES = 5_000
 
-        date_str_val = date_str_val.strip()
-        # Pre-normalize am/pm for space-separated AM/PM
-        normalized_date_str = date_str_val
-        if " am" in date_str_val.lower():
-            normalized_date_str = re.sub(r"(?i)\s+am$", " AM", normalized_date_str)
-        elif " pm" in date_str_val.lower():
-            normalized_date_str = re.sub(r"(?i)\s+pm$", " PM", normalized_date_str)
-
-        # For narrow no-break space, ensure am/pm is lowercase as strptime expects for %p with U+202F
-        # The regexes capture 'am' or 'pm' literally for U+202F case
-        formats_to_try = [
-            # Formats with NARROW NO-BREAK SPACE (U+202F)
-            "%d/%m/%y, %I:%M\u202F%p",  # e.g., 02/05/25, 10:22 am
-            "%d/%m/%Y, %I:%M\u202F%p", # e.g., 02/05/2025, 10:22 am
-            "%m/%d/%y, %I:%M\u202F%p",
-            "%m/%d/%Y, %I:%M\u202F%p",
-
-            # Formats with regular space and AM/PM
-            "%d/%m/%y, %I:%M %p",    # e.g., 01/07/22, 9:00 AM
-            "%d/%m/%Y, %I:%M %p",
-            "%m/%d/%y, %I:%M %p",
-            "%m/%d/%Y, %I:%M %p",
-
-            # 24-hour formats
-            "%d/%m/%y, %H:%M",       # e.g., 23/06/21, 10:30
-            "%d/%m/%Y, %H:%M",
-            "%m/%d/%y, %H:%M",
-            "%m/%d/%Y, %H:%M",
-        ]
 
-        test_date_str = date_str_val # Use original for U+202F attempts
-
-        for fmt in formats_to_try:
-            current_test_str = normalized_date_str # Default to space-normalized
-            if "\u202F" in fmt:
-                current_test_str = test_date_str # Use original for U+202F
-
-            try:
-                if "\u202F%p" in fmt:
-                     # strptime expects 'am' or 'pm' (lowercase) for certain locales/setups with %p
-                     # If the regex captured AM/PM, we might need to convert to lowercase for these formats.
-                    temp_str = current_test_str.replace("\u202FAM", "\u202Fam").replace("\u202FPM", "\u202Fpm")
-                    return datetime.strptime(temp_str, fmt)
-
-                return datetime.strptime(current_test_str, fmt)
-            except ValueError:
-                # If U+202F format failed, try with opposite case for am/pm just in case
-                if "\u202F%p" in fmt:
-                    try:
-                        temp_str_upper = current_test_str.replace("\u202Fam", "\u202FAM").replace("\u202Fpm", "\u202FPM")
-                        return datetime.strptime(temp_str_upper, fmt)
-                    except ValueError:
-                        continue # Try next format
-                continue # Try next format
-        # print(f"Warning: Could not parse date: '{date_str_val}' with any format.")
-        return None
+class ChatDialect(NamedTuple):
+    """
+    The single export format used throughout a chat: which REGEX_PAIRS entry
+    matches its headers and which strptime format its timestamps follow. Its
+    user_re/system_re are strict versions of that pair which only accept
+    timestamps in `date_format`.
+    """
+    pair_index: int
+    date_format: str
+
+    @property
+    def datetime_re(self):
+        return compile_dialect_res(self.date_format)[0]
+
+    @property
+    def user_re(self):
+        return compile_dialect_res(self.date_format)[1]
+
+    @property
+    def system_re(self):
+        return compile_dialect_res(self.date_format)[2]
+
+    def accepts_match(self, match) -> bool:
+        """
+        Checks that a strict header match names a real calendar date. The regexes
+        already bound every field, so only days 29-31 need a lookup.
+        """
+        day = match.group("day")
+        return len(day) == 1 or day < "29" or self.datetime_fields(match) is not None
+
+    def datetime_fields(self, match):
+        """
+        Converts a datetime_re match into (year, month, day, hour, minute), or None
+        if the date doesn't exist in the calendar.
+        """
+        year = int(match.group("year"))
+        if len(match.group("year")) == 2:
+            year += 1900 if year >= 69 else 2000  # strptime's %y pivot
+        month, day = int(match.group("month")), int(match.group("day"))
+        hour = int(match.group("hour"))
+        ampm = match.groupdict().get("ampm")
+        if ampm is not None:
+            # %p maps 12am to 0 and 1pm-11pm to 13-23
+            hour = hour % 12 + (12 if ampm.lower() == "pm" else 0)
+        if not is_valid_date(year, month, day):
+            return None
+        return year, month, day, hour, int(match.group("minute"))
+
+    def parse_datetime(self, date_str_val: str):
+        """
+        Parses a header timestamp with this dialect's format only, falling back to
+        the full format cascade when it doesn't fit (e.g. a malformed line).
+        """
+        match = self.datetime_re.match(date_str_val)
+        fields = self.datetime_fields(match) if match else None
+        if fields is not None:
+            return datetime(*fields)
+        return attempt_parse_datetime_str(date_str_val)
+
+
+@lru_cache(maxsize=None)
+def is_valid_date(year: int, month: int, day: int) -> bool:
+    # Chats span a few thousand distinct days at most, so this cache stays tiny.
+    try:
+        datetime(year, month, day)
+        return True
+    except ValueError:
+        return False
+
+
+def match_message_header(line: str):
+    """
+    Runs the full REGEX_PAIRS cascade over one line.
+    Returns (dt_str, author_str, msg_str, is_system) or None if the line is not a header.
+    """
+    for user_re, system_re in REGEX_PAIRS:
+        user_match = user_re.match(line)
+        if user_match:
+            dt_str, author_str, msg_str = user_match.groups()
+            return dt_str, author_str, msg_str, False
 
-    def finalize_current_message():
-        nonlocal current_message_datetime_obj, current_message_author_str
-        nonlocal current_message_text_parts, current_message_is_system_flag
-
-        if current_message_text_parts and current_message_datetime_obj:
-            full_message = "\n".join(current_message_text_parts).strip()
-
-            # Strip "<This message was edited>" tag
-            edit_tag = "<This message was edited>"
-            if full_message.endswith(edit_tag):
-                full_message = full_message[:-len(edit_tag)].strip()
-
-            # Determine author: "System" if parsed by system regex or no author found
-            author_to_store = "System"
-            if not current_message_is_system_flag and current_message_author_str:
-                author_to_store = current_message_author_str
-
-            # Determine message type
-            message_type = "text"
-            lower_full_message = full_message.lower()
-
-            if lower_full_message == "<media omitted>" or \
-               lower_full_message == "image omitted" or \
-               lower_full_message == "video omitted" or \
-               lower_full_message == "sticker omitted" or \
-               lower_full_message == "audio omitted" or \
-               lower_full_message == "gif omitted":
-                message_type = "media"
-            elif "(file attached)" in lower_full_message:
-                message_type = "file"
-                # Example: "Walunj.vcf (file attached)" -> message can be "Walunj.vcf"
-            elif full_message == "This message was deleted" or \
-                 full_message == "You deleted this message": # Case sensitive as per WA
-                message_type = "deleted"
-
-            # Handle system messages that might still have user-like names (e.g., "User X created group")
-            # The `current_message_is_system_flag` helps identify these.
-            # If a line like "02/05/25, 10:22 am - User X created group" is parsed by SYSTEM_MESSAGE_RE,
-            # author_to_store will be "System" and full_message will be "User X created group".
-            # is_system_final checks if the author is "System" OR if it was flagged as system
-            is_system_final = (author_to_store == "System") or current_message_is_system_flag
-
-            parsed_data.append({
-                "datetime": current_message_datetime_obj,
-                "author": author_to_store,
-                "message": full_message,
-                "is_system": is_system_final,
-                "message_type": message_type
-            })
-
-        # Reset for the next message
-        current_message_text_parts = []
-        # current_message_datetime_obj, current_message_author_str, current_message_is_system_flag
-        # will be overwritten by the next new message line or remain for continuations.
-
-    for line_idx, line in enumerate(lines):
-        line = line.strip()
-        if not line:
-            continue
+        system_match = system_re.match(line)
+        if system_match:
+            dt_str, msg_str = system_match.groups()
+            # System messages don't have an explicit author field in this context
+            return dt_str, None, msg_str, True
+    return None
 
-        matched_new_message = False
-        dt_str, author_str, msg_str = None, None, None
 
-        for user_re, system_re in REGEX_PAIRS:
-            user_match = user_re.match(line)
-            if user_match:
-                dt_str, author_str, msg_str = user_match.groups()
-                current_message_is_system_flag = False
-                matched_new_message = True
+def detect_chat_dialect(lines) -> Optional[ChatDialect]:
+    """
+    Picks the export dialect from a sample of lines: the regex pair matching the
+    most headers, then the date order and year width of their timestamps.
+    DD/MM vs MM/DD is decided by which field ever exceeds 12; if the sample never
+    disambiguates, DD/MM wins, as it does in the format cascade.
+    Returns None if the sample contains no recognisable header.
+    """
+    pair_counts = [0] * len(REGEX_PAIRS)
+    dt_strs_by_pair = [[] for _ in REGEX_PAIRS]
+    for line in lines:
+        if not HEADER_PREFIX_RE.match(line):
+            continue
+        for pair_index, (user_re, system_re) in enumerate(REGEX_PAIRS):
+            match = user_re.match(line) or system_re.match(line)
+            if match:
+                pair_counts[pair_index] += 1
+                dt_strs_by_pair[pair_index].append(match.group(1))
                 break
 
-            system_match = system_re.match(line)
-            if system_match:
-                dt_str, msg_str = system_match.groups()
-                author_str = None # System messages don't have an explicit author field in this context
-                current_message_is_system_flag = True
-                matched_new_message = True
+    if not any(pair_counts):
+        return None
+    # max() keeps the first index on ties, matching the cascade's priority
+    pair_index = max(range(len(REGEX_PAIRS)), key=lambda i: pair_counts[i])
+
+    day_first_votes = month_first_votes = four_digit_years = 0
+    for dt_str in dt_strs_by_pair[pair_index]:
+        first, second, year = dt_str.split(",", 1)[0].split("/")
+        if int(first) > 12:
+            day_first_votes += 1
+        elif int(second) > 12:
+            month_first_votes += 1
+        if len(year) == 4:
+            four_digit_years += 1
+
+    date_part = "%m/%d" if month_first_votes > day_first_votes else "%d/%m"
+    year_part = "%Y" if four_digit_years * 2 > len(dt_strs_by_pair[pair_index]) else "%y"
+    time_part = ["%I:%M\u202F%p", "%I:%M %p", "%H:%M"][pair_index]
+    return ChatDialect(pair_index, f"{date_part}/{year_part}, {time_part}")
+
+
+def detect_export_dialect(source, encoding: str = "utf-8") -> Optional[ChatDialect]:
+    """Sniffs the dialect of an export from its head. File positions are restored."""
+    position = source.tell() if hasattr(source, "tell") else None
+    lines = iter_chat_lines(source, encoding=encoding)
+    dialect, _ = sniff_chat_dialect(lines)
+    lines.close()
+    if position is not None:
+        source.seek(position)
+    return dialect
+
+
+def sniff_chat_dialect(lines):
+    """
+    Buffers the head of a line iterator until DIALECT_SAMPLE_HEADERS headers have
+    been seen and detects the dialect from it.
+    Returns (dialect, lines) where `lines` replays the buffered head.
+    """
+    lines = iter(lines)
+    sample = []
+    header_count = 0
+    for line in lines:
+        sample.append(line)
+        if HEADER_PREFIX_RE.match(line):
+            header_count += 1
+        if header_count >= DIALECT_SAMPLE_HEADERS or len(sample) >= DIALECT_SAMPLE_MAX_LINES:
+            break
+    return detect_chat_dialect(sample), itertools.chain(sample, lines)
+
+MESSAGE_COLUMNS = ["datetime", "author", "message", "is_system", "message_type"]
+MESSAGE_TYPE_DTYPE = pd.CategoricalDtype(["text", "media", "file", "deleted"])
+
+# Streaming configuration: how many bytes are read from the export at a time and
+# how many messages are collected into each DataFrame chunk.
+READ_BLOCK_SIZE = 1 << 20  # 1 MiB
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Parallel parsing: number of worker processes (1 keeps parsing in-process) and the
+# smallest export worth sharding, since process start-up and result pickling cost
+# more than they save on small chats.
+PARSER_WORKERS = int(os.environ.get("CIP_PARSER_WORKERS", "1"))
+PARALLEL_MIN_BYTES = 8 << 20  # 8 MiB
+SHARDS_PER_WORKER = 2
+
+EDIT_TAG = "<This message was edited>"
+MEDIA_PLACEHOLDERS = {
+    "<media omitted>", "image omitted", "video omitted",
+    "sticker omitted", "audio omitted", "gif omitted",
+}
+
+
+def iter_source_blocks(source, block_size: int = READ_BLOCK_SIZE):
+    """Yields successive blocks of a str, bytes-like (incl. mmap) or file-like source without copying it whole."""
+    if isinstance(source, str):
+        for start in range(0, len(source), block_size):
+            yield source[start:start + block_size]
+    elif isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        with memoryview(source) as view:
+            for start in range(0, len(view), block_size):
+                yield bytes(view[start:start + block_size])
+    else:
+        while True:
+            block = source.read(block_size)
+            if not block:
                 break
+            yield block
+
+
+def iter_chat_lines(source, encoding: str = "utf-8", block_size: int = READ_BLOCK_SIZE):
+    """
+    Yields the stripped, non-empty lines of a chat export.
+    `source` may be a str, bytes-like object, or a text/binary file-like object.
+    It is read in blocks and decoded incrementally, so only one block and one
+    partial line are held in memory at any time.
+    """
+    decoder = None
+    remainder = ""
+    for block in iter_source_blocks(source, block_size):
+        if not isinstance(block, str):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(encoding)()
+            block = decoder.decode(block)
+
+        lines = (remainder + block).split('\n')
+        remainder = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
+
+    if decoder is not None:
+        remainder += decoder.decode(b"", final=True)
+    remainder = remainder.strip()
+    if remainder:
+        yield remainder
+
+
+def attempt_parse_datetime_str(date_str_val: str):
+    if not date_str_val:
+        return None
+
+    date_str_val = date_str_val.strip()
+    # Pre-normalize am/pm for space-separated AM/PM
+    normalized_date_str = date_str_val
+    if " am" in date_str_val.lower():
+        normalized_date_str = re.sub(r"(?i)\s+am$", " AM", normalized_date_str)
+    elif " pm" in date_str_val.lower():
+        normalized_date_str = re.sub(r"(?i)\s+pm$", " PM", normalized_date_str)
+
+    # For narrow no-break space, ensure am/pm is lowercase as strptime expects for %p with U+202F
+    # The regexes capture 'am' or 'pm' literally for U+202F case
+    formats_to_try = [
+        # Formats with NARROW NO-BREAK SPACE (U+202F)
+        "%d/%m/%y, %I:%M\u202F%p",  # e.g., 02/05/25, 10:22 am
+        "%d/%m/%Y, %I:%M\u202F%p", # e.g., 02/05/2025, 10:22 am
+        "%m/%d/%y, %I:%M\u202F%p",
+        "%m/%d/%Y, %I:%M\u202F%p",
+
+        # Formats with regular space and AM/PM
+        "%d/%m/%y, %I:%M %p",    # e.g., 01/07/22, 9:00 AM
+        "%d/%m/%Y, %I:%M %p",
+        "%m/%d/%y, %I:%M %p",
+        "%m/%d/%Y, %I:%M %p",
+
+        # 24-hour formats
+        "%d/%m/%y, %H:%M",       # e.g., 23/06/21, 10:30
+        "%d/%m/%Y, %H:%M",
+        "%m/%d/%y, %H:%M",
+        "%m/%d/%Y, %H:%M",
+    ]
+
+    test_date_str = date_str_val # Use original for U+202F attempts
+
+    for fmt in formats_to_try:
+        current_test_str = normalized_date_str # Default to space-normalized
+        if "\u202F" in fmt:
+            current_test_str = test_date_str # Use original for U+202F
+
+        try:
+            if "\u202F%p" in fmt:
+                 # strptime expects 'am' or 'pm' (lowercase) for certain locales/setups with %p
+                 # If the regex captured AM/PM, we might need to convert to lowercase for these formats.
+                temp_str = current_test_str.replace("\u202FAM", "\u202Fam").replace("\u202FPM", "\u202Fpm")
+                return datetime.strptime(temp_str, fmt)
+
+            return datetime.strptime(current_test_str, fmt)
+        except ValueError:
+            # If U+202F format failed, try with opposite case for am/pm just in case
+            if "\u202F%p" in fmt:
+                try:
+                    temp_str_upper = current_test_str.replace("\u202Fam", "\u202FAM").replace("\u202Fpm", "\u202FPM")
+                    return datetime.strptime(temp_str_upper, fmt)
+                except ValueError:
+                    continue # Try next format
+            continue # Try next format
+    # print(f"Warning: Could not parse date: '{date_str_val}' with any format.")
+    return None
+
+
+def classify_message(author_str, text_parts, is_system_flag):
+    """
+    Turns the collected header fields and text lines of one message into
+    (author, message, is_system, message_type).
+    """
+    full_message = "\n".join(text_parts).strip()
+
+    # Strip "<This message was edited>" tag
+    if full_message.endswith(EDIT_TAG):
+        full_message = full_message[:-len(EDIT_TAG)].strip()
+
+    # Determine author: "System" if parsed by system regex or no author found
+    author_to_store = "System"
+    if not is_system_flag and author_str:
+        author_to_store = author_str
 
-        if matched_new_message:
-            finalize_current_message() # Finalize any previous message being built
+    # Determine message type
+    message_type = "text"
+    lower_full_message = full_message.lower()
 
-            current_message_datetime_obj = attempt_parse_datetime_str(dt_str)
-            if current_message_datetime_obj is None:
+    if lower_full_message in MEDIA_PLACEHOLDERS:
+        message_type = "media"
+    elif "(file attached)" in lower_full_message:
+        message_type = "file"
+        # Example: "Walunj.vcf (file attached)" -> message can be "Walunj.vcf"
+    elif full_message == "This message was deleted" or \
+         full_message == "You deleted this message": # Case sensitive as per WA
+        message_type = "deleted"
+
+    # Handle system messages that might still have user-like names (e.g., "User X created group")
+    # If a line like "02/05/25, 10:22 am - User X created group" is parsed by SYSTEM_MESSAGE_RE,
+    # author_to_store will be "System" and full_message will be "User X created group".
+    # is_system_final checks if the author is "System" OR if it was flagged as system
+    is_system_final = (author_to_store == "System") or is_system_flag
+
+    return author_to_store, full_message, is_system_final, message_type
+
+
+def iter_raw_messages(lines, dialect: Optional[ChatDialect] = None):
+    """
+    The parser's state machine. Groups header and continuation lines into messages
+    and yields (dt_str, fallback_dt, author, message, is_system, message_type) per
+    message, in file order.
+    When the header timestamp fits `dialect`, only the raw `dt_str` is kept and
+    `fallback_dt` is None, leaving conversion to a vectorised pass; otherwise the
+    format cascade has already parsed it into `fallback_dt`.
+    """
+    if dialect is not None:
+        fast_user_match, fast_system_match = dialect.user_re.match, dialect.system_re.match
+    else:
+        fast_user_match = fast_system_match = lambda line: None
+
+    current_message_dt_str = None
+    current_message_fallback_dt = None
+    current_message_author_str = None
+    current_message_text_parts = []
+    current_message_is_system_flag = False # True if parsed by a SYSTEM_MESSAGE_RE
+
+    for line in lines:
+        header = fallback_dt = None
+        if HEADER_PREFIX_RE.match(line):
+            user_match = fast_user_match(line)
+            system_match = None if user_match else fast_system_match(line)
+            if user_match and dialect.accepts_match(user_match):
+                header = (*user_match.group("dt", "author", "message"), False)
+            elif system_match and dialect.accepts_match(system_match):
+                header = (system_match.group("dt"), None, system_match.group("message"), True)
+            else:
+                # Not in the sniffed dialect: use the full cascade for this line
+                header = match_message_header(line)
+                if header is not None:
+                    fallback_dt = attempt_parse_datetime_str(header[0])
+                    if fallback_dt is None:
+                        header = (None, *header[1:])
+
+        if header is not None:
+            dt_str, author_str, msg_str, line_is_system = header
+            # Finalize any previous message being built
+            if current_message_text_parts and current_message_dt_str:
+                yield (current_message_dt_str, current_message_fallback_dt, *classify_message(
+                    current_message_author_str, current_message_text_parts, current_message_is_system_flag
+                ))
+            current_message_text_parts = []
+            current_message_is_system_flag = line_is_system
+            current_message_dt_str = dt_str
+            current_message_fallback_dt = fallback_dt
+
+            if dt_str is None:
                 # Failed to parse date from a line that looked like a new message.
                 # This could be a malformed line or a multiline message part that resembles a header.
-                # If there's an ongoing message, append to it.
-                if current_message_text_parts: # Check if there's a previous message context
-                    current_message_text_parts.append(line)
-                # else:
-                    # print(f"Skipping line: Unparseable date and no previous message context: {line}")
                 continue # Move to the next line
 
             current_message_author_str = author_str.strip() if author_str else None
             current_message_text_parts.append(msg_str.strip())
 
-        elif current_message_datetime_obj: # If no new message match, but we have an active message (datetime set)
+        elif current_message_dt_str: # If no new message match, but we have an active message (datetime set)
             # This is a continuation of a multi-line message
             current_message_text_parts.append(line)
         # else:
             # This line is not a start of a new message and there's no active message context.
             # It could be a header/footer or an unparseable line at the beginning.
-            # print(f"Skipping unparseable initial line: {line}")
 
-    finalize_current_message() # Finalize the very last message in the file
+    # Finalize the very last message in the file
+    if current_message_text_parts and current_message_dt_str:
+        yield (current_message_dt_str, current_message_fallback_dt, *classify_message(
+            current_message_author_str, current_message_text_parts, current_message_is_system_flag
+        ))
+
+
+def iter_whatsapp_messages(source, encoding: str = "utf-8", dialect: Optional[ChatDialect] = None):
+    """
+    Streams message records (dicts keyed by MESSAGE_COLUMNS) out of a WhatsApp
+    chat export, in file order. Only the message currently being assembled is
+    kept in memory, so this works on exports of any size.
+    The export dialect is sniffed from the first headers unless one is given;
+    lines it doesn't cover fall back to the full REGEX_PAIRS cascade.
+    """
+    lines = iter_chat_lines(source, encoding=encoding)
+    if dialect is None:
+        dialect, lines = sniff_chat_dialect(lines)
+
+    for dt_str, fallback_dt, author, message, is_system, message_type in iter_raw_messages(lines, dialect):
+        yield {
+            "datetime": fallback_dt or dialect.parse_datetime(dt_str),
+            "author": author,
+            "message": message,
+            "is_system": is_system,
+            "message_type": message_type
+        }
+
+
+def build_chat_frame(dt_strs, fallback_dts, authors, messages, is_system, message_types,
+                     dialect: Optional[ChatDialect] = None) -> pd.DataFrame:
+    """
+    Assembles per-column lists from iter_raw_messages into a compact DataFrame.
+    Deferred timestamps are converted in one explicit-format pd.to_datetime call;
+    `author` and `message_type` become categoricals and `is_system` a bool array.
+    """
+    if dialect is not None:
+        deferred = pd.Series([None if dt is not None else s for s, dt in zip(dt_strs, fallback_dts)], dtype=object)
+        datetimes = pd.to_datetime(deferred, format=dialect.date_format, errors="coerce")
+    else:
+        datetimes = pd.Series(pd.NaT, index=range(len(dt_strs)), dtype="datetime64[us]")
+
+    # Rows the cascade already parsed, plus any the vectorised pass disagreed on
+    missing = datetimes.isna().to_numpy().nonzero()[0]
+    if len(missing):
+        datetimes.iloc[missing] = [
+            fallback_dts[i] or attempt_parse_datetime_str(dt_strs[i]) for i in missing
+        ]
+
+    return pd.DataFrame({
+        "datetime": datetimes,
+        "author": pd.Categorical(authors),
+        "message": messages,
+        "is_system": np.array(is_system, dtype=bool),
+        "message_type": pd.Categorical(message_types, dtype=MESSAGE_TYPE_DTYPE),
+    })
+
+
+def iter_whatsapp_chat_chunks(source, chunk_size: int = DEFAULT_CHUNK_SIZE, encoding: str = "utf-8",
+                              dialect: Optional[ChatDialect] = None):
+    """
+    Streams a WhatsApp chat export as DataFrame chunks of at most `chunk_size`
+    messages each, in file order. Peak memory is bounded by the chunk size,
+    not by the size of the export.
+    """
+    lines = iter_chat_lines(source, encoding=encoding)
+    if dialect is None:
+        dialect, lines = sniff_chat_dialect(lines)
+    return iter_chat_line_chunks(lines, dialect, chunk_size)
+
+
+def iter_chat_line_chunks(lines, dialect: Optional[ChatDialect], chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """iter_whatsapp_chat_chunks over already split lines, in a known dialect."""
+    columns = tuple([] for _ in range(6))
+    dt_strs, fallback_dts, authors, messages, is_system, message_types = columns
+    for dt_str, fallback_dt, author, message, system_flag, message_type in iter_raw_messages(lines, dialect):
+        dt_strs.append(dt_str)
+        fallback_dts.append(fallback_dt)
+        authors.append(author)
+        messages.append(message)
+        is_system.append(system_flag)
+        message_types.append(message_type)
+        if len(dt_strs) >= chunk_size:
+            yield build_chat_frame(*columns, dialect=dialect)
+            for column in columns:
+                column.clear()
+    if dt_strs:
+        yield build_chat_frame(*columns, dialect=dialect)
+
+
+def concat_chat_chunks(chunks) -> pd.DataFrame:
+    """
+    Concatenates parsed chunks in order, keeping the compact dtypes: author
+    categories are unioned rather than falling back to object.
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    df = pd.concat(chunks, ignore_index=True)
+    # Sorted categories make the result independent of how the chat was chunked
+    df["author"] = union_categoricals([chunk["author"] for chunk in chunks], sort_categories=True)
+    return df
+
+
+def is_message_header(line: str, dialect: Optional[ChatDialect] = None) -> bool:
+    """True if iter_raw_messages would start a new message at this (stripped) line."""
+    if not HEADER_PREFIX_RE.match(line):
+        return False
+    if dialect is not None:
+        match = dialect.user_re.match(line) or dialect.system_re.match(line)
+        if match and dialect.accepts_match(match):
+            return True
+    header = match_message_header(line)
+    return header is not None and attempt_parse_datetime_str(header[0]) is not None
+
+
+def find_shard_start(data, offset: int, dialect: Optional[ChatDialect] = None,
+                     encoding: str = "utf-8", window: int = 1 << 16) -> int:
+    """
+    Returns the byte offset of the first message header line starting at or after
+    `offset` (or len(data) if there is none). Splitting the export there keeps
+    every multi-line message, continuations included, inside one shard.
+    """
+    if offset <= 0:
+        return 0
+    with memoryview(data) as view:
+        # Move to the start of the next full line
+        while offset < len(view):
+            block = bytes(view[offset - 1:offset - 1 + window])
+            newline = block.find(b"\n")
+            if newline == -1:
+                offset += len(block) - 1
+                continue
+            offset += newline
+            break
+
+        while offset < len(view):
+            block = bytes(view[offset:offset + window])
+            newline = block.find(b"\n")
+            while newline == -1 and offset + len(block) < len(view):
+                # Line longer than the window: keep reading until it ends
+                block += bytes(view[offset + len(block):offset + len(block) + window])
+                newline = block.find(b"\n")
+            line = block if newline == -1 else block[:newline]
+            if is_message_header(line.decode(encoding, errors="replace").strip(), dialect):
+                return offset
+            offset += len(line) + 1
+        return len(view)
+
+
+def is_message_boundary(source, offset: int, dialect: Optional[ChatDialect] = None,
+                        encoding: str = "utf-8") -> bool:
+    """
+    True if byte `offset` of a seekable binary `source` is a clean split point:
+    it sits on a line break and the first non-empty line after it is a message
+    header, so nothing after it continues the message before it. The position
+    of `source` is restored.
+    """
+    position = source.tell()
+    try:
+        source.seek(max(offset - 1, 0))
+        head = source.read(READ_BLOCK_SIZE)
+    finally:
+        source.seek(position)
+    if offset > 0:
+        previous, head = head[:1], head[1:]
+        if previous != b"\n" and not head.startswith((b"\n", b"\r\n")):
+            return False
+    for line in iter_chat_lines(head, encoding=encoding):
+        return is_message_header(line, dialect)
+    return False
+
+
+def parse_chat_shard(shard, dialect: Optional[ChatDialect], encoding: str = "utf-8") -> pd.DataFrame:
+    """
+    Worker entry point for parallel parsing. `shard` is either the raw bytes of the
+    shard or a (path, start, end) byte range to read from disk.
+    Returns the shard's messages in file order (unsorted).
+    """
+    if isinstance(shard, tuple):
+        path, start, end = shard
+        with open(path, "rb") as chat_file:
+            chat_file.seek(start)
+            shard = chat_file.read(end - start)
+    chunks = list(iter_whatsapp_chat_chunks(shard, encoding=encoding, dialect=dialect))
+    if not chunks:
+        return pd.DataFrame(columns=MESSAGE_COLUMNS)
+    return concat_chat_chunks(chunks)
+
+
+def parse_whatsapp_chat_parallel(chat_file_content, workers: int = PARSER_WORKERS,
+                                 encoding: str = "utf-8") -> pd.DataFrame:
+    """
+    Parses an export on a pool of `workers` processes. The raw bytes are split into
+    ranges snapped to message header lines, each range is parsed independently with
+    the dialect sniffed from the head of the file, and the shards are concatenated
+    in order, giving the same DataFrame as the serial parser.
+    `chat_file_content` may be bytes, a str, a path (os.PathLike) or a binary
+    file-like object; paths are read by the workers themselves.
+    """
+    path = None
+    if isinstance(chat_file_content, os.PathLike):
+        path = os.fspath(chat_file_content)
+        with open(path, "rb") as chat_file:
+            data = mmap.mmap(chat_file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+    elif isinstance(chat_file_content, str):
+        data = chat_file_content.encode(encoding)
+    elif hasattr(chat_file_content, "getbuffer"):
+        data = chat_file_content.getbuffer()  # BytesIO / UploadedFile: no copy
+    elif hasattr(chat_file_content, "read"):
+        data = chat_file_content.read()
+    else:
+        data = chat_file_content
+
+    try:
+        if workers <= 1 or len(data) < PARALLEL_MIN_BYTES or codecs.lookup(encoding).name != "utf-8":
+            # Not worth sharding; byte-level line splitting is also only safe for UTF-8
+            return parse_whatsapp_chat(data, encoding=encoding, workers=1)
+
+        dialect = detect_export_dialect(data, encoding=encoding)
+
+        n_shards = workers * SHARDS_PER_WORKER
+        starts = sorted({find_shard_start(data, len(data) * i // n_shards, dialect, encoding) for i in range(n_shards)})
+        bounds = [(start, end) for start, end in zip(starts, starts[1:] + [len(data)]) if start < end]
+        if path is not None:
+            shards = [(path, start, end) for start, end in bounds]
+        else:
+            view = memoryview(data)
+            shards = [bytes(view[start:end]) for start, end in bounds]
+            view.release()
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(parse_chat_shard, shards, itertools.repeat(dialect), itertools.repeat(encoding)))
+
+    chunks = [result for result in results if not result.empty]
+    if not chunks:
+        return pd.DataFrame(columns=MESSAGE_COLUMNS)
+
+    df = concat_chat_chunks(chunks)
+    # Stable sort keeps messages sent within the same minute in chat order
+    df = df.sort_values(by="datetime", kind="stable").reset_index(drop=True)
+
+    return df
+
+
+def parse_whatsapp_chat_once(source, encoding: str = "utf-8"):
+    """
+    Parses an export that can only be read once, front to back, such as an entry
+    streamed out of a ZIP archive. The dialect is sniffed from the head in the
+    same pass, so returns (DataFrame, dialect). Always serial.
+    """
+    dialect, lines = sniff_chat_dialect(iter_chat_lines(source, encoding=encoding))
+    chunks = list(iter_chat_line_chunks(lines, dialect))
+    if not chunks:
+        return pd.DataFrame(columns=MESSAGE_COLUMNS), dialect
+    df = concat_chat_chunks(chunks)
+    # Stable sort keeps messages sent within the same minute in chat order
+    return df.sort_values(by="datetime", kind="stable").reset_index(drop=True), dialect
+
+
+def parse_whatsapp_chat(chat_file_content, encoding: str = "utf-8", workers: Optional[int] = None,
+                        dialect: Optional[ChatDialect] = None) -> pd.DataFrame:
+    """
+    Parses a WhatsApp chat export .txt file content.
+    Handles various date/time formats and system messages.
+    `chat_file_content` may be a str, bytes, or a file-like object (e.g. a
+    Streamlit UploadedFile), which is streamed rather than decoded up front.
+    With more than one worker (default: PARSER_WORKERS), large exports are parsed
+    in parallel by parse_whatsapp_chat_parallel. Passing `dialect` skips sniffing,
+    e.g. to parse the tail of an export with the dialect of its head.
+    """
+    workers = PARSER_WORKERS if workers is None else workers
+    if workers > 1 and dialect is None:
+        return parse_whatsapp_chat_parallel(chat_file_content, workers=workers, encoding=encoding)
+
+    chunks = list(iter_whatsapp_chat_chunks(chat_file_content, encoding=encoding, dialect=dialect))
+
+    if not chunks:
+        return pd.DataFrame(columns=MESSAGE_COLUMNS)
 
-    if not parsed_data:
-        return pd.DataFrame(columns=["datetime", "author", "message", "is_system", "message_type"])
+    df = concat_chat_chunks(chunks)
+    # Stable sort keeps messages sent within the same minute in chat order
+    df = df.sort_values(by="datetime", kind="stable").reset_index(drop=True)
 
-    df = pd.DataFrame(parsed_data)
-    if 'datetime' in df.columns and not df['datetime'].isnull().all():
-         df['datetime'] = pd.to_datetime(df['datetime']) # Ensure it's datetime type
-         df = df.sort_values(by="datetime").reset_index(drop=True)
-    
-    
     return df
@@ -0,0 +1,202 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Process-wide performance counters: where the time of an analysis goes. Parsing,
+# model loading, every NLP stage, every model server run, every chart builder and
+# every dashboard view is measured under a (kind, name) pair, e.g. ("stage",
+# "sentiment") or ("chart", "plot_hourly_activity"), with wall time, items (messages) processed, tokens and
+# batch sizes fed to the models, and the process's peak RSS. The Performance view
+# shows them; perf_json() and perf_prometheus() export them.
+
+PERF_ENABLED = os.environ.get("CIP_PERF", "on") == "on"  # "off" makes measure() a no-op
+PROMETHEUS_PREFIX = "cip_perf"
+
+
+def peak_rss_bytes():
+    """High-water mark of the process's resident memory, or None where the platform can't tell."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Bytes on macOS, KiB on Linux
+
+
+class Measurement:
+    """One measured call. Code inside `measure()` can add the items, tokens and batches it handled."""
+
+    def __init__(self, items: int = 0):
+        self.items = items
+        self.tokens = 0
+        self.batches = 0
+        self.batch_texts = 0
+        self.max_batch_texts = 0
+
+    def add_batch(self, n_texts: int, n_tokens: int) -> None:
+        self.tokens += n_tokens
+        self.batches += 1
+        self.batch_texts += n_texts
+        self.max_batch_texts = max(self.max_batch_texts, n_texts)
+
+
+_records = {}  # (kind, name) -> counters
+_records_lock = threading.Lock()
+_active = threading.local()  # Stack of the measurements running on this thread
+
+
+@contextmanager
+def measure(kind: str, name: str, items: int = 0):
+    """
+    Times the block and adds it to the (kind, name) counters. Yields the
+    Measurement, so the block can set `items` once it knows them.
+    """
+    if not PERF_ENABLED:
+        yield Measurement(items)
+        return
+    measurement = Measurement(items)
+    stack = _active.__dict__.setdefault("stack", [])
+    stack.append(measurement)
+    rss_before = peak_rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        rss_after = peak_rss_bytes()
+        record(kind, name, seconds, measurement, rss_after,
+               rss_after - rss_before if rss_after is not None else None)
+
+
+def record(kind: str, name: str, seconds: float, measurement: Measurement, peak_rss=None, rss_growth=None) -> None:
+    with _records_lock:
+        counters = _records.setdefault((kind, name), {
+            "calls": 0, "seconds": 0.0, "max_seconds": 0.0, "last_seconds": 0.0, "items": 0, "tokens": 0,
+            "batches": 0, "batch_texts": 0, "max_batch_texts": 0, "peak_rss_bytes": None, "rss_growth_bytes": 0,
+        })
+        counters["calls"] += 1
+        counters["seconds"] += seconds
+        counters["max_seconds"] = max(counters["max_seconds"], seconds)
+        counters["last_seconds"] = seconds
+        counters["items"] += measurement.items
+        counters["tokens"] += measurement.tokens
+        counters["batches"] += measurement.batches
+        counters["batch_texts"] += measurement.batch_texts
+        counters["max_batch_texts"] = max(counters["max_batch_texts"], measurement.max_batch_texts)
+        if peak_rss is not None:
+            counters["peak_rss_bytes"] = peak_rss
+            counters["rss_growth_bytes"] = max(counters["rss_growth_bytes"], rss_growth)
+
+
+def record_batch(n_texts: int, n_tokens: int) -> None:
+    """Counts a model batch towards the innermost measurement running on this thread, if any."""
+    stack = getattr(_active, "stack", None)
+    if stack:
+        stack[-1].add_batch(n_texts, n_tokens)
+
+
+class BatchLog:
+    """Stands in for a Measurement on the stack and keeps each batch as an (n_texts, n_tokens) pair."""
+
+    def __init__(self):
+        self.batches = []
+
+    def add_batch(self, n_texts: int, n_tokens: int) -> None:
+        self.batches.append((n_texts, n_tokens))
+
+
+@contextmanager
+def captured_batches():
+    """
+    Collects the batches record_batch sees on this thread in the block, without
+    recording them here; for worker processes, whose counters nobody reads, to
+    hand them back to the parent, which replays them with record_batch.
+    """
+    log = BatchLog()
+    stack = _active.__dict__.setdefault("stack", [])
+    stack.append(log)
+    try:
+        yield log
+    finally:
+        stack.pop()
+
+
+def timed(kind: str):
+    """Decorator measuring every call of a function under (kind, function name); items are len(first argument)."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            items = len(args[0]) if args and hasattr(args[0], "__len__") else 0
+            with measure(kind, func.__name__, items):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# --- Export ---
+def perf_records() -> list:
+    """The counters as one dict per (kind, name), with throughput and mean batch size derived."""
+    with _records_lock:
+        records = [{"kind": kind, "name": name, **counters} for (kind, name), counters in _records.items()]
+    for counters in records:
+        seconds = counters["seconds"]
+        counters["items_per_second"] = counters["items"] / seconds if seconds else None
+        counters["tokens_per_second"] = counters["tokens"] / seconds if seconds else None
+        counters["mean_batch_texts"] = counters["batch_texts"] / counters["batches"] if counters["batches"] else None
+    return records
+
+
+def perf_snapshot() -> dict:
+    return {"peak_rss_bytes": peak_rss_bytes(), "records": perf_records()}
+
+
+def perf_json() -> str:
+    return json.dumps(perf_snapshot(), indent=2)
+
+
+def prometheus_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+PROMETHEUS_METRICS = (
+    # (metric, record field, type, help)
+    ("calls_total", "calls", "counter", "Measured calls."),
+    ("seconds_total", "seconds", "counter", "Wall time spent, in seconds."),
+    ("max_seconds", "max_seconds", "gauge", "Slowest single call, in seconds."),
+    ("items_total", "items", "counter", "Messages (or rows) processed."),
+    ("tokens_total", "tokens", "counter", "Tokens fed to the models."),
+    ("batches_total", "batches", "counter", "Model batches run."),
+    ("batch_texts_total", "batch_texts", "counter", "Texts in all model batches."),
+    ("rss_growth_bytes", "rss_growth_bytes", "gauge", "Largest rise of the peak RSS during one call."),
+)
+
+
+def perf_prometheus() -> str:
+    """The counters in the Prometheus text exposition format."""
+    records = perf_records()
+    lines = []
+    for metric, field, metric_type, help_text in PROMETHEUS_METRICS:
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{metric} {metric_type}")
+        for counters in records:
+            labels = f'kind="{prometheus_label(counters["kind"])}",name="{prometheus_label(counters["name"])}"'
+            lines.append(f"{PROMETHEUS_PREFIX}_{metric}{{{labels}}} {counters[field]}")
+    peak = peak_rss_bytes()
+    if peak is not None:
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_peak_rss_bytes Peak resident memory of the process.")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_peak_rss_bytes gauge")
+        lines.append(f"{PROMETHEUS_PREFIX}_peak_rss_bytes {peak}")
+    return "\n".join(lines) + "\n"
+
+
+def reset_perf() -> None:
+    with _records_lock:
+        _records.clear()
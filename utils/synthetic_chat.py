@@ -0,0 +1,121 @@
+import random
+from datetime import datetime, timedelta
+
+# Deterministic generator of synthetic WhatsApp exports, used to benchmark the
+# parser and the NLP pipeline without real (private) chats.
+
+# The three export formats understood by utils.parser.REGEX_PAIRS
+CHAT_FORMATS = {
+    "nbsp_12h": "{d:02d}/{m:02d}/{y:02d}, {h12}:{mi:02d}\u202f{ampm}",  # 02/05/25, 10:22 am (U+202F)
+    "space_12h": "{m}/{d}/{y:02d}, {h12}:{mi:02d} {AMPM}",              # 5/2/25, 10:22 AM
+    "24h": "{d:02d}/{m:02d}/{Y}, {h:02d}:{mi:02d}",                    # 02/05/2025, 10:22
+}
+
+WORDS = (
+    "ok thanks yes no maybe tomorrow today meeting price battery update bug fix release "
+    "phone app group link photo video call later sure great awesome lol why how when where "
+    "please check this out done working broken again new old team project deadline weekend"
+).split()
+EMOJIS = ["😂", "👍", "🙏", "❤️", "🔥", "😅", "🎉", "😢"]
+MEDIA_MESSAGES = ["<Media omitted>", "image omitted", "video omitted", "sticker omitted", "audio omitted", "GIF omitted"]
+DELETED_MESSAGES = ["This message was deleted", "You deleted this message"]
+SYSTEM_TEMPLATES = [
+    "{a} added {b}",
+    "{a} left",
+    "{a} changed the group description",
+    "{a} changed this group's icon",
+    "{a} joined using this group's invite link",
+]
+
+
+def format_timestamp(moment: datetime, chat_format: str) -> str:
+    hour12 = moment.hour % 12 or 12
+    ampm = "am" if moment.hour < 12 else "pm"
+    return CHAT_FORMATS[chat_format].format(
+        d=moment.day, m=moment.month, y=moment.year % 100, Y=moment.year,
+        h=moment.hour, h12=hour12, mi=moment.minute, ampm=ampm, AMPM=ampm.upper(),
+    )
+
+
+def random_text(rng: random.Random, max_words: int = 25) -> str:
+    n_words = max(1, int(rng.expovariate(1 / 6)) % max_words)
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    if rng.random() < 0.3:
+        words.append(rng.choice(EMOJIS))
+    if rng.random() < 0.2:
+        words[0] = words[0].capitalize()
+    return " ".join(words)
+
+
+def iter_synthetic_chat_lines(n_lines: int, chat_format: str = "nbsp_12h", n_authors: int = 20, seed: int = 0,
+                              multiline_ratio: float = 0.05, system_ratio: float = 0.02,
+                              media_ratio: float = 0.08, deleted_ratio: float = 0.01, file_ratio: float = 0.01,
+                              edited_ratio: float = 0.02, start: datetime = datetime(2023, 1, 15, 9, 0)):
+    """
+    Yields exactly `n_lines` lines (without newlines) of a synthetic export in
+    one of CHAT_FORMATS. The same arguments always produce the same chat.
+    Multi-line messages contribute continuation lines, so the message count is
+    somewhat lower than the line count. The default start date has a day above 12
+    so that the DD/MM vs MM/DD order can be sniffed.
+    """
+    if chat_format not in CHAT_FORMATS:
+        raise ValueError(f"Unknown chat format '{chat_format}'. Choose from {sorted(CHAT_FORMATS)}.")
+
+    rng = random.Random(seed)
+    authors = [f"User {i:03d}" for i in range(n_authors)]
+    moment = start
+    emitted = 0
+
+    if n_lines > 0:
+        yield f"{format_timestamp(moment, chat_format)} - Messages and calls are end-to-end encrypted."
+        emitted += 1
+
+    while emitted < n_lines:
+        moment += timedelta(seconds=int(rng.expovariate(1 / 240)))
+        header = f"{format_timestamp(moment, chat_format)} - "
+        kind = rng.random()
+
+        if kind < system_ratio:
+            a, b = rng.sample(authors, 2) if n_authors > 1 else (authors[0], authors[0])
+            yield header + rng.choice(SYSTEM_TEMPLATES).format(a=a, b=b)
+            emitted += 1
+            continue
+
+        author = authors[min(int(rng.paretovariate(1.2)) - 1, n_authors - 1)]
+        kind -= system_ratio
+        if kind < media_ratio:
+            yield f"{header}{author}: {rng.choice(MEDIA_MESSAGES)}"
+            emitted += 1
+        elif kind < media_ratio + deleted_ratio:
+            yield f"{header}{author}: {rng.choice(DELETED_MESSAGES)}"
+            emitted += 1
+        elif kind < media_ratio + deleted_ratio + file_ratio:
+            yield f"{header}{author}: DOC-{rng.randint(1000, 9999)}.pdf (file attached)"
+            emitted += 1
+        elif kind < media_ratio + deleted_ratio + file_ratio + multiline_ratio:
+            n_continuations = min(rng.randint(1, 4), n_lines - emitted - 1)
+            yield f"{header}{author}: {random_text(rng)}"
+            emitted += 1
+            for _ in range(n_continuations):
+                yield random_text(rng)
+                emitted += 1
+        else:
+            text = random_text(rng)
+            if rng.random() < edited_ratio:
+                text += " <This message was edited>"
+            yield f"{header}{author}: {text}"
+            emitted += 1
+
+
+def generate_synthetic_chat(n_lines: int, **kwargs) -> str:
+    """Returns a synthetic export as one string (see iter_synthetic_chat_lines for options)."""
+    return "\n".join(iter_synthetic_chat_lines(n_lines, **kwargs)) + "\n"
+
+
+def write_synthetic_chat(path: str, n_lines: int, **kwargs) -> int:
+    """Streams a synthetic export to `path` without holding it in memory. Returns its size in bytes."""
+    size = 0
+    with open(path, "wb") as chat_file:
+        for line in iter_synthetic_chat_lines(n_lines, **kwargs):
+            size += chat_file.write((line + "\n").encode("utf-8"))
+    return size
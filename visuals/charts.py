@@ -4,8 +4,11 @@ import plotly.graph_objects as go
 from collections import Counter
 import networkx as nx
 
+from utils.perf import timed
+
 # --- Activity Charts ---
 
+@timed("chart")
 def plot_message_activity_timeline(df_display: pd.DataFrame):
     """Generates an interactive line chart for daily message activity using Plotly."""
     if 'datetime' not in df_display.columns or df_display['datetime'].isnull().all():
@@ -29,6 +32,7 @@ def plot_message_activity_timeline(df_display: pd.DataFrame):
     fig.update_layout(xaxis_title="Date", yaxis_title="Number of Messages")
     return fig
 
+@timed("chart")
 def plot_hourly_activity(df_display: pd.DataFrame):
     """Generates an interactive bar chart for hourly message activity using Plotly."""
     if 'datetime' not in df_display.columns or df_display['datetime'].isnull().all():
@@ -49,6 +53,7 @@ def plot_hourly_activity(df_display: pd.DataFrame):
 
 # --- Sentiment Charts ---
 
+@timed("chart")
 def plot_sentiment_distribution_pie(df_display: pd.DataFrame):
     """Generates an interactive pie chart for overall sentiment distribution using Plotly."""
     sentiment_counts = df_display[(df_display['sentiment_label'] != 'ERROR') & (df_display['message_type'] == 'text')]['sentiment_label'].value_counts()
@@ -58,9 +63,10 @@ def plot_sentiment_distribution_pie(df_display: pd.DataFrame):
         return fig
     return None
 
+@timed("chart")
 def plot_sentiment_per_author(df_display: pd.DataFrame):
     """Generates an interactive bar chart for sentiment distribution per author using Plotly."""
-    author_sentiment = df_display[(~df_display['is_system']) & (df_display['sentiment_label'] != 'ERROR') & (df_display['message_type'] == 'text')].groupby('author')['sentiment_label'].value_counts(normalize=True).mul(100).rename('percentage').round(1).reset_index()
+    author_sentiment = df_display[(~df_display['is_system']) & (df_display['sentiment_label'] != 'ERROR') & (df_display['message_type'] == 'text')].groupby('author', observed=True)['sentiment_label'].value_counts(normalize=True).mul(100).rename('percentage').round(1).reset_index()
     
     if not author_sentiment.empty:
         author_sentiment['author'] = author_sentiment['author'].astype(str)
@@ -71,9 +77,15 @@ def plot_sentiment_per_author(df_display: pd.DataFrame):
 
 # --- Author Stats ---
 
+def _author_message_counts(df_display: pd.DataFrame) -> pd.Series:
+    """Message counts per author, leaving out authors (categories) with no messages in the selection."""
+    counts = df_display['author'].value_counts()
+    return counts[counts > 0]
+
+@timed("chart")
 def plot_author_activity(df_display: pd.DataFrame, top_n=10):
     """Generates an interactive bar chart for top N most active authors using Plotly."""
-    author_msg_counts = df_display[~df_display['is_system']]['author'].value_counts().nlargest(top_n).reset_index()
+    author_msg_counts = _author_message_counts(df_display[~df_display['is_system']]).nlargest(top_n).reset_index()
     author_msg_counts.columns = ['Author', 'Message Count'] 
     
     if not author_msg_counts.empty:
@@ -83,9 +95,10 @@ def plot_author_activity(df_display: pd.DataFrame, top_n=10):
         return fig
     return None
 
+@timed("chart")
 def get_ranked_author_activity_df(df_display: pd.DataFrame, top_n=10):
     """Prepares a ranked DataFrame of most active authors."""
-    author_msg_counts = df_display[~df_display['is_system']]['author'].value_counts().reset_index()
+    author_msg_counts = _author_message_counts(df_display[~df_display['is_system']]).reset_index()
     author_msg_counts.columns = ['Author', 'Message Count']
     top_authors = author_msg_counts.head(top_n).copy()
     top_authors.insert(0, 'Rank', range(1, len(top_authors) + 1))
@@ -93,6 +106,7 @@ def get_ranked_author_activity_df(df_display: pd.DataFrame, top_n=10):
 
 # --- NEW: Named Entity Recognition (NER) Charts ---
 
+@timed("chart")
 def plot_frequent_named_entities(df_display: pd.DataFrame, top_n=20, entity_types=None):
     """Parses 'entities' and creates a bar chart for the most frequent named entities."""
     if 'entities' not in df_display.columns:
@@ -124,6 +138,7 @@ def plot_frequent_named_entities(df_display: pd.DataFrame, top_n=20, entity_type
     return fig
 
 
+@timed("chart")
 def create_interaction_network_graph(df_display: pd.DataFrame):
     """Creates an interactive network graph of user interactions."""
     user_df = df_display[~df_display['is_system']].copy()
@@ -137,7 +152,7 @@ def create_interaction_network_graph(df_display: pd.DataFrame):
     if interactions.empty:
         return None
 
-    interaction_counts = interactions.groupby(['previous_author', 'author']).size().reset_index(name='weight')
+    interaction_counts = interactions.groupby(['previous_author', 'author'], observed=True).size().reset_index(name='weight')
     G = nx.from_pandas_edgelist(interaction_counts, source='previous_author', target='author', edge_attr='weight', create_using=nx.DiGraph())
 
     if not G.nodes:
@@ -177,6 +192,7 @@ def create_interaction_network_graph(df_display: pd.DataFrame):
                     yaxis=dict(showgrid=False, zeroline=False, showticklabels=False)))
     return fig
 
+@timed("chart")
 def get_community_champions_df(df_display: pd.DataFrame, top_n=10):
     """
     Calculates a "Contribution Score" for each author and returns a ranked DataFrame.
@@ -191,11 +207,11 @@ def get_community_champions_df(df_display: pd.DataFrame, top_n=10):
         return pd.DataFrame()
 
     # 1. Calculate total messages per author
-    author_activity = user_df['author'].value_counts().reset_index()
+    author_activity = _author_message_counts(user_df).reset_index()
     author_activity.columns = ['Author', 'Message Count']
 
     # 2. Calculate positive sentiment ratio per author
-    sentiment_ratios = user_df[user_df['sentiment_label'] == 'POSITIVE'].groupby('author').size() / user_df.groupby('author').size()
+    sentiment_ratios = user_df[user_df['sentiment_label'] == 'POSITIVE'].groupby('author', observed=True).size() / user_df.groupby('author', observed=True).size()
     sentiment_ratios = sentiment_ratios.fillna(0).reset_index(name='Positive Ratio')
     sentiment_ratios.columns = ['Author', 'Positive Ratio (%)']
     sentiment_ratios['Positive Ratio (%)'] = (sentiment_ratios['Positive Ratio (%)'] * 100).round(1)
@@ -221,6 +237,7 @@ def get_community_champions_df(df_display: pd.DataFrame, top_n=10):
 
     return pd.DataFrame()
 
+@timed("chart")
 def get_topic_metrics(df_display: pd.DataFrame, topic: str):
     """
     Analyzes the DataFrame for a specific topic and calculates key metrics.
@@ -282,6 +299,7 @@ def get_topic_metrics(df_display: pd.DataFrame, topic: str):
 
     return metrics
 
+@timed("chart")
 def get_suggested_topics(df_display: pd.DataFrame, top_n=10):
     """
     Scans NER results to suggest potential brand/product topics to track.